@@ -0,0 +1,119 @@
+import random
+
+# Relative frequency of every kind of statement
+STATEMENT_MIX = {
+    "let": 5,
+    "print": 3,
+    "input": 1,
+    "if": 1,
+    "while": 1,
+}
+
+BINARY_OPERATORS = ["+", "-", "*", "/"]
+COMPARISON_OPERATORS = ["==", "!=", "<", "<=", ">", ">="]
+
+
+class ProgramGenerator:
+    """
+    Seeded generator of valid Tiny BASIC programs. Variables are only read once they have been
+    assigned, so every generated program compiles. The same seed and settings always generate
+    the same program.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        mix: dict[str, int] | None = None,
+        depth: int = 3,
+        expression_length: int = 4,
+        variables: int = 16,
+    ):
+        """
+        :param seed: Seed of the random choices
+        :param mix: Relative frequency of let, print, input, if and while statements
+        :param depth: Deepest nesting of IF and WHILE blocks
+        :param expression_length: Most operands in an expression
+        :param variables: Number of distinct variable names
+        """
+        self.random = random.Random(seed)
+        mix = mix if mix is not None else STATEMENT_MIX
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.depth = depth
+        self.expression_length = expression_length
+        self.names = [f"v{index}" for index in range(variables)]
+        self.defined = []
+
+    def generate(self, statements: int) -> str:
+        """
+        :param statements: Number of statements, counting the ones inside blocks and the blocks themselves
+        :return: Source of the program
+        """
+        lines = []
+        # Closing keyword and remaining statements of every open block
+        blocks = []
+        for _ in range(statements):
+            while blocks and blocks[-1][1] == 0:
+                lines.append(blocks.pop()[0])
+
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            if kind in ("if", "while") and len(blocks) >= self.depth:
+                kind = "let"
+            if blocks:
+                blocks[-1][1] -= 1
+
+            if kind == "let":
+                name = self.random.choice(self.names)
+                # The expression is parsed after the variable is defined, so it may read it
+                self.define(name)
+                lines.append(f"LET {name} = {self.expression()}")
+            elif kind == "print":
+                if self.random.random() < 0.2:
+                    lines.append(f'PRINT "line {len(lines)}"')
+                else:
+                    lines.append(f"PRINT {self.expression()}")
+            elif kind == "input":
+                name = self.random.choice(self.names)
+                self.define(name)
+                lines.append(f"INPUT {name}")
+            elif kind == "if":
+                lines.append(f"IF {self.comparison()} THEN")
+                blocks.append(["ENDIF", self.random.randint(1, 6)])
+            else:
+                lines.append(f"WHILE {self.comparison()} REPEAT")
+                blocks.append(["ENDWHILE", self.random.randint(1, 6)])
+
+        while blocks:
+            lines.append(blocks.pop()[0])
+        lines.append("")
+        return "\n".join(lines)
+
+    def define(self, name: str):
+        if name not in self.defined:
+            self.defined.append(name)
+
+    def operand(self) -> str:
+        if self.defined and self.random.random() < 0.6:
+            operand = self.random.choice(self.defined)
+        else:
+            operand = str(self.random.randint(0, 1000))
+        if self.random.random() < 0.1:
+            operand = "-" + operand
+        return operand
+
+    def expression(self) -> str:
+        parts = [self.operand()]
+        for _ in range(self.random.randint(0, self.expression_length - 1)):
+            parts.append(self.random.choice(BINARY_OPERATORS))
+            parts.append(self.operand())
+        return " ".join(parts)
+
+    def comparison(self) -> str:
+        return f"{self.expression()} {self.random.choice(COMPARISON_OPERATORS)} {self.expression()}"
+
+
+def generate(statements: int, seed: int = 0, **settings) -> str:
+    """
+    Generate a program, see ProgramGenerator for the settings.
+    """
+    return ProgramGenerator(seed, **settings).generate(statements)
@@ -0,0 +1,207 @@
+import gc
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tracemalloc
+
+from rustic.compiler.emit.emitter import Emitter
+from rustic.compiler.lex.lexer import Lexer
+from rustic.compiler.parse.parser import Parser
+
+from .generate import generate
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+SIZES = [1000, 4000, 16000]
+PHASES = ["lex", "parse", "emit"]
+# A phase fails once time grows faster with the size than in the baseline by this much. Linear
+# phases scale with an exponent near 1, a quadratic slowdown pushes it towards 2. Baselines that
+# happened to measure below 1 are compared as linear.
+EXPONENT_TOLERANCE = 0.25
+
+
+def run_phases(source: str) -> tuple[dict[str, float], str]:
+    """
+    Compile a source once, timing every phase on its own. The parser reads the already tokenized
+    stream so that its time does not include lexing.
+    :return: Seconds of every phase and the output
+    """
+    times = {}
+    start = time.perf_counter()
+    tokens = Lexer(source).tokenize()
+    times["lex"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parser = Parser(tokens.reader())
+    ast = parser.program()
+    times["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    output = Emitter(ast, parser.symbols).emit()
+    times["emit"] = time.perf_counter() - start
+    return times, output
+
+
+def peak_memory(source: str) -> dict[str, int]:
+    """
+    Peak bytes allocated by every phase, measured in a separate run because tracing slows it down.
+    """
+    peaks = {}
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        tokens = Lexer(source).tokenize()
+        peaks["lex"] = tracemalloc.get_traced_memory()[1] - before
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        parser = Parser(tokens.reader())
+        ast = parser.program()
+        peaks["parse"] = tracemalloc.get_traced_memory()[1] - before
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        Emitter(ast, parser.symbols).emit()
+        peaks["emit"] = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def scaling_exponent(sizes: list[int], seconds: list[float]) -> float:
+    """
+    Slope of the least squares line through log(seconds) over log(size), time grows as size ** slope.
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-9)) for value in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+def benchmark(sizes: list[int], seed: int = 0, repeat: int = 5, settings: dict | None = None) -> dict:
+    """
+    Time every phase on generated programs of every size, keeping the fastest of repeat runs.
+    :param sizes: Number of statements of the generated programs
+    :param settings: Generator settings, see ProgramGenerator
+    :return: Results that can be saved as a baseline
+    """
+    settings = settings or {}
+    phases = {phase: [] for phase in PHASES}
+    # Warm up caches and the allocator, so that the smallest size is not charged for it
+    run_phases(generate(sizes[0], seed, **settings))
+    for size in sizes:
+        source = generate(size, seed, **settings)
+        best = {phase: math.inf for phase in PHASES}
+        for _ in range(repeat):
+            # Garbage of the previous run is not charged to this one
+            gc.collect()
+            times, _ = run_phases(source)
+            for phase in PHASES:
+                best[phase] = min(best[phase], times[phase])
+        peaks = peak_memory(source)
+        for phase in PHASES:
+            phases[phase].append({
+                "size": size,
+                "bytes": len(source),
+                "seconds": best[phase],
+                "throughput": len(source) / best[phase],
+                "peak_memory": peaks[phase],
+            })
+
+    return {
+        "seed": seed,
+        "settings": settings,
+        "sizes": sizes,
+        "phases": {
+            phase: {
+                "exponent": scaling_exponent(sizes, [result["seconds"] for result in results]),
+                "results": results,
+            }
+            for phase, results in phases.items()
+        },
+    }
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """
+    :return: Phases that scale worse than in the baseline
+    """
+    failures = []
+    for phase, current in results["phases"].items():
+        expected = baseline["phases"].get(phase)
+        if expected is None:
+            continue
+        if current["exponent"] > max(expected["exponent"], 1.0) + EXPONENT_TOLERANCE:
+            failures.append(
+                f"{phase} scales as size^{current['exponent']:.2f}, the baseline as size^{expected['exponent']:.2f}"
+            )
+    return failures
+
+
+def report(results: dict, baseline: dict | None):
+    print(f"{'phase':<7}{'statements':>11}{'bytes':>10}{'ms':>10}{'MB/s':>8}{'peak KB':>10}{'vs baseline':>13}")
+    for phase, current in results["phases"].items():
+        expected = {}
+        if baseline is not None and phase in baseline["phases"]:
+            expected = {result["size"]: result for result in baseline["phases"][phase]["results"]}
+        for result in current["results"]:
+            relative = ""
+            if result["size"] in expected:
+                relative = f"{result['throughput'] / expected[result['size']]['throughput']:.2f}x"
+            print(
+                f"{phase:<7}{result['size']:>11}{result['bytes']:>10}{result['seconds'] * 1000:>10.1f}"
+                f"{result['throughput'] / 1e6:>8.2f}{result['peak_memory'] / 1024:>10.0f}{relative:>13}"
+            )
+        print(f"{phase:<7}scales as size^{current['exponent']:.2f}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Benchmark the phases of the compiler on generated programs")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Statements of the generated programs")
+    arg_parser.add_argument("--seed", type=int, default=0, help="Seed of the program generator")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Runs per size, the fastest is kept")
+    arg_parser.add_argument("--depth", type=int, default=3, help="Deepest nesting of blocks")
+    arg_parser.add_argument("--expression-length", type=int, default=4, help="Most operands in an expression")
+    arg_parser.add_argument("--variables", type=int, default=16, help="Number of distinct variables")
+    arg_parser.add_argument("--baseline", type=str, default=BASELINE, metavar="PATH", help="Baseline to compare with")
+    arg_parser.add_argument("--save", action="store_true", help="Store the results as the new baseline")
+    arg_parser.add_argument("--json", type=str, metavar="PATH", help="Also write the results to PATH")
+    args = arg_parser.parse_args(argv)
+
+    if len(args.sizes) < 2:
+        arg_parser.error("the scaling check needs at least two sizes")
+
+    settings = {"depth": args.depth, "expression_length": args.expression_length, "variables": args.variables}
+    results = benchmark(sorted(args.sizes), args.seed, args.repeat, settings)
+
+    baseline = None
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["seed"], baseline["settings"]) != (results["seed"], results["settings"]):
+            print("The baseline was recorded with another seed or settings, not comparing", file=sys.stderr)
+            baseline = None
+
+    report(results, baseline)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        return 0
+
+    failures = compare(results, baseline) if baseline is not None else []
+    for failure in failures:
+        print(f"FAIL   {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,12 @@
-from cli import cli
+import sys
 
 if __name__ == "__main__":
+    # Client mode skips argparse and the compiler imports, a running server does the work
+    if "--connect" in sys.argv:
+        from compiler.client import main
+
+        sys.exit(main(sys.argv[1:]))
+
+    from cli import cli
+
     cli()
@@ -1,45 +1,356 @@
 import sys
+import json
+import time
 import argparse
 
-from compiler.emit.emitter import Emitter
-from compiler.lex.lexer import Lexer
-from compiler.parse.parser import Parser
+from compiler.ast import serialize
+from compiler.batch import compile_batch, expand_inputs
+from compiler.cache import CompileCache, DiskCache, MemoryCache
+from compiler.client import run_client
+from compiler.diagnostics import MAX_ERRORS
+from compiler.driver import MMAP_THRESHOLD, CompileStats, Rustic, format_errors
+from compiler.watch import Watcher
+from compiler.lex.lexer import LexerError
+from compiler.parse.parser import SyntaxError
+from compiler.server import CompileServer
 
-
-class Rustic:
-    def compile(self, input: str) -> str:
-        lexer = Lexer(input)
-        parser = Parser(lexer)
-
-        ast = parser.program()
-
-        emitter = Emitter(ast)
-        return emitter.emit()
+# Default size limit of the compile cache in bytes
+CACHE_SIZE = 256 * 1024 * 1024
 
 
 def cli():
     arg_parser = argparse.ArgumentParser(
         description="Rustic: A Rusty Python Interpreter"
     )
-    arg_parser.add_argument("input", type=str, nargs="?", help="The file to interpret")
-    arg_parser.add_argument("output", type=str, nargs="?", help="The file to output to")
+    arg_parser.add_argument(
+        "input",
+        type=str,
+        nargs="*",
+        help="The file to interpret and optionally the file to output to. With --out-dir any number of files, directories and globs",
+    )
+    arg_parser.add_argument(
+        "--mmap-threshold",
+        type=int,
+        default=MMAP_THRESHOLD,
+        help="Memory-map input files of at least this many bytes and lex them as ASCII bytes",
+    )
+    arg_parser.add_argument(
+        "--lex-workers",
+        type=int,
+        default=1,
+        help="Lex large inputs in parallel with this many processes",
+    )
+    arg_parser.add_argument(
+        "--emit-ast",
+        type=str,
+        metavar="PATH",
+        help="Also write the parsed program to PATH in the binary AST format",
+    )
+    arg_parser.add_argument(
+        "--from-ast",
+        action="store_true",
+        help="The input is a binary AST written by --emit-ast instead of BASIC source",
+    )
+    arg_parser.add_argument(
+        "-O",
+        "--optimize",
+        action="store_true",
+        help="Optimize before emitting: fold and propagate constants, remove dead code and stores, "
+        "and compute repeated arithmetic once",
+    )
+    arg_parser.add_argument(
+        "--max-errors",
+        type=int,
+        default=MAX_ERRORS,
+        help="Report up to this many errors of a source that fails to compile",
+    )
+    arg_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Report the time of every phase, token and node counts, peak memory and output size on stderr",
+    )
+    arg_parser.add_argument(
+        "--stats-format",
+        choices=["text", "json"],
+        default="text",
+        help="Format of the --stats report",
+    )
+    arg_parser.add_argument(
+        "--out-dir",
+        type=str,
+        metavar="DIR",
+        help="Compile every input into DIR in batch mode",
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of processes to compile with in batch mode, defaults to the number of CPUs",
+    )
+    arg_parser.add_argument(
+        "--cache-dir",
+        type=str,
+        metavar="DIR",
+        help="Reuse outputs of unchanged sources from a compile cache in DIR",
+    )
+    arg_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE,
+        help="Evict the least recently used outputs once the cache grows past this many bytes",
+    )
+    arg_parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Empty the compile cache before compiling",
+    )
+
+    arg_parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep polling the inputs and compile the files that change into --out-dir",
+    )
+    arg_parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds between polls in watch mode",
+    )
+    arg_parser.add_argument(
+        "--index",
+        type=str,
+        metavar="PATH",
+        help="Where watch mode keeps its index of compiled files, defaults to a file in --out-dir",
+    )
+
+    arg_parser.add_argument(
+        "--serve",
+        type=str,
+        metavar="SOCKET",
+        help="Run a compile server on the Unix socket SOCKET, with -j compile threads",
+    )
+    arg_parser.add_argument(
+        "--connect",
+        type=str,
+        metavar="SOCKET",
+        help="Compile the input on the server listening on SOCKET",
+    )
 
     args = arg_parser.parse_args()
+    if args.max_errors < 1:
+        arg_parser.error("--max-errors must be at least 1")
+    if args.stats and (
+        args.out_dir is not None
+        or args.serve is not None
+        or args.connect is not None
+        or args.from_ast
+        or args.emit_ast is not None
+    ):
+        arg_parser.error("--stats only reports on compiling one source")
+
+    if args.clear_cache and args.cache_dir is not None:
+        DiskCache(args.cache_dir).clear()
+        if not args.input:
+            sys.exit(0)
+
+    if args.serve is not None:
+        sys.exit(serve(args))
 
-    if args.input is None:
+    if not args.input:
         arg_parser.print_help()
         sys.exit(1)
 
-    input_data = None
-    with open(args.input, "r") as f:
-        input_data = f.read()
+    if args.watch:
+        if args.out_dir is None:
+            arg_parser.error("--watch needs --out-dir")
+        sys.exit(watch(args))
 
-    compiler = Rustic()
-    result = compiler.compile(input_data)
+    if args.out_dir is not None:
+        sys.exit(batch(args))
 
-    if args.output is None:
-        print(result)
+    if len(args.input) > 2:
+        arg_parser.error("compiling more than one file needs --out-dir")
+    input, output = (args.input + [None])[:2]
+
+    if args.connect is not None:
+        sys.exit(run_client(args.connect, input, output))
+
+    cache = None
+    if args.cache_dir is not None:
+        cache = CompileCache(disk=DiskCache(args.cache_dir, args.cache_size))
+    compiler = Rustic(
+        lex_workers=args.lex_workers, mmap_threshold=args.mmap_threshold, cache=cache, optimize=args.optimize
+    )
+
+    if args.stats:
+        sys.exit(stats(compiler, args, input, output))
+
+    symbols = None
+    try:
+        if not args.from_ast and args.emit_ast is None:
+            if output is not None:
+                compiler.compile_file(input, output)
+            else:
+                # Compiling checks the cache before lexing or parsing anything
+                with compiler.read_source(input) as source:
+                    print(compiler.compile(source))
+            sys.exit(0)
+
+        if args.from_ast:
+            ast = serialize.load_arena(input)
+        else:
+            ast, symbols = compiler.parse_file(input)
+    except (SyntaxError, LexerError):
+        sys.exit(diagnose(compiler, input, args.max_errors))
+    except serialize.SerializationError as e:
+        sys.exit(f"{input}: {e}")
+
+    if args.emit_ast is not None:
+        serialize.save(ast, args.emit_ast)
+
+    if output is None:
+        print(compiler.emit(ast, symbols))
         sys.exit(0)
 
-    with open(args.output, "wt") as f:
-        f.write(result)
+    with open(output, "wt") as f:
+        compiler.emit_to(ast, f, symbols)
+
+
+def diagnose(compiler: Rustic, input: str, max_errors: int) -> str:
+    """
+    Find every error of a source that failed to compile.
+    :return: One line per error
+    """
+    return format_errors(input, compiler.check_file(input, max_errors), max_errors)
+
+
+def stats(compiler: Rustic, args, input: str, output: str | None) -> int:
+    """
+    Compile one source phase by phase and report the stats of the compile.
+    :return: Exit status
+    """
+    with compiler.read_source(input) as source:
+        result = compiler.compile_with_stats(source)
+    if not result.ok:
+        print(diagnose(compiler, input, args.max_errors), file=sys.stderr)
+        return 1
+
+    if output is None:
+        print(result.output)
+    else:
+        with open(output, "wt") as f:
+            f.write(result.output)
+
+    if args.stats_format == "json":
+        print(json.dumps(result.stats.to_dict()), file=sys.stderr)
+    else:
+        print(format_stats(result.stats), file=sys.stderr)
+    return 0
+
+
+def format_stats(stats: CompileStats) -> str:
+    lines = [f"{phase:<7}{seconds * 1000:>9.1f} ms" for phase, seconds in stats.times.items()]
+    lines.append(f"{'total':<7}{stats.total * 1000:>9.1f} ms")
+    lines.append(f"tokens {stats.tokens}")
+    nodes = sorted(stats.nodes.items(), key=lambda item: -item[1])
+    lines.append(f"nodes  {sum(stats.nodes.values())} (" + ", ".join(f"{name} {count}" for name, count in nodes) + ")")
+    if stats.peak_memory is not None:
+        lines.append(f"memory {stats.peak_memory / 1024:.0f} KB peak")
+    lines.append(f"size   {stats.input_size} bytes in, {stats.output_size} bytes out")
+    return "\n".join(lines)
+
+
+def batch(args) -> int:
+    """
+    Compile all inputs into the output directory and report every file.
+    :return: Exit status, 1 if any file failed
+    """
+    inputs = expand_inputs(args.input)
+    if not inputs:
+        print("No input files found", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    results = compile_batch(
+        inputs,
+        args.out_dir,
+        args.jobs,
+        args.mmap_threshold,
+        cache_dir=args.cache_dir,
+        cache_size=args.cache_size,
+        optimize=args.optimize,
+    )
+    failed = report(results, start)
+    return 1 if failed else 0
+
+
+def serve(args) -> int:
+    """
+    Run a compile server until it is asked to shut down or interrupted.
+    """
+    disk = DiskCache(args.cache_dir, args.cache_size) if args.cache_dir is not None else None
+    compiler = Rustic(
+        lex_workers=args.lex_workers,
+        mmap_threshold=args.mmap_threshold,
+        cache=CompileCache(MemoryCache(), disk),
+        optimize=args.optimize,
+    )
+    server = CompileServer(args.serve, compiler, args.jobs, args.max_errors)
+    print(f"Listening on {args.serve}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def watch(args) -> int:
+    """
+    Compile the inputs that change into the output directory until interrupted.
+    """
+    watcher = Watcher(
+        args.input,
+        args.out_dir,
+        args.index,
+        args.jobs,
+        args.mmap_threshold,
+        cache_dir=args.cache_dir,
+        cache_size=args.cache_size,
+        optimize=args.optimize,
+    )
+    print(f"Watching {watcher.root}")
+    try:
+        watcher.run(args.interval, report_changes)
+    except KeyboardInterrupt:
+        return 0
+
+
+def report_changes(results, removed: list[str], start: float):
+    for source in removed:
+        print(f"gone   {source}")
+    if results:
+        report(results, start)
+
+
+def report(results, start: float) -> int:
+    """
+    Print the result of every file and a summary.
+    :return: Number of files that failed
+    """
+    count = 0
+    failed = 0
+    cached = 0
+    for result in results:
+        count += 1
+        if result.ok:
+            cached += result.cached
+            status = "cached" if result.cached else "ok"
+            print(f"{status:<7}{result.input} -> {result.output} ({result.elapsed * 1000:.1f} ms)")
+        else:
+            failed += 1
+            print(f"FAIL   {result.error} ({result.elapsed * 1000:.1f} ms)")
+
+    elapsed = time.perf_counter() - start
+    print(f"{count - failed} compiled ({cached} from cache), {failed} failed in {elapsed:.2f} s")
+    return failed
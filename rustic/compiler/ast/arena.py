@@ -0,0 +1,297 @@
+from array import array
+
+from ..lex.lexer import TOKEN_TYPES, TYPE_CODES
+from .nodes import (
+    ASTNode,
+    BinaryOpNode,
+    ComparisonNode,
+    IfNode,
+    InputNode,
+    LetNode,
+    PrimaryNode,
+    PrintNode,
+    ProgramNode,
+    UnaryOpNode,
+    WhileNode,
+)
+
+# Node kinds and what the first, second and third columns hold for them
+PROGRAM = 0  # -, children start, children count
+PRINT = 1  # string value or -1, expression row or -1, -
+INPUT = 2  # variable value, -, -
+LET = 3  # variable value, expression row, -
+IF = 4  # condition row, children start, children count
+WHILE = 5  # condition row, children start, children count
+PRIMARY = 6  # value, -, -
+UNARY = 7  # operator code, operand row, -
+BINARY = 8  # left row, operator code, right row
+COMPARISON = 9  # left row, operator code, right row
+
+# Kinds whose rows are shared between identical subtrees
+SHARED_KINDS = frozenset((PRIMARY, UNARY, BINARY, COMPARISON))
+
+
+class Arena:
+    """
+    Flat representation of a ProgramNode. Every node is a row in parallel typed arrays holding its
+    kind and three integer columns, strings live once in a value table and the statement lists of
+    blocks are contiguous runs in the children array. Identical expression subtrees share one row.
+
+    The arena has a statements sequence like ProgramNode, materializing one top-level statement at a
+    time, so the Emitter and the analysis passes can walk it without converting the whole program.
+    """
+
+    __slots__ = ("kinds", "first", "second", "third", "values", "children", "root", "_value_ids", "_shared")
+
+    kinds: array
+    first: array
+    second: array
+    third: array
+    values: list[str]
+    children: array
+    root: int
+
+    def __init__(self):
+        self.kinds = array("B")
+        self.first = array("i")
+        self.second = array("i")
+        self.third = array("i")
+        self.values = []
+        self.children = array("i")
+        self.root = -1
+        self._value_ids = {}
+        self._shared = {}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def value_id(self, value: str) -> int:
+        """
+        Get the index of a string in the value table, adding it if needed.
+        """
+        index = self._value_ids.get(value)
+        if index is None:
+            index = self._value_ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def add(self, kind: int, first: int = -1, second: int = -1, third: int = -1) -> int:
+        """
+        Add a row, or return the existing row of an identical expression.
+        :return: Row index
+        """
+        if kind in SHARED_KINDS:
+            key = (kind, first, second, third)
+            row = self._shared.get(key)
+            if row is not None:
+                return row
+            self._shared[key] = len(self.kinds)
+
+        self.kinds.append(kind)
+        self.first.append(first)
+        self.second.append(second)
+        self.third.append(third)
+        return len(self.kinds) - 1
+
+    def add_children(self, rows: list[int]) -> int:
+        """
+        Store a list of rows as one contiguous run.
+        :return: Start of the run in the children array
+        """
+        start = len(self.children)
+        self.children.extend(rows)
+        return start
+
+    @classmethod
+    def from_program(cls, program: ProgramNode) -> "Arena":
+        """
+        Flatten a tree. Children are added before their parents with an explicit stack, so deeply
+        nested programs do not hit the recursion limit.
+        """
+        arena = cls()
+        rows = {}
+        stack = [(program, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in rows:
+                continue
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(child_nodes(node)))
+                continue
+            rows[id(node)] = arena.add_node(node, rows)
+
+        arena.root = rows[id(program)]
+        return arena
+
+    def add_node(self, node: ASTNode, rows: dict[int, int]) -> int:
+        """
+        Add a node whose children already have rows.
+        :param rows: Rows of the nodes added so far, by node id
+        """
+        node_type = type(node)
+        if node_type is PrimaryNode:
+            return self.add(PRIMARY, self.value_id(node.value))
+        elif node_type is BinaryOpNode or node_type is ComparisonNode:
+            kind = BINARY if node_type is BinaryOpNode else COMPARISON
+            return self.add(kind, rows[id(node.left)], TYPE_CODES[node.operator], rows[id(node.right)])
+        elif node_type is UnaryOpNode:
+            return self.add(UNARY, TYPE_CODES[node.operator], rows[id(node.operand)])
+        elif node_type is LetNode:
+            return self.add(LET, self.value_id(node.variable), rows[id(node.expression)])
+        elif node_type is PrintNode:
+            if isinstance(node.value, ASTNode):
+                return self.add(PRINT, -1, rows[id(node.value)])
+            return self.add(PRINT, self.value_id(node.value))
+        elif node_type is InputNode:
+            return self.add(INPUT, self.value_id(node.variable))
+        elif node_type is IfNode:
+            body = [rows[id(child)] for child in node.then_branch]
+            return self.add(IF, rows[id(node.condition)], self.add_children(body), len(body))
+        elif node_type is WhileNode:
+            body = [rows[id(child)] for child in node.body]
+            return self.add(WHILE, rows[id(node.condition)], self.add_children(body), len(body))
+        elif node_type is ProgramNode:
+            body = [rows[id(child)] for child in node.statements]
+            return self.add(PROGRAM, -1, self.add_children(body), len(body))
+
+        raise TypeError(f"Cannot store {node_type.__name__} in an arena")
+
+    def child_rows(self, row: int) -> array:
+        """
+        Statement rows of a program, IF or WHILE row.
+        """
+        start = self.second[row]
+        return self.children[start: start + self.third[row]]
+
+    def node(self, row: int) -> ASTNode:
+        """
+        Materialize the subtree of a row. Shared rows become shared nodes.
+        """
+        return self.materialize(row, {})
+
+    def materialize(self, row: int, nodes: dict[int, ASTNode]) -> ASTNode:
+        """
+        Materialize the subtree of a row with an explicit stack.
+        :param nodes: Nodes already built for rows, reused for shared rows
+        """
+        kinds = self.kinds
+        first = self.first
+        second = self.second
+        third = self.third
+        values = self.values
+
+        stack = [(row, False)]
+        while stack:
+            current, ready = stack.pop()
+            if current in nodes:
+                continue
+            kind = kinds[current]
+            if not ready:
+                stack.append((current, True))
+                if kind == BINARY or kind == COMPARISON:
+                    stack.append((third[current], False))
+                    stack.append((first[current], False))
+                elif kind == UNARY or kind == LET or kind == PRINT:
+                    if second[current] >= 0:
+                        stack.append((second[current], False))
+                elif kind == IF or kind == WHILE or kind == PROGRAM:
+                    stack.extend((child, False) for child in reversed(self.child_rows(current)))
+                    if kind != PROGRAM:
+                        stack.append((first[current], False))
+                continue
+
+            if kind == PRIMARY:
+                node = PrimaryNode(values[first[current]])
+            elif kind == BINARY:
+                node = BinaryOpNode(nodes[first[current]], TOKEN_TYPES[second[current]], nodes[third[current]])
+            elif kind == COMPARISON:
+                node = ComparisonNode(nodes[first[current]], TOKEN_TYPES[second[current]], nodes[third[current]])
+            elif kind == UNARY:
+                node = UnaryOpNode(TOKEN_TYPES[first[current]], nodes[second[current]])
+            elif kind == LET:
+                node = LetNode(values[first[current]], nodes[second[current]])
+            elif kind == PRINT:
+                node = PrintNode(nodes[second[current]] if second[current] >= 0 else values[first[current]])
+            elif kind == INPUT:
+                node = InputNode(values[first[current]])
+            elif kind == IF:
+                node = IfNode(nodes[first[current]], [nodes[child] for child in self.child_rows(current)])
+            elif kind == WHILE:
+                node = WhileNode(nodes[first[current]], [nodes[child] for child in self.child_rows(current)])
+            else:
+                node = ProgramNode([nodes[child] for child in self.child_rows(current)])
+            nodes[current] = node
+
+        return nodes[row]
+
+    @property
+    def statements(self) -> "ArenaStatements":
+        return ArenaStatements(self, self.child_rows(self.root))
+
+    def to_program(self) -> ProgramNode:
+        """
+        Materialize the whole program.
+        """
+        return self.node(self.root)
+
+    def __repr__(self):
+        return f"Arena({len(self)} rows, {len(self.values)} values)"
+
+
+class ArenaStatements:
+    """
+    The top-level statements of an arena, each one materialized when it is accessed.
+    """
+
+    __slots__ = ("arena", "rows")
+
+    def __init__(self, arena: Arena, rows: array):
+        self.arena = arena
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index: int) -> ASTNode:
+        return self.arena.node(self.rows[index])
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self.arena.node(row)
+
+
+def child_nodes(node: ASTNode) -> list[ASTNode]:
+    """
+    Direct children of a node, in source order.
+    """
+    node_type = type(node)
+    if node_type is BinaryOpNode or node_type is ComparisonNode:
+        return [node.left, node.right]
+    elif node_type is UnaryOpNode:
+        return [node.operand]
+    elif node_type is LetNode:
+        return [node.expression]
+    elif node_type is PrintNode:
+        return [node.value] if isinstance(node.value, ASTNode) else []
+    elif node_type is IfNode:
+        return [node.condition, *node.then_branch]
+    elif node_type is WhileNode:
+        return [node.condition, *node.body]
+    elif node_type is ProgramNode:
+        return node.statements
+    return []
+
+
+def count_nodes(node: ASTNode) -> dict[str, int]:
+    """
+    Number of nodes of every type in a tree, a shared leaf counts once for every place it is used.
+    """
+    counts = {}
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        name = type(node).__name__
+        counts[name] = counts.get(name, 0) + 1
+        stack.extend(child_nodes(node))
+    return counts
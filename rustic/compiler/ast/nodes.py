@@ -20,10 +20,12 @@ class Comparator(enum.Enum):
 
 
 class ASTNode:
-    pass
+    __slots__ = ()
 
 
 class PrintNode(ASTNode):
+    __slots__ = ("value",)
+
     def __init__(self, value: str | ASTNode):
         self.value = value
 
@@ -32,6 +34,8 @@ class PrintNode(ASTNode):
 
 
 class InputNode(ASTNode):
+    __slots__ = ("variable",)
+
     def __init__(self, variable):
         self.variable = variable
 
@@ -40,6 +44,8 @@ class InputNode(ASTNode):
 
 
 class LetNode(ASTNode):
+    __slots__ = ("variable", "expression")
+
     def __init__(self, variable: str, expression: ASTNode):
         self.variable = variable
         self.expression = expression
@@ -49,6 +55,8 @@ class LetNode(ASTNode):
 
 
 class IfNode(ASTNode):
+    __slots__ = ("condition", "then_branch")
+
     def __init__(self, condition: ASTNode, then_branch: list[ASTNode]):
         self.condition = condition
         self.then_branch = then_branch
@@ -57,7 +65,9 @@ class IfNode(ASTNode):
         return f"IfNode({self.condition}, {self.then_branch})"
 
 
-class ComparisonNode:
+class ComparisonNode(ASTNode):
+    __slots__ = ("left", "operator", "right")
+
     def __init__(self, left: ASTNode, operator: TokenType, right: ASTNode):
         self.left = left
         self.operator = operator
@@ -68,6 +78,8 @@ class ComparisonNode:
 
 
 class WhileNode(ASTNode):
+    __slots__ = ("condition", "body")
+
     def __init__(self, condition: ASTNode, body: list[ASTNode]):
         self.condition = condition
         self.body = body
@@ -77,6 +89,8 @@ class WhileNode(ASTNode):
 
 
 class PrimaryNode(ASTNode):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -85,6 +99,8 @@ class PrimaryNode(ASTNode):
 
 
 class UnaryOpNode(ASTNode):
+    __slots__ = ("operator", "operand")
+
     def __init__(self, operator, operand):
         self.operator = operator
         self.operand = operand
@@ -94,6 +110,8 @@ class UnaryOpNode(ASTNode):
 
 
 class BinaryOpNode(ASTNode):
+    __slots__ = ("left", "operator", "right")
+
     def __init__(self, left: ASTNode, operator, right: ASTNode):
         self.left = left
         self.operator = operator
@@ -104,6 +122,8 @@ class BinaryOpNode(ASTNode):
 
 
 class ProgramNode(ASTNode):
+    __slots__ = ("statements",)
+
     def __init__(self, statements: list[ASTNode]):
         self.statements = statements
 
@@ -0,0 +1,226 @@
+import struct
+import sys
+from array import array
+from typing import BinaryIO
+
+from ..lex.lexer import TYPE_CODES, TokenType
+from .arena import (
+    BINARY,
+    COMPARISON,
+    IF,
+    INPUT,
+    LET,
+    PRIMARY,
+    PRINT,
+    PROGRAM,
+    UNARY,
+    WHILE,
+    Arena,
+)
+from .nodes import ProgramNode
+
+MAGIC = b"RAST"
+# Bump whenever the arena layout, the node kinds or the order of TokenType changes, operators are
+# stored as positions in TOKEN_TYPES
+FORMAT_VERSION = 1
+
+EXPRESSION_KINDS = frozenset((PRIMARY, UNARY, BINARY, COMPARISON))
+STATEMENT_KINDS = frozenset((PRINT, INPUT, LET, IF, WHILE))
+
+# Operators the emitter accepts for every operator node kind, as positions in TOKEN_TYPES
+OPERATORS = {
+    BINARY: frozenset(TYPE_CODES[t] for t in (TokenType.PLUS, TokenType.MINUS, TokenType.ASTERISK, TokenType.SLASH)),
+    COMPARISON: frozenset(
+        TYPE_CODES[t]
+        for t in (
+            TokenType.EQ,
+            TokenType.EQEQ,
+            TokenType.NOTEQ,
+            TokenType.LT,
+            TokenType.LTEQ,
+            TokenType.GT,
+            TokenType.GTEQ,
+        )
+    ),
+    UNARY: frozenset(TYPE_CODES[t] for t in (TokenType.PLUS, TokenType.MINUS)),
+}
+
+# magic, version, row count, children count, value count, value bytes, root row
+HEADER = struct.Struct("<4sHIIIIi")
+
+
+class SerializationError(Exception):
+    pass
+
+
+def dumps(ast: ProgramNode | Arena) -> bytes:
+    """
+    Serialize a program into the binary AST format. The arena columns are written as raw
+    little-endian arrays, followed by the value table as lengths and one UTF-8 blob.
+    :param ast: Program tree or an arena holding one
+    :return: Serialized program
+    """
+    arena = ast if isinstance(ast, Arena) else Arena.from_program(ast)
+
+    encoded = [value.encode("utf-8") for value in arena.values]
+    lengths = array("I", [len(value) for value in encoded])
+    blob = b"".join(encoded)
+
+    columns = [arena.first, arena.second, arena.third, arena.children, lengths]
+    if sys.byteorder == "big":
+        columns = [array(column.typecode, column) for column in columns]
+        for column in columns:
+            column.byteswap()
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(arena), len(arena.children), len(arena.values), len(blob), arena.root)
+    return b"".join([header, arena.kinds.tobytes(), *(column.tobytes() for column in columns), blob])
+
+
+def loads_arena(data: bytes) -> Arena:
+    """
+    Read a serialized program into an arena, without building any nodes.
+    :param data: Serialized program
+    :return: Arena holding the program
+    """
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise SerializationError("Truncated AST header")
+    magic, version, rows, children, values, blob_size, root = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise SerializationError("Not a serialized AST")
+    if version != FORMAT_VERSION:
+        raise SerializationError(f"Unsupported AST format version {version}, expected {FORMAT_VERSION}")
+
+    arena = Arena()
+    offset = HEADER.size
+    try:
+        offset = read_column(view, offset, arena.kinds, rows)
+        offset = read_column(view, offset, arena.first, rows)
+        offset = read_column(view, offset, arena.second, rows)
+        offset = read_column(view, offset, arena.third, rows)
+        offset = read_column(view, offset, arena.children, children)
+        lengths = array("I")
+        offset = read_column(view, offset, lengths, values)
+    except ValueError as e:
+        raise SerializationError("Truncated AST data") from e
+
+    blob = bytes(view[offset: offset + blob_size])
+    if len(blob) != blob_size or sum(lengths) != blob_size:
+        raise SerializationError("Truncated AST values")
+    position = 0
+    try:
+        for length in lengths:
+            arena.values.append(blob[position: position + length].decode("utf-8"))
+            position += length
+    except UnicodeDecodeError as e:
+        raise SerializationError("Invalid AST value") from e
+
+    arena.root = root
+    validate(arena)
+    return arena
+
+
+def validate(arena: Arena):
+    """
+    Check that every row of a loaded arena refers to values, operators and earlier rows of the right
+    kind, the way Arena.from_program writes them. Damaged data would otherwise fail with an
+    IndexError or KeyError, or loop forever on a cycle, when the rows are materialized.
+    """
+    kinds = arena.kinds
+    first = arena.first
+    second = arena.second
+    third = arena.third
+    children = arena.children
+    value_count = len(arena.values)
+
+    def check(row: int, reference: int, allowed: frozenset):
+        if not 0 <= reference < row or kinds[reference] not in allowed:
+            raise SerializationError(f"Invalid reference to row {reference} in row {row}")
+
+    def check_value(row: int, value: int):
+        if not 0 <= value < value_count:
+            raise SerializationError(f"Invalid value {value} in row {row}")
+
+    def check_operator(row: int, operator: int, kind: int):
+        if operator not in OPERATORS[kind]:
+            raise SerializationError(f"Invalid operator {operator} in row {row}")
+
+    for row, kind in enumerate(kinds):
+        if kind == PRIMARY or kind == INPUT:
+            check_value(row, first[row])
+        elif kind == BINARY or kind == COMPARISON:
+            check(row, first[row], EXPRESSION_KINDS)
+            check_operator(row, second[row], kind)
+            check(row, third[row], EXPRESSION_KINDS)
+        elif kind == UNARY:
+            check_operator(row, first[row], kind)
+            check(row, second[row], EXPRESSION_KINDS)
+        elif kind == LET:
+            check_value(row, first[row])
+            check(row, second[row], EXPRESSION_KINDS)
+        elif kind == PRINT:
+            if second[row] >= 0:
+                check(row, second[row], EXPRESSION_KINDS)
+            else:
+                check_value(row, first[row])
+        elif kind == IF or kind == WHILE or kind == PROGRAM:
+            if kind != PROGRAM:
+                check(row, first[row], EXPRESSION_KINDS)
+            start, count = second[row], third[row]
+            if start < 0 or count < 0 or start + count > len(children):
+                raise SerializationError(f"Invalid statements of row {row}")
+            for child in children[start: start + count]:
+                check(row, child, STATEMENT_KINDS)
+        else:
+            raise SerializationError(f"Invalid node kind {kind} in row {row}")
+
+    if not 0 <= arena.root < len(kinds) or kinds[arena.root] != PROGRAM:
+        raise SerializationError(f"Invalid root row {arena.root}")
+
+
+def read_column(view: memoryview, offset: int, column: array, count: int) -> int:
+    size = count * column.itemsize
+    if offset + size > len(view):
+        raise ValueError("Column extends past the end of the data")
+    column.frombytes(view[offset: offset + size])
+    if sys.byteorder == "big" and column.itemsize > 1:
+        column.byteswap()
+    return offset + size
+
+
+def loads(data: bytes) -> ProgramNode:
+    """
+    Deserialize a program.
+    :param data: Serialized program
+    :return: Program tree, identical to the one that was serialized
+    """
+    return loads_arena(data).to_program()
+
+
+def save(ast: ProgramNode | Arena, file: str | BinaryIO):
+    """
+    Write a serialized program to a path or a binary file object.
+    """
+    data = dumps(ast)
+    if isinstance(file, str):
+        with open(file, "wb") as f:
+            f.write(data)
+    else:
+        file.write(data)
+
+
+def load_arena(file: str | BinaryIO) -> Arena:
+    """
+    Read a serialized program from a path or a binary file object into an arena.
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            return loads_arena(f.read())
+    return loads_arena(file.read())
+
+
+def load(file: str | BinaryIO) -> ProgramNode:
+    """
+    Read a serialized program from a path or a binary file object.
+    """
+    return load_arena(file).to_program()
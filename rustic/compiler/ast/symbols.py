@@ -0,0 +1,81 @@
+import sys
+
+from ..lex.lexer import TokenType
+
+
+class Symbol:
+    """
+    A variable of the program. The id is the index of the symbol in its table, kind and position
+    describe the statement that first defined it. Later passes can keep their own per-symbol
+    information in data.
+    """
+
+    __slots__ = ("name", "id", "kind", "position", "data")
+
+    name: str
+    id: int
+    kind: TokenType | None
+    position: int
+
+    def __init__(self, name: str, id: int, kind: TokenType | None = None, position: int = -1):
+        self.name = name
+        self.id = id
+        self.kind = kind
+        self.position = position
+        self.data = None
+
+    def __repr__(self):
+        return f"Symbol({self.name}, {self.id}, {self.kind}, {self.position})"
+
+
+class SymbolTable:
+    """
+    Interned variable names with integer ids, in order of first definition.
+    """
+
+    __slots__ = ("symbols", "ids")
+
+    symbols: list[Symbol]
+    ids: dict[str, int]
+
+    def __init__(self):
+        self.symbols = []
+        self.ids = {}
+
+    def define(self, name: str, kind: TokenType | None = None, position: int = -1) -> Symbol:
+        """
+        Get the symbol of a name, creating it if this is its first definition.
+        :param name: Variable name
+        :param kind: Statement type of the definition, LET or INPUT
+        :param position: Source offset of the definition
+        :return: The symbol of the name
+        """
+        id = self.ids.get(name)
+        if id is not None:
+            return self.symbols[id]
+
+        symbol = Symbol(sys.intern(name), len(self.symbols), kind, position)
+        self.ids[symbol.name] = symbol.id
+        self.symbols.append(symbol)
+        return symbol
+
+    def lookup(self, name: str) -> Symbol | None:
+        id = self.ids.get(name)
+        if id is None:
+            return None
+        return self.symbols[id]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def __getitem__(self, id: int) -> Symbol:
+        return self.symbols[id]
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __repr__(self):
+        return f"SymbolTable({[symbol.name for symbol in self.symbols]})"
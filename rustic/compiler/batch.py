@@ -0,0 +1,173 @@
+import glob
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterator
+
+from .cache import CompileCache, DiskCache
+from .driver import MMAP_THRESHOLD, Rustic
+from .lex.lexer import LexerError
+from .parse.parser import SyntaxError
+
+# Extension of Tiny BASIC sources picked up from directories
+SOURCE_EXTENSION = ".bs"
+OUTPUT_EXTENSION = ".rs"
+
+
+class FileResult:
+    """
+    Outcome of compiling one file in a batch. The error is None when the file compiled.
+    """
+
+    __slots__ = ("input", "output", "error", "elapsed", "cached")
+
+    input: str
+    output: str
+    error: str | None
+    elapsed: float
+    cached: bool
+
+    def __init__(self, input: str, output: str, error: str | None, elapsed: float, cached: bool = False):
+        self.input = input
+        self.output = output
+        self.error = error
+        self.elapsed = elapsed
+        self.cached = cached
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return f"FileResult({self.input}, {self.output}, {self.error}, {self.elapsed})"
+
+
+def expand_inputs(patterns: list[str]) -> list[str]:
+    """
+    Expand command line inputs into source files. Directories are searched recursively for
+    Tiny BASIC sources and anything else that is not an existing file is treated as a glob.
+    :param patterns: Files, directories and glob patterns
+    :return: Source files in the order they were given, without duplicates
+    """
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found = sorted(glob.glob(os.path.join(glob.escape(pattern), "**", "*" + SOURCE_EXTENSION), recursive=True))
+        elif os.path.exists(pattern):
+            found = [pattern]
+        else:
+            found = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        files.extend(found)
+
+    return list(dict.fromkeys(files))
+
+
+def output_paths(inputs: list[str], out_dir: str, root: str | None = None) -> list[str]:
+    """
+    Map sources to outputs in out_dir. The directory layout below root is kept, so sources with the
+    same name in different directories do not overwrite each other.
+    :param root: Directory the layout is taken from, defaults to the common parent of the sources
+    """
+    if not inputs:
+        return []
+    if root is None:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(input)) for input in inputs])
+    else:
+        root = os.path.abspath(root)
+    outputs = []
+    for input in inputs:
+        relative = os.path.relpath(os.path.abspath(input), root)
+        outputs.append(os.path.join(out_dir, os.path.splitext(relative)[0] + OUTPUT_EXTENSION))
+    return outputs
+
+
+# Disk caches of this process by directory and size, so that a worker only scans a cache once
+worker_caches = {}
+
+
+def compile_one(
+    input: str,
+    output: str,
+    mmap_threshold: int = MMAP_THRESHOLD,
+    cache_dir: str | None = None,
+    cache_size: int | None = None,
+    optimize: bool = False,
+) -> FileResult:
+    """
+    Compile one file of a batch. Errors are returned in the result instead of raised, so a bad file
+    does not stop the rest of the batch.
+    """
+    cache = None
+    if cache_dir is not None:
+        cache = worker_caches.get((cache_dir, cache_size))
+        if cache is None:
+            disk = DiskCache(cache_dir) if cache_size is None else DiskCache(cache_dir, cache_size)
+            cache = worker_caches[cache_dir, cache_size] = CompileCache(disk=disk)
+        hits = cache.stats.hits
+
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        Rustic(mmap_threshold=mmap_threshold, cache=cache, optimize=optimize).compile_file(input, output)
+    except SyntaxError as e:
+        error = f"{input}:{e.line}:{e.column}: Syntax error. {e}"
+    except LexerError as e:
+        error = f"{input}:{e.line}:{e.column}: Lexing error. {e.message}"
+    except (OSError, UnicodeDecodeError) as e:
+        error = f"{input}: {e}"
+    except Exception as e:
+        # Anything else is a failure of this file too, e.g. an emitter error or a too deep program
+        error = f"{input}: {type(e).__name__}: {e}"
+    else:
+        error = None
+    cached = cache is not None and cache.stats.hits > hits
+    return FileResult(input, output, error, time.perf_counter() - start, cached)
+
+
+def compile_batch(
+    inputs: list[str],
+    out_dir: str,
+    workers: int | None = None,
+    mmap_threshold: int = MMAP_THRESHOLD,
+    executor: Executor | None = None,
+    cache_dir: str | None = None,
+    cache_size: int | None = None,
+    outputs: list[str] | None = None,
+    optimize: bool = False,
+) -> Iterator[FileResult]:
+    """
+    Compile many sources into out_dir, in parallel across a pool of processes.
+    :param inputs: Source files
+    :param out_dir: Directory the Rust files are written to
+    :param workers: Number of processes, defaults to the number of CPUs. With one the files are compiled
+        in this process.
+    :param mmap_threshold: Source files of at least this many bytes are memory-mapped
+    :param executor: Executor to use instead of creating a process pool
+    :param cache_dir: Directory of a disk cache shared by the workers, files are always compiled without one
+    :param cache_size: Size in bytes the disk cache is kept under
+    :param outputs: Output of every source, by default the sources are mapped into out_dir with output_paths()
+    :param optimize: Run the optimization passes
+    :return: Result of every file, in the order of inputs
+    """
+    if outputs is None:
+        outputs = output_paths(inputs, out_dir)
+    options = (
+        [mmap_threshold] * len(inputs),
+        [cache_dir] * len(inputs),
+        [cache_size] * len(inputs),
+        [optimize] * len(inputs),
+    )
+
+    if executor is None and (workers == 1 or len(inputs) <= 1):
+        yield from map(compile_one, inputs, outputs, *options)
+        return
+
+    if executor is not None:
+        yield from executor.map(compile_one, inputs, outputs, *options)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    # Hand files out in chunks so that thousands of small files do not cost a round trip each
+    chunksize = max(1, len(inputs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(compile_one, inputs, outputs, *options, chunksize=chunksize)
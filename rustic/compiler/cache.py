@@ -0,0 +1,252 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Bump whenever the emitted Rust for the same source changes, so that cached outputs of older
+# compilers are never reused
+COMPILER_VERSION = 1
+
+CACHE_EXTENSION = ".rs"
+
+
+def cache_key(source: str | bytes, options: dict | None = None) -> str:
+    """
+    Content address of a compilation.
+    :param source: Tiny BASIC source, str sources are hashed as UTF-8
+    :param options: Compiler options that change the output
+    :return: Hex SHA-256 of the compiler version, the options and the source
+    """
+    digest = hashlib.sha256()
+    digest.update(f"rustic {COMPILER_VERSION}\n".encode("ascii"))
+    for name, value in sorted((options or {}).items()):
+        digest.update(f"{name}={value!r}\n".encode("utf-8"))
+    digest.update(b"\n")
+    digest.update(source.encode("utf-8") if isinstance(source, str) else source)
+    return digest.hexdigest()
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses", "memory_hits", "disk_hits", "stores", "evictions")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return (
+            f"CacheStats(hits={self.hits}, misses={self.misses}, memory_hits={self.memory_hits}, "
+            f"disk_hits={self.disk_hits}, stores={self.stores}, evictions={self.evictions})"
+        )
+
+
+class MemoryCache:
+    """
+    Least recently used outputs, bounded by entry count and total size in characters.
+    """
+
+    def __init__(self, max_entries: int = 256, max_size: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> str | None:
+        output = self.entries.get(key)
+        if output is not None:
+            self.entries.move_to_end(key)
+        return output
+
+    def put(self, key: str, output: str):
+        if len(output) > self.max_size:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.entries[key] = output
+        self.size += len(output)
+        while len(self.entries) > self.max_entries or self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def remove(self, key: str):
+        output = self.entries.pop(key, None)
+        if output is not None:
+            self.size -= len(output)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class DiskCache:
+    """
+    Outputs stored as files named by their key. Reading an entry touches its modification time and
+    the least recently used entries are removed once the directory grows past max_size bytes.
+    Several processes can share a directory, each keeps its own estimate of the total size.
+    """
+
+    def __init__(self, directory: str, max_size: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        # Total size of the entries, only scanned once something is stored
+        self.size = None
+        self.evictions = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + CACHE_EXTENSION)
+
+    def get(self, key: str) -> str | None:
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                output = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return output
+
+    def put(self, key: str, output: str):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a unique name and renamed, so readers never see a partial entry
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8", newline="") as f:
+            f.write(output)
+        os.replace(temporary, path)
+
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.scan())
+        else:
+            self.size += os.path.getsize(path)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is down to 90% of max_size.
+        """
+        entries = sorted(self.scan(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_size * 9 // 10
+        for path, size, _ in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            self.evictions += 1
+
+    def scan(self) -> list[tuple[str, int, float]]:
+        """
+        :return: Path, size and modification time of every entry
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if not entry.name.endswith(CACHE_EXTENSION):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def remove(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            return
+        self.size = None
+
+    def clear(self):
+        for path, _, _ in self.scan():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.size = 0
+
+
+class CompileCache:
+    """
+    Compiled outputs by content address, looked up in memory first and then on disk. Outputs found
+    on disk are promoted to the memory tier. A cache can be shared by threads.
+    """
+
+    def __init__(self, memory: MemoryCache | None = None, disk: DiskCache | None = None):
+        """
+        :param memory: In-memory tier, None to only use the disk
+        :param disk: On-disk tier, None to only cache in memory
+        """
+        self.memory = memory
+        self.disk = disk
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            return self.lookup(key)
+
+    def lookup(self, key: str) -> str | None:
+        if self.memory is not None:
+            output = self.memory.get(key)
+            if output is not None:
+                self.stats.hits += 1
+                self.stats.memory_hits += 1
+                return output
+
+        if self.disk is not None:
+            output = self.disk.get(key)
+            if output is not None:
+                self.stats.hits += 1
+                self.stats.disk_hits += 1
+                if self.memory is not None:
+                    self.memory.put(key, output)
+                return output
+
+        self.stats.misses += 1
+        return None
+
+    def put(self, key: str, output: str):
+        with self.lock:
+            self.stats.stores += 1
+            if self.memory is not None:
+                self.memory.put(key, output)
+            if self.disk is not None:
+                self.disk.put(key, output)
+            self.stats.evictions = sum(tier.evictions for tier in (self.memory, self.disk) if tier is not None)
+
+    def invalidate(self, key: str | None = None):
+        """
+        Drop one entry, or everything when no key is given.
+        """
+        with self.lock:
+            for tier in (self.memory, self.disk):
+                if tier is None:
+                    continue
+                if key is None:
+                    tier.clear()
+                else:
+                    tier.remove(key)
@@ -0,0 +1,100 @@
+import os
+import socket
+import sys
+
+from .protocol import LENGTH, ProtocolError, decode, decode_length, encode
+
+
+class CompileClient:
+    """
+    Connection to a compile server. Requests are answered in order on one connection. This module
+    only imports the protocol, so that talking to a running server does not pay for importing the
+    compiler.
+    """
+
+    def __init__(self, path: str, timeout: float | None = None):
+        """
+        :param path: Unix socket the server listens on
+        :param timeout: Seconds to wait for the server
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(path)
+
+    def request(self, message: dict) -> dict:
+        self.socket.sendall(encode(message))
+        length = decode_length(self.receive(LENGTH.size))
+        return decode(self.receive(length))
+
+    def receive(self, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = self.socket.recv(min(size, 1024 * 1024))
+            if not chunk:
+                raise ProtocolError("Server closed the connection")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def compile(self, source: str, name: str | None = None) -> dict:
+        """
+        Compile source code on the server.
+        :return: Response with ok and either the output or the error
+        """
+        return self.request({"source": source, "name": name})
+
+    def compile_file(self, input: str, output: str | None = None) -> dict:
+        """
+        Have the server compile a file, and write the output itself if output is given.
+        """
+        message = {"path": os.path.abspath(input), "name": input}
+        if output is not None:
+            message["output"] = os.path.abspath(output)
+        return self.request(message)
+
+    def close(self):
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_client(path: str, input: str, output: str | None = None) -> int:
+    """
+    Compile one file through a running server like the CLI compiles it locally.
+    :return: Exit status
+    """
+    try:
+        with CompileClient(path) as client:
+            response = client.compile_file(input, output)
+    except (OSError, ProtocolError) as e:
+        print(f"Cannot reach the compile server at {path}: {e}", file=sys.stderr)
+        return 2
+
+    if not response.get("ok"):
+        print(response.get("error"), file=sys.stderr)
+        return 1
+    if output is None:
+        print(response["output"])
+    return 0
+
+
+def main(argv: list[str]) -> int:
+    """
+    Client mode without argparse: --connect SOCKET input [output]
+    """
+    arguments = list(argv)
+    try:
+        index = arguments.index("--connect")
+        path = arguments[index + 1]
+    except (ValueError, IndexError):
+        print("usage: rustic --connect SOCKET input [output]", file=sys.stderr)
+        return 2
+    del arguments[index: index + 2]
+    if not 1 <= len(arguments) <= 2 or any(argument.startswith("-") for argument in arguments):
+        print("usage: rustic --connect SOCKET input [output]", file=sys.stderr)
+        return 2
+    return run_client(path, *arguments)
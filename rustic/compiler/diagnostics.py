@@ -0,0 +1,43 @@
+# Errors reported in one pass before the lexer and parser give up
+MAX_ERRORS = 50
+
+
+class Diagnostics:
+    """
+    Errors collected by a lexer and parser that recover from them instead of stopping at the first.
+    Once max_errors have been reported the lexer ends the source and the parser stops.
+    """
+
+    def __init__(self, max_errors: int = MAX_ERRORS):
+        self.errors = []
+        self.max_errors = max_errors
+        # Source skipped by the lexer after its last error, errors in there only follow from it
+        self.skipped = (0, -1)
+
+    @property
+    def full(self) -> bool:
+        return len(self.errors) >= self.max_errors
+
+    def report(self, error: Exception):
+        """
+        :param error: SyntaxError or LexerError, with the position it was found at
+        """
+        if self.full:
+            return
+        start, end = self.skipped
+        if error.position is not None and start <= error.position <= end:
+            return
+        self.errors.append(error)
+
+    def skip(self, start: int, end: int):
+        self.skipped = (start, end)
+
+    def sorted(self) -> list[Exception]:
+        """
+        :return: The errors ordered by position. The lexer reads a token ahead of the parser, so
+            they are not always reported in order.
+        """
+        return sorted(self.errors, key=lambda error: error.position if error.position is not None else -1)
+
+    def __len__(self) -> int:
+        return len(self.errors)
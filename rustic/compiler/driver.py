@@ -0,0 +1,399 @@
+import os
+import mmap
+import time
+import asyncio
+import threading
+import tracemalloc
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from typing import Callable, Iterable, Iterator, TextIO
+
+from .ast.arena import Arena, count_nodes
+from .ast.nodes import ProgramNode
+from .ast.symbols import SymbolTable
+from .cache import CompileCache, cache_key
+from .diagnostics import MAX_ERRORS, Diagnostics
+from .emit.emitter import Emitter
+from .lex.lexer import Lexer, LexerError, TokenStream
+from .optimize.passes import optimize
+from .parse.parser import Parser, SyntaxError
+
+# Source files at least this large are memory-mapped and lexed as bytes instead of being read into a str
+MMAP_THRESHOLD = 1024 * 1024
+
+# Held while a compile traces its memory
+MEMORY_LOCK = threading.Lock()
+
+
+class CompileStats:
+    """
+    Where one compile spent its time and memory: seconds of every phase that ran, the number of
+    tokens, nodes by type, peak traced memory in bytes and sizes of the source and the output.
+    """
+
+    __slots__ = ("times", "tokens", "nodes", "peak_memory", "input_size", "output_size")
+
+    times: dict[str, float]
+    tokens: int | None
+    nodes: dict[str, int] | None
+    peak_memory: int | None
+    input_size: int
+    output_size: int | None
+
+    def __init__(self, input_size: int):
+        self.times = {}
+        self.tokens = None
+        self.nodes = None
+        self.peak_memory = None
+        self.input_size = input_size
+        self.output_size = None
+
+    @property
+    def total(self) -> float:
+        return sum(self.times.values())
+
+    def to_dict(self) -> dict:
+        return {
+            "times": dict(self.times),
+            "total": self.total,
+            "tokens": self.tokens,
+            "nodes": dict(self.nodes) if self.nodes is not None else None,
+            "peak_memory": self.peak_memory,
+            "input_size": self.input_size,
+            "output_size": self.output_size,
+        }
+
+    def __repr__(self):
+        return f"CompileStats({self.to_dict()})"
+
+
+class CompileResult:
+    """
+    Outcome of compiling one source: the output, or the SyntaxError or LexerError it failed with.
+    """
+
+    __slots__ = ("output", "error", "elapsed", "stats")
+
+    output: str | None
+    error: SyntaxError | LexerError | None
+    elapsed: float
+    stats: CompileStats | None
+
+    def __init__(
+        self,
+        output: str | None,
+        error: SyntaxError | LexerError | None,
+        elapsed: float,
+        stats: CompileStats | None = None,
+    ):
+        self.output = output
+        self.error = error
+        self.elapsed = elapsed
+        self.stats = stats
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return f"CompileResult({self.output!r}, {self.error!r}, {self.elapsed})"
+
+
+def format_errors(name: str, errors: list[SyntaxError | LexerError], max_errors: int = MAX_ERRORS) -> str:
+    """
+    Format the errors Rustic.check found in a source, one line per error.
+    :param name: Name of the source the lines start with
+    :param max_errors: Limit the check ran with, reaching it is noted in a last line
+    """
+    lines = []
+    for e in errors:
+        if isinstance(e, LexerError):
+            lines.append(f"{name}:{e.line}:{e.column}: Lexing error. {e.message}")
+        else:
+            lines.append(f"{name}:{e.line}:{e.column}: Syntax error. {e}")
+    if len(errors) >= max_errors:
+        lines.append(f"{name}: stopped after {len(errors)} errors")
+    return "\n".join(lines)
+
+
+def compile_source(input: str | bytes, options: dict) -> CompileResult:
+    """
+    Compile in a worker process, with a compiler made from Rustic.config().
+    """
+    return Rustic(**options).try_compile(input)
+
+
+class Rustic:
+    """
+    A compiler holds only its configuration and an optional cache. Every compile creates its own
+    lexer, parser and emitter and errors are raised as exceptions, so one instance can compile
+    from many threads at once. The cache is shared by the threads and locked, and so is memory
+    tracing in compile_with_stats, which is global to the process.
+    """
+
+    def __init__(
+        self,
+        lex_workers: int = 1,
+        mmap_threshold: int = MMAP_THRESHOLD,
+        cache: CompileCache | None = None,
+        optimize: bool = False,
+    ):
+        """
+        :param lex_workers: Number of processes to lex with, sources are lexed in parallel when more than one
+        :param mmap_threshold: Source files of at least this many bytes are memory-mapped by compile_file()
+        :param cache: Cache of compiled outputs, sources are always compiled without one
+        :param optimize: Run the optimization passes on every program before it is emitted
+        """
+        self.lex_workers = lex_workers
+        self.mmap_threshold = mmap_threshold
+        self.cache = cache
+        self.optimize = optimize
+
+    def options(self) -> dict:
+        """
+        Options that change the emitted code and are part of the cache key. Only options that differ
+        from their defaults are listed, so that keys stay the same when options are added.
+        """
+        options = {}
+        if self.optimize:
+            options["optimize"] = True
+        return options
+
+    def config(self) -> dict:
+        """
+        Arguments for an equivalent compiler in a worker process. Workers lex on their own and
+        do not share the cache.
+        """
+        return {"mmap_threshold": self.mmap_threshold, "optimize": self.optimize}
+
+    def try_compile(self, input: str | bytes) -> CompileResult:
+        """
+        Compile a source, returning a syntax or lexing error instead of raising it.
+        """
+        start = time.perf_counter()
+        try:
+            output = self.compile(input)
+        except (SyntaxError, LexerError) as e:
+            return CompileResult(None, e, time.perf_counter() - start)
+        return CompileResult(output, None, time.perf_counter() - start)
+
+    def compile_many(
+        self,
+        inputs: Iterable[str | bytes],
+        executor: Executor | None = None,
+        workers: int | None = None,
+        processes: bool = False,
+    ) -> list[CompileResult]:
+        """
+        Compile many sources in parallel. Threads share this compiler and its cache, which scales on
+        free-threaded builds of Python, processes scale everywhere but do not use the cache.
+        :param inputs: Sources to compile
+        :param executor: Executor to run the compiles on, by default a pool is created for the call
+        :param workers: Size of the created pool, with one the sources are compiled in this thread
+        :param processes: Create a process pool instead of a thread pool
+        :return: Result of every source, in the order of inputs
+        """
+        inputs = list(inputs)
+        if executor is not None:
+            return list(executor.map(self.task(executor), inputs))
+        if workers == 1 or len(inputs) <= 1:
+            return [self.try_compile(input) for input in inputs]
+
+        with self.create_executor(workers, processes) as executor:
+            return list(executor.map(self.task(executor), inputs))
+
+    async def compile_many_async(
+        self,
+        inputs: Iterable[str | bytes],
+        executor: Executor | None = None,
+        workers: int | None = None,
+        processes: bool = False,
+    ) -> list[CompileResult]:
+        """
+        Like compile_many(), but awaits the compiles without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        inputs = list(inputs)
+        created = executor is None
+        if created:
+            executor = self.create_executor(workers, processes)
+        try:
+            task = self.task(executor)
+            return list(await asyncio.gather(*(loop.run_in_executor(executor, task, input) for input in inputs)))
+        finally:
+            if created:
+                executor.shutdown(wait=False)
+
+    def create_executor(self, workers: int | None, processes: bool) -> Executor:
+        if processes:
+            return ProcessPoolExecutor(max_workers=workers)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rustic")
+
+    def task(self, executor: Executor) -> Callable[[str | bytes], CompileResult]:
+        """
+        Function that compiles one source on an executor. Worker processes get a copy of the
+        configuration instead of this compiler.
+        """
+        if isinstance(executor, ProcessPoolExecutor):
+            return partial(compile_source, options=self.config())
+        return self.try_compile
+
+    def compile(self, input: str | bytes) -> str:
+        if self.cache is None:
+            return self.emit(*self.parse(input))
+
+        key = cache_key(input, self.options())
+        output = self.cache.get(key)
+        if output is None:
+            output = self.emit(*self.parse(input))
+            self.cache.put(key, output)
+        return output
+
+    def compile_with_stats(self, input: str | bytes, memory: bool = True) -> CompileResult:
+        """
+        Compile a source and measure every phase. Unlike compile() the source is tokenized before it
+        is parsed, so that lexing and parsing are timed apart, and the cache is not used.
+        :param memory: Trace allocations for the peak memory, this slows down every phase. Compiles that
+            trace memory run one at a time, allocations of other threads count towards the peak.
+        :return: Result with the stats of the phases that ran, a syntax or lexing error is returned
+        """
+        # Tracing is global to the process, measuring compiles at the same time would reset each other's
+        # peak or stop tracing under another
+        with MEMORY_LOCK if memory else nullcontext():
+            stats = CompileStats(len(input))
+            traced = memory and not tracemalloc.is_tracing()
+            if traced:
+                tracemalloc.start()
+            elif memory:
+                tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0] if memory else 0
+            start = time.perf_counter()
+            try:
+                phase = time.perf_counter()
+                tokens = self.tokenize(input)
+                stats.times["lex"] = time.perf_counter() - phase
+                stats.tokens = len(tokens)
+
+                phase = time.perf_counter()
+                parser = Parser(tokens.reader())
+                ast = parser.program()
+                stats.times["parse"] = time.perf_counter() - phase
+
+                if self.optimize:
+                    phase = time.perf_counter()
+                    ast = optimize(ast)
+                    stats.times["optimize"] = time.perf_counter() - phase
+
+                phase = time.perf_counter()
+                output = Emitter(ast, parser.symbols).emit()
+                stats.times["emit"] = time.perf_counter() - phase
+                stats.output_size = len(output)
+            except (SyntaxError, LexerError) as e:
+                return CompileResult(None, e, time.perf_counter() - start, stats)
+            finally:
+                if memory:
+                    stats.peak_memory = tracemalloc.get_traced_memory()[1] - before
+                if traced:
+                    tracemalloc.stop()
+
+            elapsed = time.perf_counter() - start
+            # Counted after the clock stopped, walking the tree is not part of compiling
+            stats.nodes = count_nodes(ast)
+            return CompileResult(output, None, elapsed, stats)
+
+    def tokenize(self, input: str | bytes) -> TokenStream:
+        lexer = Lexer(input)
+        if self.lex_workers > 1:
+            return lexer.tokenize_parallel(self.lex_workers)
+        return lexer.tokenize()
+
+    def compile_stream(self, input: str | bytes, stream: TextIO):
+        """
+        Compile to a text stream one top-level statement at a time, without building the program tree
+        or the output in memory. Optimizing looks at the whole program, so an optimizing compiler
+        builds the output first.
+        """
+        if self.optimize:
+            stream.write(self.emit(*self.parse(input)))
+            return
+        parser = self.parser(input)
+        emitter = Emitter(symbols=parser.symbols)
+        emitter.emit_stream(parser.statements(), stream)
+
+    def compile_file(self, input: str, output: str):
+        """
+        Compile a source file straight into an output file. A partially written output is removed if
+        compiling fails. With a cache the output is built in memory so that it can be stored.
+        """
+        try:
+            with open(output, "wt") as out, self.read_source(input) as source:
+                if self.cache is None:
+                    self.compile_stream(source, out)
+                else:
+                    out.write(self.compile(source))
+        except BaseException:
+            if os.path.exists(output):
+                os.remove(output)
+            raise
+
+    def parse(self, input: str | bytes) -> tuple[ProgramNode, SymbolTable]:
+        parser = self.parser(input)
+        return parser.program(), parser.symbols
+
+    def parse_file(self, input: str) -> tuple[ProgramNode, SymbolTable]:
+        with self.read_source(input) as source:
+            return self.parse(source)
+
+    def check(self, input: str | bytes, max_errors: int = MAX_ERRORS) -> list[SyntaxError | LexerError]:
+        """
+        Find the errors of a source in a single pass, recovering after each one. Compiling stops at
+        the first error and pays nothing for recovery, so this is only worth running once it failed.
+        :param max_errors: Stop after this many errors
+        :return: Errors ordered by position
+        """
+        diagnostics = Diagnostics(max_errors)
+        parser = Parser(Lexer(input, diagnostics=diagnostics), diagnostics=diagnostics)
+        for _ in parser.statements():
+            pass
+        return diagnostics.sorted()
+
+    def check_file(self, input: str, max_errors: int = MAX_ERRORS) -> list[SyntaxError | LexerError]:
+        with self.read_source(input) as source:
+            return self.check(source, max_errors)
+
+    @contextmanager
+    def read_source(self, input: str) -> Iterator[str | mmap.mmap]:
+        """
+        Open a source file, memory-mapping it if it is large.
+        """
+        size = os.path.getsize(input)
+        if size > 0 and size >= self.mmap_threshold:
+            with open(input, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                yield source
+        else:
+            with open(input, "r") as f:
+                yield f.read()
+
+    def parser(self, input: str | bytes) -> Parser:
+        if self.lex_workers > 1:
+            return Parser(self.tokenize(input).reader())
+        return Parser(Lexer(input))
+
+    def emit(self, ast: ProgramNode | Arena, symbols: SymbolTable | None = None) -> str:
+        emitter = Emitter(self.transform(ast), symbols)
+        return emitter.emit()
+
+    def emit_to(self, ast: ProgramNode | Arena, stream: TextIO, symbols: SymbolTable | None = None):
+        emitter = Emitter(self.transform(ast), symbols)
+        emitter.emit_to(stream)
+
+    def transform(self, ast: ProgramNode | Arena) -> ProgramNode | Arena:
+        """
+        The program to emit, optimized if this compiler optimizes.
+        """
+        if not self.optimize:
+            return ast
+        if isinstance(ast, Arena):
+            ast = ast.to_program()
+        return optimize(ast)
@@ -1,4 +1,8 @@
+from typing import Iterable, TextIO
+
 from ..lex.lexer import TokenType
+from ..ast.arena import Arena
+from ..ast.symbols import SymbolTable
 from ..ast.nodes import (
     ASTNode,
     BinaryOpNode,
@@ -9,8 +13,10 @@ from ..ast.nodes import (
     PrimaryNode,
     PrintNode,
     ProgramNode,
+    UnaryOpNode,
     WhileNode,
 )
+from .writer import CodeWriter
 
 TAB_WIDTH = 2
 
@@ -23,127 +29,258 @@ def with_indent(input: str, indent: int = 0):
     return f"{input:>{indent}}"
 
 
+# Rust operators with the surrounding spaces, by token type
+BINARY_OPERATORS = {
+    TokenType.PLUS: " + ",
+    TokenType.MINUS: " - ",
+    TokenType.ASTERISK: " * ",
+    TokenType.SLASH: " / ",
+}
+
+COMPARISON_OPERATORS = {
+    TokenType.EQ: " == ",
+    TokenType.EQEQ: " == ",
+    TokenType.NOTEQ: " != ",
+    TokenType.LT: " < ",
+    TokenType.LTEQ: " <= ",
+    TokenType.GT: " > ",
+    TokenType.GTEQ: " >= ",
+}
+
+# Rust has no unary plus, +x is emitted as x
+UNARY_OPERATORS = {
+    TokenType.PLUS: "",
+    TokenType.MINUS: "-",
+}
+
+# Expression node kinds for Emitter.emit_expression()
+PRIMARY = 0
+BINARY = 1
+COMPARISON = 2
+UNARY = 3
+
+EXPRESSION_KINDS = {
+    PrimaryNode: PRIMARY,
+    BinaryOpNode: BINARY,
+    ComparisonNode: COMPARISON,
+    UnaryOpNode: UNARY,
+}
+
+
+def resolve(table: dict, node_type: type):
+    """
+    Look up a node type that is not in a dispatch table by its closest registered base class and
+    cache the result for the type.
+    """
+    for base in node_type.__mro__:
+        if base in table:
+            table[node_type] = table[base]
+            return table[base]
+    raise EmitError(f"Cannot emit {node_type.__name__}")
+
+
 class Emitter:
-    ast: ProgramNode
+    ast: ProgramNode | Arena | None
     output: str
 
-    symbols: list[str]
+    handlers: dict
+
+    symbols: SymbolTable
+    declared: bytearray
 
-    def __init__(self, ast: ProgramNode):
+    def __init__(self, ast: ProgramNode | Arena | None = None, symbols: SymbolTable | None = None):
+        """
+        :param ast: Program to emit, not needed when statements are streamed with emit_stream()
+        :param symbols: Symbol table built by the parser, variables missing from it are added while emitting
+        """
         self.ast = ast
         self.output = ""
-        self.symbols = []
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        # Whether a variable has been declared with let yet, by symbol id
+        self.declared = bytearray(len(self.symbols))
+
+    def declare(self, name: str) -> bool:
+        """
+        Mark a variable as declared.
+        :return: True if this is the first declaration of the variable
+        """
+        symbol = self.symbols.define(name)
+        if symbol.id >= len(self.declared):
+            self.declared.extend(bytes(len(self.symbols) - len(self.declared)))
+        if self.declared[symbol.id]:
+            return False
+        self.declared[symbol.id] = 1
+        return True
 
     def emit(self) -> str:
-        output = ""
+        writer = CodeWriter()
+        self.write(writer)
+        return writer.getvalue()
 
-        for statement in self.ast.statements:
-            output += self.emit_node(statement, 1)
+    def emit_to(self, stream: TextIO):
+        """
+        Write the program straight to a text stream instead of building it in memory.
+        """
+        writer = CodeWriter(stream)
+        self.write(writer)
+        writer.flush()
 
-        imports = "use std::io::stdin;\n"
-        program_code = "fn main() {\n" + output + "}"
+    def emit_stream(self, statements: Iterable[ASTNode], stream: TextIO):
+        """
+        Write a program to a text stream while its statements are still being produced, for example
+        by Parser.statements(). Each statement is emitted as soon as it arrives and is not kept.
+        :param statements: Top-level statements of the program
+        :param stream: Text stream to write to
+        """
+        writer = CodeWriter(stream)
+        self.write_program(statements, writer)
+        writer.flush()
 
-        return f"{imports} {program_code}"
+    def write(self, writer: CodeWriter):
+        self.write_program(self.ast.statements, writer)
 
-    def emit_node(self, node: ASTNode, indent: int = 0) -> str:
-        if isinstance(node, PrintNode):
-            if isinstance(node.value, ASTNode):
-                return with_indent(
-                    f'println!("{{}}", {self.emit_node(node.value)});\n', indent
-                )
-            return with_indent(f'println!("{node.value}");\n', indent)
-        elif isinstance(node, LetNode):
-            if node.variable in self.symbols:
-                return with_indent(
-                    f"{node.variable} = {self.emit_node(node.expression)};\n", indent
-                )
-
-            self.symbols.append(node.variable)
+    def write_program(self, statements: Iterable[ASTNode], writer: CodeWriter):
+        writer.write("use std::io::stdin;\n fn main() {\n")
+        self.write_statements(statements, writer, 1)
+        writer.write("}")
 
-            return with_indent(
-                f"let mut {node.variable} = {self.emit_node(node.expression)};\n",
-                indent,
-            )
-        elif isinstance(node, PrimaryNode):
-            return f"{node.value}"
-        elif isinstance(node, BinaryOpNode):
-            operator = "+"
-            if node.operator == TokenType.PLUS:
-                operator = "+"
-            elif node.operator == TokenType.MINUS:
-                operator = "-"
-            elif node.operator == TokenType.SLASH:
-                operator = "/"
-            elif node.operator == TokenType.ASTERISK:
-                operator = "*"
-
-            return (
-                f"{self.emit_node(node.left)} {operator} {self.emit_node(node.right)}"
-            )
-        elif isinstance(node, IfNode):
-            comparison = self.emit_node(node.condition)
+    def write_statements(self, statements, writer: CodeWriter, indent: int = 0):
+        """
+        Write a list of statements. IF and WHILE bodies are handled with an explicit stack of open
+        blocks, so every statement is written once no matter how deeply it is nested.
+        """
+        handlers = self.handlers
+        emit_block = Emitter.emit_block
 
-            then_block = ""
-            for block_node in node.then_branch:
-                then_block += self.emit_node(block_node)
+        # Open blocks as (statements left, indent of the statements, output size and indent of the block)
+        blocks = [(iter(statements), indent, None)]
+        while blocks:
+            remaining, indent, block = blocks[-1]
+            node = next(remaining, None)
+            if node is None:
+                blocks.pop()
+                if block is not None:
+                    start, block_indent = block
+                    # An empty body is padded like with_indent() pads an empty string
+                    if writer.size == start:
+                        writer.write(with_indent("", block_indent + 1))
+                    writer.write("}\n")
+                continue
 
+            handler = handlers.get(type(node)) or resolve(handlers, type(node))
+            if handler is emit_block:
+                keyword, body = block_parts(node)
+                writer.write(f"{keyword} {self.emit_expression(node.condition)} {{\n")
+                blocks.append((iter(body), 0, (writer.size, indent)))
+            else:
+                writer.write(handler(self, node, indent))
+
+    def emit_node(self, node: ASTNode, indent: int = 0) -> str:
+        """
+        Emit a single node through the handler registered for its class.
+        """
+        handler = self.handlers.get(type(node)) or resolve(self.handlers, type(node))
+        return handler(self, node, indent)
+
+    def emit_print(self, node: PrintNode, indent: int = 0) -> str:
+        if isinstance(node.value, ASTNode):
             return with_indent(
-                f"if {comparison} {{\n{with_indent(then_block, indent + 1)}}}\n", indent
+                f'println!("{{}}", {self.emit_expression(node.value)});\n', indent
             )
-        elif isinstance(node, ComparisonNode):
-            left_node = self.emit_node(node.left)
-            right_node = self.emit_node(node.right)
-
-            comparison = None
-            if node.operator == TokenType.EQ:
-                comparison = "=="
-            elif node.operator == TokenType.EQEQ:
-                comparison = "=="
-            elif node.operator == TokenType.NOTEQ:
-                comparison = "!="
-            elif node.operator == TokenType.LT:
-                comparison = "<"
-            elif node.operator == TokenType.LTEQ:
-                comparison = "<="
-            elif node.operator == TokenType.GT:
-                comparison = ">"
-            elif node.operator == TokenType.GTEQ:
-                comparison = ">="
-
-            if comparison is None:
-                raise EmitError(f"Invalid comparison operator {node.operator}")
-
-            return f"{left_node} {comparison} {right_node}"
-        elif isinstance(node, WhileNode):
-            comparison = self.emit_node(node.condition)
-
-            body = ""
-            for block_node in node.body:
-                body += self.emit_node(block_node)
+        return with_indent(f'println!("{node.value}");\n', indent)
 
+    def emit_let(self, node: LetNode, indent: int = 0) -> str:
+        if not self.declare(node.variable):
             return with_indent(
-                f"while {comparison} {{\n{with_indent(body, indent + 1)}}}\n", indent
+                f"{node.variable} = {self.emit_expression(node.expression)};\n", indent
             )
-        elif isinstance(node, InputNode):
-            input_variable = with_indent(
-                f"let mut {node.variable}_input = String::new();", indent
+
+        return with_indent(
+            f"let mut {node.variable} = {self.emit_expression(node.expression)};\n",
+            indent,
+        )
+
+    def emit_input(self, node: InputNode, indent: int = 0) -> str:
+        input_variable = with_indent(
+            f"let mut {node.variable}_input = String::new();", indent
+        )
+        input = with_indent(
+            f"stdin().read_line(&mut {node.variable}_input);", indent
+        )
+        if not self.declare(node.variable):
+            variable = with_indent(
+                f'{node.variable} = {node.variable}_input.trim().parse().expect("Input is not a integer");',
+                indent,
             )
-            input = with_indent(
-                f"stdin().read_line(&mut {node.variable}_input);", indent
+        else:
+            variable = with_indent(
+                f'let mut {node.variable}: i32 = {node.variable}_input.trim().parse().expect("Input is not a integer");',
+                indent,
             )
-            if node.variable in self.symbols:
-                variable = with_indent(
-                    f'{node.variable} = {node.variable}_input.trim().parse().expect("Input is not a integer");',
-                    indent,
-                )
+
+        return f"{input_variable}\n{input}\n{variable}\n"
+
+    def emit_block(self, node: IfNode | WhileNode, indent: int = 0) -> str:
+        writer = CodeWriter()
+        self.write_statements([node], writer, indent)
+        return writer.getvalue()
+
+    def emit_expression(self, node: ASTNode, indent: int = 0) -> str:
+        """
+        Emit an expression by walking it in order with an explicit stack and joining the pieces once.
+        """
+        kinds = EXPRESSION_KINDS
+        parts = []
+        stack = [node]
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                parts.append(item)
+                continue
+
+            kind = kinds.get(type(item))
+            if kind is None:
+                kind = resolve(kinds, type(item))
+
+            if kind == PRIMARY:
+                parts.append(f"{item.value}")
+            elif kind == BINARY:
+                operator = BINARY_OPERATORS.get(item.operator)
+                if operator is None:
+                    raise EmitError(f"Invalid binary operator {item.operator}")
+                stack.extend((item.right, operator, item.left))
+            elif kind == COMPARISON:
+                operator = COMPARISON_OPERATORS.get(item.operator)
+                if operator is None:
+                    raise EmitError(f"Invalid comparison operator {item.operator}")
+                stack.extend((item.right, operator, item.left))
             else:
-                variable = with_indent(
-                    f'let mut {node.variable}: i32 = {node.variable}_input.trim().parse().expect("Input is not a integer");',
-                    indent,
-                )
+                operator = UNARY_OPERATORS.get(item.operator)
+                if operator is None:
+                    raise EmitError(f"Invalid unary operator {item.operator}")
+                stack.extend((item.operand, operator))
+
+        return "".join(parts)
+
 
-            self.symbols.append(node.variable)
+# Handler of every node class, subclasses are resolved and cached on first use
+Emitter.handlers = {
+    PrintNode: Emitter.emit_print,
+    LetNode: Emitter.emit_let,
+    InputNode: Emitter.emit_input,
+    IfNode: Emitter.emit_block,
+    WhileNode: Emitter.emit_block,
+    PrimaryNode: Emitter.emit_expression,
+    BinaryOpNode: Emitter.emit_expression,
+    ComparisonNode: Emitter.emit_expression,
+    UnaryOpNode: Emitter.emit_expression,
+}
 
-            return f"{input_variable}\n{input}\n{variable}\n"
 
-        return ""
+def block_parts(node: IfNode | WhileNode) -> tuple[str, list[ASTNode]]:
+    """
+    Rust keyword and body of a block statement.
+    """
+    if isinstance(node, IfNode):
+        return "if", node.then_branch
+    return "while", node.body
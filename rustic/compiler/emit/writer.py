@@ -0,0 +1,57 @@
+from typing import TextIO
+
+# Buffered output is handed to the stream once it reaches this many characters
+FLUSH_SIZE = 64 * 1024
+
+
+class CodeWriter:
+    """
+    Collects output as a list of chunks that are joined once at the end, so emitting is linear in
+    the size of the output. With a stream the chunks are written out whenever enough has piled up.
+    """
+
+    __slots__ = ("stream", "chunks", "buffered", "size", "flush_size")
+
+    stream: TextIO | None
+    chunks: list[str]
+    size: int
+
+    def __init__(self, stream: TextIO | None = None, flush_size: int = FLUSH_SIZE):
+        """
+        :param stream: Text stream to write to, output is kept in memory without one
+        :param flush_size: Number of buffered characters that triggers a write to the stream
+        """
+        self.stream = stream
+        self.chunks = []
+        self.buffered = 0
+        # Total number of characters written so far
+        self.size = 0
+        self.flush_size = flush_size
+
+    def write(self, text: str):
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.stream is not None:
+            self.buffered += len(text)
+            if self.buffered >= self.flush_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the buffered chunks to the stream.
+        """
+        if self.stream is None:
+            return
+        self.stream.write("".join(self.chunks))
+        self.chunks.clear()
+        self.buffered = 0
+
+    def getvalue(self) -> str:
+        """
+        Get everything written so far, only available without a stream.
+        """
+        if self.stream is not None:
+            raise ValueError("Output has been written to the stream")
+        if len(self.chunks) > 1:
+            self.chunks[:] = ["".join(self.chunks)]
+        return self.chunks[0] if self.chunks else ""
@@ -1,5 +1,11 @@
-import sys
+import os
+import re
 import enum
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from ..diagnostics import Diagnostics
+from .lines import LineIndex, NEWLINE_PATTERN, BYTES_NEWLINE_PATTERN
 
 
 class TokenType(enum.Enum):
@@ -37,46 +43,371 @@ class TokenType(enum.Enum):
 
     @staticmethod
     def is_keyword(token: str) -> bool:
-        for kind in TokenType:
-            if kind.name == token.upper() and 101 <= kind.value <= 111:
-                return True
-        return False
+        return token.upper() in KEYWORDS
+
+
+# Keyword lookup by upper-cased spelling, built once instead of scanning the enum per identifier
+KEYWORDS = {kind.name: kind for kind in TokenType if 101 <= kind.value <= 111}
+
+OPERATORS = {
+    "+": TokenType.PLUS,
+    "-": TokenType.MINUS,
+    "*": TokenType.ASTERISK,
+    "/": TokenType.SLASH,
+    "=": TokenType.EQ,
+    "==": TokenType.EQEQ,
+    "!=": TokenType.NOTEQ,
+    "<": TokenType.LT,
+    "<=": TokenType.LTEQ,
+    ">": TokenType.GT,
+    ">=": TokenType.GTEQ,
+}
+
+# Master pattern used by the "regex" engine. Leading whitespace is skipped as part of the match and
+# the named group that matched tells which kind of token was found. Anything the pattern does not
+# accept ends up in ERROR, which reproduces the error messages of the character scanner.
+TOKEN_PATTERN = re.compile(
+    r"""
+    [ \t\r]*
+    (?:
+        (?P<NUMBER>[0-9]+(?:\.[0-9]*)?)
+      | (?P<WORD>[A-Za-z][A-Za-z0-9]*)
+      | "(?P<STRING>[^"\r\n\t\\%]*)"
+      | (?P<OPERATOR>==|!=|<=|>=|[-+*/=<>])
+      | (?P<NEWLINE>\n)
+      | (?P<EOF>\x00|\Z)
+      | (?P<ERROR>[\s\S])
+    )
+    """,
+    re.VERBOSE,
+)
+
+# Characters that end a string literal, either legally or with an error
+STRING_STOP_PATTERN = re.compile(r'["\r\n\t\\%]')
+
+# Variants of the tables above for lexing ASCII bytes, e.g. a memory-mapped source file
+BYTES_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern.encode("ascii"), re.VERBOSE)
+BYTES_STRING_STOP_PATTERN = re.compile(STRING_STOP_PATTERN.pattern.encode("ascii"))
+BYTES_KEYWORDS = {name.encode("ascii"): kind for name, kind in KEYWORDS.items()}
+BYTES_OPERATORS = {value.encode("ascii"): kind for value, kind in OPERATORS.items()}
+NON_ASCII_PATTERN = re.compile(rb"[\x80-\xff]")
+
+ENGINES = ("regex", "scan")
+
+# Approximate size of the pieces a source is cut into for parallel lexing
+PARALLEL_CHUNK_SIZE = 1024 * 1024
+
+
+def decode(value) -> str:
+    """
+    Turn a slice of the source into a str. Slices of a bytes-like source are decoded, string
+    literals may contain UTF-8 even though everything else is plain ASCII.
+    """
+    if isinstance(value, str):
+        return value
+    return str(value, "utf-8")
+
+
+# Compact type codes used by TokenStream, the position of the type in TOKEN_TYPES
+TOKEN_TYPES = tuple(TokenType)
+TYPE_CODES = {kind: code for code, kind in enumerate(TOKEN_TYPES)}
+
+# Token types whose match group maps directly to a single type
+GROUP_TYPES = {
+    "NUMBER": TokenType.NUMBER,
+    "STRING": TokenType.STRING,
+    "NEWLINE": TokenType.NEWLINE,
+}
+
+
+class LexerError(Exception):
+    """
+    Raised by Lexer.abort(). The location is only worked out once an error actually happens.
+    """
+
+    def __init__(self, message: str, position: int, line: int, column: int):
+        super().__init__(f"Lexing error. {message} (line {line}, column {column})")
+        self.message = message
+        self.position = position
+        self.line = line
+        self.column = column
+
+    def __reduce__(self):
+        # Errors are sent back from worker processes
+        return LexerError, (self.message, self.position, self.line, self.column)
 
 
 class Token:
+    """
+    A single token. Tokens created by the lexer only hold offsets into the source, the value is
+    sliced out of the source the first time it is asked for.
+    """
+
+    __slots__ = ("type", "start", "end", "_source", "_value")
+
     type: TokenType
-    value: str
+    start: int
+    end: int
 
-    def __init__(self, type: TokenType, value: str):
+    def __init__(self, type: TokenType, value: str | None = None, start: int = 0, end: int = 0, source=None):
         self.type = type
-        self.value = value
+        self.start = start
+        self.end = end
+        self._source = source
+        self._value = value
+
+    @property
+    def value(self) -> str:
+        if self._value is None:
+            self._value = decode(self._source[self.start: self.end])
+        return self._value
 
     def __repr__(self):
         return f"Token({self.type}, {self.value})"
 
 
+class TokenStream:
+    """
+    Tokens stored as parallel columns of type codes and start/end offsets into the source.
+    Indexing the stream returns a Token view, values are only sliced out when asked for.
+    """
+
+    __slots__ = ("source", "types", "starts", "ends")
+
+    source: str | bytes
+    types: array
+    starts: array
+    ends: array
+
+    def __init__(self, source: str | bytes):
+        self.source = source
+        self.types = array("B")
+        self.starts = array("q")
+        self.ends = array("q")
+
+    def append(self, type: TokenType, start: int, end: int):
+        self.types.append(TYPE_CODES[type])
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def type(self, index: int) -> TokenType:
+        return TOKEN_TYPES[self.types[index]]
+
+    def value(self, index: int) -> str:
+        return decode(self.source[self.starts[index]: self.ends[index]])
+
+    def reader(self) -> "TokenReader":
+        return TokenReader(self)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __getitem__(self, index: int) -> Token:
+        return Token(TOKEN_TYPES[self.types[index]], None, self.starts[index], self.ends[index], self.source)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield self[index]
+
+    def __repr__(self):
+        return f"TokenStream({len(self)} tokens)"
+
+
+class TokenReader:
+    """
+    Hands out the tokens of a TokenStream one at a time, the same way Lexer.next_token() does.
+    Once the stream is exhausted every call returns an EOF token.
+    """
+
+    __slots__ = ("stream", "index")
+
+    def __init__(self, stream: TokenStream):
+        self.stream = stream
+        self.index = 0
+
+    @property
+    def source(self) -> str | bytes:
+        return self.stream.source
+
+    def next_token(self) -> Token:
+        index = self.index
+        stream = self.stream
+        if index >= len(stream.types):
+            end = len(stream.source)
+            return Token(TokenType.EOF, "", end, end)
+
+        self.index = index + 1
+        return Token(TOKEN_TYPES[stream.types[index]], None, stream.starts[index], stream.ends[index], stream.source)
+
+
 class Lexer:
-    source: str
+    source: str | bytes
+    engine: str
+    text: bool
 
     current_position: int
     current_char: str
 
-    def __init__(self, input: str):
+    def __init__(
+        self, input: str | bytes, engine: str = "regex", position: int = 0, diagnostics: Diagnostics | None = None
+    ):
+        """
+        :param input: Tiny BASIC source code. Besides str this can be any bytes-like object, for example an
+            mmap of the source file, which is then lexed as ASCII bytes by the regex engine. Bytes that
+            are not all ASCII are decoded as UTF-8 and lexed like a str.
+        :param engine: "regex" to scan with the master pattern, "scan" for the character-by-character scanner
+        :param position: Offset to start lexing from, it has to be at the start of a token or whitespace
+        :param diagnostics: Collects the errors of next_token(), which then resumes at the next line
+            instead of raising them
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown lexer engine: {engine}")
+
+        # A source is lexed the same whether it was read as a str or memory-mapped as bytes
+        if not isinstance(input, str) and NON_ASCII_PATTERN.search(input):
+            position = len(decode(input[:position]))
+            input = decode(input)
+        self.text = isinstance(input, str)
+        if self.text:
+            # The master pattern only knows ASCII, str.isdigit() and str.isalnum() accept a lot more
+            if engine == "regex" and not input.isascii():
+                engine = "scan"
+            self.pattern = TOKEN_PATTERN
+            self.string_stop_pattern = STRING_STOP_PATTERN
+            self.keywords = KEYWORDS
+            self.operators = OPERATORS
+        elif engine == "scan":
+            raise ValueError("The scan engine can only lex str input")
+        else:
+            self.pattern = BYTES_TOKEN_PATTERN
+            self.string_stop_pattern = BYTES_STRING_STOP_PATTERN
+            self.keywords = BYTES_KEYWORDS
+            self.operators = BYTES_OPERATORS
+
+        self.engine = engine
+        self.diagnostics = diagnostics
         self.current_char = ""
-        self.current_position = -1
+        self.current_position = position - 1
         self.source = input
-        self.next_char()
+        if self.text:
+            self.next_char()
+        else:
+            self.current_position = position
 
-    def tokenize(self) -> list[Token]:
+    def tokenize(self) -> TokenStream:
         """
         Tokenize the input string.
         :param input: Tiny BASIC source code
-        :return: List of tokens
+        :return: Compact stream of tokens
         """
-        tokens = []
+        stream = TokenStream(self.source)
+        if self.engine == "regex":
+            self.match_tokens(stream)
+            return stream
+
         while self.current_char != "\0":
-            tokens.append(self.next_token())
-        return tokens
+            token = self.scan_token()
+            stream.append(token.type, token.start, token.end)
+        return stream
+
+    def match_tokens(self, stream: TokenStream):
+        """
+        Fill the stream by running the master pattern over the rest of the source, without creating Token objects.
+        :param stream: Stream to append the tokens to
+        """
+        source = self.source
+        types = stream.types
+        starts = stream.starts
+        ends = stream.ends
+        word_codes = {name: TYPE_CODES[kind] for name, kind in self.keywords.items()}
+        operator_codes = {value: TYPE_CODES[kind] for value, kind in self.operators.items()}
+        group_codes = {group: TYPE_CODES[kind] for group, kind in GROUP_TYPES.items()}
+        ident_code = TYPE_CODES[TokenType.IDENT]
+        eof_code = TYPE_CODES[TokenType.EOF]
+
+        for match in self.pattern.finditer(source, self.current_position):
+            kind = match.lastgroup
+            start, end = match.span(kind)
+            if kind == "WORD":
+                types.append(word_codes.get(match.group(kind).upper(), ident_code))
+            elif kind == "OPERATOR":
+                types.append(operator_codes[match.group(kind)])
+            elif kind == "EOF":
+                # Tokenizing stops at the end or at a NUL that directly follows the previous token
+                if start == match.start():
+                    self.current_position = start
+                    return
+                types.append(eof_code)
+                end = start
+            elif kind == "ERROR":
+                self.current_position = end
+                self.match_error(match.group(kind), start)
+            else:
+                types.append(group_codes[kind])
+            starts.append(start)
+            ends.append(end)
+            self.current_position = match.end()
+
+    def tokenize_parallel(
+        self,
+        workers: int | None = None,
+        chunk_size: int = PARALLEL_CHUNK_SIZE,
+        executor: Executor | None = None,
+    ) -> TokenStream:
+        """
+        Tokenize the input string in a process pool. Tokens never span a newline, so the source is cut
+        right after newlines into chunks of roughly chunk_size characters which are lexed independently.
+        The result is the same stream tokenize() returns, with offsets relative to the whole source.
+        :param workers: Number of worker processes, defaults to the number of CPUs
+        :param chunk_size: Approximate number of characters per chunk
+        :param executor: Executor to submit the chunks to instead of starting a new process pool
+        :return: Compact stream of tokens
+        """
+        bounds = self.chunk_bounds(chunk_size)
+        if len(bounds) < 2 or (workers == 1 and executor is None):
+            return self.tokenize()
+
+        source = self.source
+        chunks = [source[start:end] if self.text else bytes(source[start:end]) for start, end in bounds]
+        offsets = [start for start, _ in bounds]
+        engines = [self.engine] * len(bounds)
+
+        stream = TokenStream(source)
+        pool = executor or ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        try:
+            for types, starts, ends, stopped, error in pool.map(tokenize_chunk, chunks, offsets, engines):
+                # Report the error again so that the location is relative to the whole source
+                if error is not None:
+                    self.abort(*error)
+                stream.types.extend(types)
+                stream.starts.extend(starts)
+                stream.ends.extend(ends)
+                # A NUL right after a token ends tokenizing, the following chunks are dropped
+                if stopped:
+                    break
+        finally:
+            if executor is None:
+                pool.shutdown(cancel_futures=True)
+
+        self.current_position = len(source)
+        return stream
+
+    def chunk_bounds(self, chunk_size: int) -> list[tuple[int, int]]:
+        """
+        Split the rest of the source into (start, end) ranges that end right after a newline.
+        :param chunk_size: Approximate number of characters per range
+        :return: List of ranges covering the rest of the source
+        """
+        newline = NEWLINE_PATTERN if self.text else BYTES_NEWLINE_PATTERN
+        length = len(self.source)
+        start = self.current_position
+        bounds = []
+        while start < length:
+            match = newline.search(self.source, start + chunk_size)
+            end = match.end() if match is not None else length
+            bounds.append((start, end))
+            start = end
+        return bounds
 
     def consume_whitespace(self):
         """
@@ -90,8 +421,85 @@ class Lexer:
         Get the next token in the source string.
         :return:
         """
+        try:
+            if self.engine == "regex":
+                return self.match_token()
+            return self.scan_token()
+        except LexerError as e:
+            if self.diagnostics is None:
+                raise
+            return self.recover(e)
+
+    def recover(self, error: LexerError) -> Token:
+        """
+        Report a lexing error and skip to the end of its line, or to the end of the source once
+        there are too many errors.
+        :return: The token after the skipped source
+        """
+        self.diagnostics.report(error)
+        resume = self.source.find("\n" if self.text else b"\n", max(self.current_position, error.position))
+        if resume == -1 or self.diagnostics.full:
+            resume = len(self.source)
+        self.diagnostics.skip(error.position, resume)
+
+        if self.engine == "regex":
+            self.current_position = resume
+        else:
+            self.current_position = resume - 1
+            self.next_char()
+        return self.next_token()
+
+    def match_token(self) -> Token:
+        """
+        Get the next token by matching the master pattern at the current position.
+        :return:
+        """
+        match = self.pattern.match(self.source, self.current_position)
+        kind = match.lastgroup
+        start, end = match.span(kind)
+        self.current_position = match.end()
+
+        if kind == "WORD":
+            value = match.group(kind)
+            if self.text:
+                return Token(KEYWORDS.get(value.upper(), TokenType.IDENT), value, start, end)
+            return Token(self.keywords.get(value.upper(), TokenType.IDENT), None, start, end, self.source)
+        elif kind == "OPERATOR":
+            return Token(self.operators[match.group(kind)], None, start, end, self.source)
+        elif kind == "EOF":
+            return Token(TokenType.EOF, "", start, start)
+        elif kind == "ERROR":
+            self.match_error(match.group(kind), start)
+        return Token(GROUP_TYPES[kind], None, start, end, self.source)
+
+    def match_error(self, char: str | bytes, position: int):
+        """
+        Abort on a character the master pattern could not match, with the same message the scanner gives.
+        :param char: The unmatched character
+        :param position: Offset of the unmatched character
+        """
+        following = self.source[self.current_position: self.current_position + 1]
+        if not self.text:
+            char = str(char, "latin-1")
+            following = str(following, "latin-1")
+
+        if char == "!":
+            self.abort("Expected !=, got !" + (following or "\0"), position)
+        elif char == "\"":
+            stop = self.string_stop_pattern.search(self.source, self.current_position)
+            if stop is None:
+                self.abort("Unterminated string.", len(self.source))
+            self.abort("Illegal character in string.", stop.start())
+        self.abort("Unknown token: " + char, position)
+
+    def scan_token(self) -> Token:
+        """
+        Get the next token by scanning the source one character at a time.
+        :return:
+        """
         self.consume_whitespace()
         token = None
+        start = self.current_position
         if self.current_char.isdigit():
             position = self.current_position
             # Continue reading digits until we hit a non-digit character
@@ -156,20 +564,27 @@ class Lexer:
             position = self.current_position
             # Continue reading characters until we hit a non-letter/digit character
             while self.current_char != "\"":
+                if self.current_position >= len(self.source):
+                    self.abort("Unterminated string.")
                 if (self.current_char == "\r" or self.current_char == "\n" or self.current_char == "\t"
                         or self.current_char == "\\" or self.current_char == "%"):
                     self.abort("Illegal character in string.")
                 self.next_char()
             # Get the entire word
             value = self.source[position: self.current_position]
-            token = Token(TokenType.STRING, value)
+            token = Token(TokenType.STRING, value, position, self.current_position)
         elif self.current_char == "\n":
             token = Token(TokenType.NEWLINE, self.current_char)
         elif self.current_char == "\0":
-            token = Token(TokenType.EOF, "")
+            # Keep repeated EOF tokens at the end of the source
+            start = min(start, len(self.source))
+            token = Token(TokenType.EOF, "", start, start)
         else:
             self.abort("Unknown token: " + self.current_char)
 
+        if token.type != TokenType.STRING and token.type != TokenType.EOF:
+            token.start = start
+            token.end = self.current_position + 1
         self.next_char()
         return token
 
@@ -196,11 +611,38 @@ class Lexer:
             return "\0"
         return self.source[self.current_position + 1]
 
-    @staticmethod
-    def abort(message: str):
+    def abort(self, message: str, position: int | None = None):
         """
         Abort lexing.
         :param message: Error message
+        :param position: Offset the error is reported at, defaults to the current position
         :return:
         """
-        sys.exit("Lexing error. " + message)
+        if position is None:
+            position = self.current_position
+        line, column = LineIndex(self.source).location(position)
+        raise LexerError(message, position, line, column)
+
+
+def tokenize_chunk(
+    chunk: str | bytes, offset: int, engine: str = "regex"
+) -> tuple[array, array, array, bool, tuple[str, int] | None]:
+    """
+    Tokenize one chunk of a larger source for Lexer.tokenize_parallel().
+    :param chunk: Part of the source that ends right after a newline or at the end of the source
+    :param offset: Position of the chunk in the whole source
+    :param engine: Lexer engine to use
+    :return: Type codes, start offsets and end offsets of the tokens, whether tokenizing stopped early
+        and the message and offset of the lexing error if there was one
+    """
+    lexer = Lexer(chunk, engine)
+    try:
+        stream = lexer.tokenize()
+    except LexerError as e:
+        return array("B"), array("q"), array("q"), True, (e.message, e.position + offset)
+    starts = stream.starts
+    ends = stream.ends
+    if offset:
+        starts = array("q", [start + offset for start in starts])
+        ends = array("q", [end + offset for end in ends])
+    return stream.types, starts, ends, lexer.current_position < len(chunk), None
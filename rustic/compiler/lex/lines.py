@@ -0,0 +1,41 @@
+import re
+from array import array
+from bisect import bisect_right
+
+NEWLINE_PATTERN = re.compile("\n")
+BYTES_NEWLINE_PATTERN = re.compile(b"\n")
+
+
+class LineIndex:
+    """
+    Maps offsets in a source to line and column numbers. Tokens only keep offsets, the table of
+    line start offsets is built the first time a location is asked for, usually for an error message.
+    """
+
+    __slots__ = ("source", "_starts")
+
+    def __init__(self, source: str | bytes):
+        self.source = source
+        self._starts = None
+
+    @property
+    def starts(self) -> array:
+        """
+        Offsets of the first character of every line.
+        """
+        if self._starts is None:
+            newline = NEWLINE_PATTERN if isinstance(self.source, str) else BYTES_NEWLINE_PATTERN
+            starts = array("q", [0])
+            starts.extend(match.end() for match in newline.finditer(self.source))
+            self._starts = starts
+        return self._starts
+
+    def location(self, offset: int) -> tuple[int, int]:
+        """
+        Get the line and column of an offset.
+        :param offset: Offset into the source
+        :return: 1-based line and column numbers
+        """
+        starts = self.starts
+        line = bisect_right(starts, offset)
+        return line, offset - starts[line - 1] + 1
@@ -0,0 +1,283 @@
+from itertools import count
+
+from ..ast.nodes import (
+    ASTNode,
+    BinaryOpNode,
+    ComparisonNode,
+    IfNode,
+    InputNode,
+    LetNode,
+    PrimaryNode,
+    PrintNode,
+    ProgramNode,
+    UnaryOpNode,
+    WhileNode,
+)
+from ..lex.lexer import TokenType
+from .fold import OPERATOR_NODES, assigned, block_body, variable
+
+COMMUTATIVE = {TokenType.PLUS, TokenType.ASTERISK}
+
+TEMPORARY_PREFIX = "_cse"
+
+
+def expression_of(node: ASTNode) -> ASTNode | None:
+    """
+    :return: Expression a LET or PRINT statement evaluates, None for other statements
+    """
+    if type(node) is LetNode:
+        return node.expression
+    if type(node) is PrintNode and isinstance(node.value, ASTNode):
+        return node.value
+    return None
+
+
+class SubexpressionEliminator:
+    """
+    Finds arithmetic computed more than once in a basic block with value numbering, computes it once
+    into a temporary and reads the temporary everywhere else. A basic block is a run of LET, INPUT and
+    PRINT statements and the condition of an IF that ends it. WHILE conditions run again on every
+    iteration and are left alone.
+
+    Every variable holds a value number that changes when LET or INPUT assigns it, so what is
+    computed from a variable before an assignment never matches what is computed after it. Every
+    temporary gets its own name and is assigned once, the emitter declares it where it is computed.
+    """
+
+    def __init__(self, names: set[str]):
+        """
+        :param names: Variables of the program, temporaries are named so they do not clash with them
+        """
+        self.names = names
+        self.temporaries = count()
+        self.numbers = count()
+
+    def temporary(self) -> PrimaryNode:
+        while True:
+            name = f"{TEMPORARY_PREFIX}{next(self.temporaries)}"
+            if name not in self.names:
+                return PrimaryNode(name)
+
+    def program(self, program: ProgramNode) -> ProgramNode:
+        statements = self.statements(program.statements)
+        if len(statements) == len(program.statements) and all(
+            new is old for new, old in zip(statements, program.statements)
+        ):
+            return program
+        return ProgramNode(statements)
+
+    def statements(self, statements: list[ASTNode]) -> list[ASTNode]:
+        """
+        Split every list of statements into basic blocks and rewrite them. Blocks are handled with an
+        explicit stack like in the parser.
+        """
+        result = []
+        # Open blocks as (statements left, rewritten statements, statements of the current basic block,
+        # block, rewritten condition)
+        blocks = [(iter(statements), result, [], None, None)]
+        while blocks:
+            remaining, body, basic_block, block, condition = blocks[-1]
+            node = next(remaining, None)
+            if node is None:
+                body.extend(self.basic_block(basic_block)[0])
+                blocks.pop()
+                if block is not None:
+                    blocks[-1][1].append(rebuild(block, condition, body))
+                continue
+
+            node_type = type(node)
+            if node_type is IfNode:
+                rewritten, condition = self.basic_block(basic_block, node.condition)
+            elif node_type is WhileNode:
+                rewritten, condition = self.basic_block(basic_block)[0], node.condition
+            else:
+                basic_block.append(node)
+                continue
+            body.extend(rewritten)
+            basic_block.clear()
+            blocks.append((iter(block_body(node)), [], [], node, condition))
+
+        return result
+
+    def basic_block(
+        self, statements: list[ASTNode], condition: ASTNode | None = None
+    ) -> tuple[list[ASTNode], ASTNode | None]:
+        """
+        :param condition: Condition of the IF that ends the block
+        :return: Statements computing the repeated arithmetic once, and the rewritten condition
+        """
+        # Value number of every variable, of every operator on value numbers and of every literal
+        values = {}
+        table = {}
+        # Occurrences of every value number, not counting the ones inside a repeated occurrence
+        occurrences = {}
+        numbered = []
+        for node in statements:
+            expression = expression_of(node)
+            if expression is not None:
+                numbers = self.number(expression, values, table)
+                self.count(expression, numbers, occurrences)
+                numbered.append(numbers)
+            if type(node) is LetNode:
+                # A copy holds the same value as the variable it copies
+                values[node.variable] = numbers[id(expression)]
+            elif type(node) is InputNode:
+                values[node.variable] = next(self.numbers)
+        if condition is not None:
+            condition_numbers = self.number(condition, values, table)
+            self.count(condition, condition_numbers, occurrences)
+
+        if all(occurrence == 1 for occurrence in occurrences.values()):
+            return statements, condition
+
+        rewritten = []
+        temporaries = {}
+        numbers = iter(numbered)
+        for node in statements:
+            expression = expression_of(node)
+            if expression is None:
+                rewritten.append(node)
+                continue
+            new = self.rewrite(expression, next(numbers), occurrences, temporaries, rewritten)
+            if new is expression:
+                rewritten.append(node)
+            elif type(node) is LetNode:
+                rewritten.append(LetNode(node.variable, new))
+            else:
+                rewritten.append(PrintNode(new))
+        if condition is not None:
+            condition = self.rewrite(condition, condition_numbers, occurrences, temporaries, rewritten)
+        return rewritten, condition
+
+    def number(self, expression: ASTNode, values: dict, table: dict) -> dict[int, int]:
+        """
+        Number an expression bottom up with an explicit stack. Operands of commutative operators are
+        numbered in order, so a * b and b * a get the same number.
+        :return: Value number of every node of the expression, by node id
+        """
+        numbers = {}
+        stack = [(expression, False)]
+        while stack:
+            item, ready = stack.pop()
+            item_type = type(item)
+            if id(item) in numbers:
+                continue
+            if item_type is PrimaryNode:
+                name = variable(item)
+                if name is None:
+                    key = item.value
+                else:
+                    number = values.get(name)
+                    if number is None:
+                        number = values[name] = next(self.numbers)
+                    numbers[id(item)] = number
+                    continue
+            elif item_type not in OPERATOR_NODES:
+                numbers[id(item)] = next(self.numbers)
+                continue
+            elif not ready:
+                stack.append((item, True))
+                if item_type is UnaryOpNode:
+                    stack.append((item.operand, False))
+                else:
+                    stack.append((item.right, False))
+                    stack.append((item.left, False))
+                continue
+            elif item_type is UnaryOpNode:
+                key = (item.operator, numbers[id(item.operand)])
+            else:
+                left = numbers[id(item.left)]
+                right = numbers[id(item.right)]
+                if item.operator in COMMUTATIVE and item_type is BinaryOpNode and right < left:
+                    left, right = right, left
+                key = (item.operator, left, right)
+
+            number = table.get(key)
+            if number is None:
+                number = table[key] = next(self.numbers)
+            numbers[id(item)] = number
+
+        return numbers
+
+    def count(self, expression: ASTNode, numbers: dict[int, int], occurrences: dict[int, int]):
+        """
+        Count the arithmetic of an expression top down. A repeated occurrence is replaced as a whole,
+        so what is inside it is not counted again.
+        """
+        stack = [expression]
+        while stack:
+            item = stack.pop()
+            item_type = type(item)
+            if item_type is BinaryOpNode:
+                number = numbers[id(item)]
+                if number in occurrences:
+                    occurrences[number] += 1
+                    continue
+                occurrences[number] = 1
+            if item_type is UnaryOpNode:
+                stack.append(item.operand)
+            elif item_type is BinaryOpNode or item_type is ComparisonNode:
+                stack.append(item.right)
+                stack.append(item.left)
+
+    def rewrite(
+        self,
+        expression: ASTNode,
+        numbers: dict[int, int],
+        occurrences: dict[int, int],
+        temporaries: dict[int, PrimaryNode],
+        statements: list[ASTNode],
+    ) -> ASTNode:
+        """
+        Replace the repeated arithmetic of an expression by temporaries, bottom up with an explicit
+        stack. The first occurrence is assigned to a new temporary right before the statement.
+        :param statements: Rewritten statements of the block, temporaries are appended to it
+        :return: The rewritten expression, the node itself if nothing changed
+        """
+        results = []
+        stack = [(expression, False)]
+        while stack:
+            item, ready = stack.pop()
+            item_type = type(item)
+            if item_type not in OPERATOR_NODES:
+                results.append(item)
+            elif not ready:
+                temporary = temporaries.get(numbers[id(item)]) if item_type is BinaryOpNode else None
+                if temporary is not None:
+                    results.append(temporary)
+                    continue
+                stack.append((item, True))
+                if item_type is UnaryOpNode:
+                    stack.append((item.operand, False))
+                else:
+                    stack.append((item.right, False))
+                    stack.append((item.left, False))
+            elif item_type is UnaryOpNode:
+                operand = results.pop()
+                results.append(item if operand is item.operand else UnaryOpNode(item.operator, operand))
+            else:
+                right = results.pop()
+                left = results.pop()
+                node = item if left is item.left and right is item.right else item_type(left, item.operator, right)
+                number = numbers[id(item)]
+                if item_type is BinaryOpNode and occurrences[number] > 1:
+                    temporary = temporaries[number] = self.temporary()
+                    statements.append(LetNode(temporary.value, node))
+                    node = temporary
+                results.append(node)
+
+        return results[0]
+
+
+def rebuild(block: IfNode | WhileNode, condition: ASTNode, body: list[ASTNode]) -> IfNode | WhileNode:
+    old = block_body(block)
+    if condition is block.condition and len(body) == len(old) and all(new is old for new, old in zip(body, old)):
+        return block
+    return type(block)(condition, body)
+
+
+def eliminate_common_subexpressions(program: ProgramNode) -> ProgramNode:
+    """
+    Common subexpression elimination, see SubexpressionEliminator.
+    """
+    return SubexpressionEliminator(assigned(program.statements)).program(program)
@@ -0,0 +1,217 @@
+from ..ast.nodes import (
+    ASTNode,
+    BinaryOpNode,
+    ComparisonNode,
+    IfNode,
+    InputNode,
+    LetNode,
+    PrimaryNode,
+    PrintNode,
+    ProgramNode,
+    UnaryOpNode,
+    WhileNode,
+)
+from ..lex.lexer import TokenType
+from .fold import block_body, boolean, integer, variable
+
+
+def uses(expression: ASTNode) -> set[str]:
+    """
+    Variables an expression reads.
+    """
+    names = set()
+    stack = [expression]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is PrimaryNode:
+            name = variable(node)
+            if name is not None:
+                names.add(name)
+        elif node_type is BinaryOpNode or node_type is ComparisonNode:
+            stack.append(node.left)
+            stack.append(node.right)
+        elif node_type is UnaryOpNode:
+            stack.append(node.operand)
+    return names
+
+
+def may_panic(expression: ASTNode) -> bool:
+    """
+    Whether evaluating an expression can panic in every build of the Rust program. Only dividing by
+    something other than a nonzero literal counts, overflow panics in debug builds and wraps in
+    release builds, so computations that are not needed are removed even if they overflow.
+    """
+    stack = [expression]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is BinaryOpNode or node_type is ComparisonNode:
+            if node_type is BinaryOpNode and node.operator == TokenType.SLASH and not integer(node.right):
+                return True
+            stack.append(node.left)
+            stack.append(node.right)
+        elif node_type is UnaryOpNode:
+            stack.append(node.operand)
+    return False
+
+
+def rebuild(block: IfNode | WhileNode, body: list[ASTNode]) -> IfNode | WhileNode:
+    old = block_body(block)
+    if len(body) == len(old) and all(new is old for new, old in zip(body, old)):
+        return block
+    return type(block)(block.condition, body)
+
+
+class DeadCodeEliminator:
+    """
+    Removes IF and WHILE blocks whose condition is constant false, assignments whose value is never
+    read and IF blocks left empty. Which variables are live is found with a backward liveness
+    analysis. INPUT and PRINT always stay, and so does the first assignment of every variable that
+    is assigned again later: the emitter declares a variable where it is first assigned, so removing
+    it would move the declaration into another scope.
+    """
+
+    def __init__(self):
+        # First LET of every variable, by node id
+        self.declarations = set()
+        # Variables assigned by a statement that is kept, filled in while sweeping backwards
+        self.kept = set()
+        # Variables read by every IF and WHILE before they are assigned in it, by node id
+        self.exposed = {}
+
+    def program(self, program: ProgramNode) -> ProgramNode:
+        statements = self.prune(program.statements)
+        self.summarize(statements)
+        statements = self.sweep(statements)
+        if len(statements) == len(program.statements) and all(
+            new is old for new, old in zip(statements, program.statements)
+        ):
+            return program
+        return ProgramNode(statements)
+
+    def prune(self, statements: list[ASTNode]) -> list[ASTNode]:
+        """
+        Drop the blocks that never run, and note where every variable is first assigned in the rest.
+        """
+        assigned = set()
+        pruned = []
+        # Open blocks as (statements left, kept statements, block)
+        blocks = [(iter(statements), pruned, None)]
+        while blocks:
+            remaining, body, block = blocks[-1]
+            node = next(remaining, None)
+            if node is None:
+                blocks.pop()
+                if block is not None:
+                    blocks[-1][1].append(rebuild(block, body))
+                continue
+
+            node_type = type(node)
+            if node_type is IfNode or node_type is WhileNode:
+                if boolean(node.condition) is False:
+                    continue
+                blocks.append((iter(block_body(node)), [], node))
+                continue
+
+            if node_type is LetNode and node.variable not in assigned:
+                self.declarations.add(id(node))
+            if node_type is LetNode or node_type is InputNode:
+                assigned.add(node.variable)
+            body.append(node)
+
+        return pruned
+
+    def summarize(self, statements: list[ASTNode]):
+        """
+        Find the variables every block reads before assigning them, inner blocks first. A block may not
+        run at all, so it never counts as assigning anything.
+        """
+        stack = [(node, False) for node in statements]
+        while stack:
+            node, ready = stack.pop()
+            node_type = type(node)
+            if node_type is not IfNode and node_type is not WhileNode:
+                continue
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in block_body(node))
+                continue
+
+            live = set()
+            for child in reversed(block_body(node)):
+                self.transfer(child, live)
+            self.exposed[id(node)] = live | uses(node.condition)
+
+    def transfer(self, node: ASTNode, live: set[str]):
+        """
+        Update the variables live after a statement to the ones live before it.
+        """
+        node_type = type(node)
+        if node_type is LetNode:
+            live.discard(node.variable)
+            live |= uses(node.expression)
+        elif node_type is InputNode:
+            live.discard(node.variable)
+        elif node_type is PrintNode:
+            if isinstance(node.value, ASTNode):
+                live |= uses(node.value)
+        elif node_type is IfNode or node_type is WhileNode:
+            live |= self.exposed[id(node)]
+
+    def sweep(self, statements: list[ASTNode]) -> list[ASTNode]:
+        """
+        Walk the statements backwards with the variables that are live after each one and drop the
+        assignments nothing reads. The body of a loop is swept with what is live at its condition,
+        which is everything live after the loop and everything the loop reads before assigning it.
+        """
+        # Open lists as [statements, index of the next statement, live variables, kept statements
+        # in reverse, block]
+        frames = [[statements, len(statements) - 1, set(), [], None]]
+        while True:
+            frame = frames[-1]
+            statements, index, live, kept, block = frame
+            if index < 0:
+                frames.pop()
+                body = kept[::-1]
+                if block is None:
+                    return body
+                parent = frames[-1]
+                parent[1] -= 1
+                if type(block) is IfNode:
+                    if not body and not may_panic(block.condition):
+                        continue
+                    # The body may not run, what is live after the IF stays live
+                    parent[2] |= live | uses(block.condition)
+                else:
+                    parent[2] |= self.exposed[id(block)]
+                parent[3].append(rebuild(block, body))
+                continue
+
+            node = statements[index]
+            node_type = type(node)
+            if node_type is IfNode:
+                frames.append([block_body(node), len(block_body(node)) - 1, set(live), [], node])
+                continue
+            if node_type is WhileNode:
+                entry = live | self.exposed[id(node)]
+                frames.append([node.body, len(node.body) - 1, entry, [], node])
+                continue
+
+            frame[1] -= 1
+            if node_type is LetNode and node.variable not in live and not may_panic(node.expression):
+                # Everything after the statement has been swept, so the assignments that are kept
+                # later are known
+                if id(node) not in self.declarations or node.variable not in self.kept:
+                    continue
+            if node_type is LetNode or node_type is InputNode:
+                self.kept.add(node.variable)
+            self.transfer(node, live)
+            kept.append(node)
+
+
+def eliminate_dead_code(program: ProgramNode) -> ProgramNode:
+    """
+    Dead code and dead store elimination, see DeadCodeEliminator.
+    """
+    return DeadCodeEliminator().program(program)
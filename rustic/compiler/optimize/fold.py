@@ -0,0 +1,278 @@
+import re
+
+from ..ast.nodes import (
+    ASTNode,
+    BinaryOpNode,
+    ComparisonNode,
+    IfNode,
+    InputNode,
+    LetNode,
+    PrimaryNode,
+    PrintNode,
+    ProgramNode,
+    UnaryOpNode,
+    WhileNode,
+)
+from ..lex.lexer import TokenType
+
+# Variables without a type are i32 in the emitted Rust. i32::MIN is left out because its literal only
+# exists negated in Rust.
+I32_MIN = -(2 ** 31) + 1
+I32_MAX = 2 ** 31 - 1
+
+INTEGER_PATTERN = re.compile(r"-?[0-9]+")
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+TRUE = PrimaryNode("true")
+FALSE = PrimaryNode("false")
+
+COMPARISONS = {
+    TokenType.EQ: lambda left, right: left == right,
+    TokenType.EQEQ: lambda left, right: left == right,
+    TokenType.NOTEQ: lambda left, right: left != right,
+    TokenType.LT: lambda left, right: left < right,
+    TokenType.LTEQ: lambda left, right: left <= right,
+    TokenType.GT: lambda left, right: left > right,
+    TokenType.GTEQ: lambda left, right: left >= right,
+}
+
+
+OPERATOR_NODES = (BinaryOpNode, ComparisonNode, UnaryOpNode)
+
+
+def integer(node: ASTNode) -> int | None:
+    """
+    :return: Value of an integer literal that fits an i32, None for anything else
+    """
+    if type(node) is not PrimaryNode or not INTEGER_PATTERN.fullmatch(node.value):
+        return None
+    value = int(node.value)
+    return value if I32_MIN <= value <= I32_MAX else None
+
+
+def variable(node: ASTNode) -> str | None:
+    """
+    :return: Name of the variable a leaf reads, None for literals
+    """
+    if type(node) is not PrimaryNode or node is TRUE or node is FALSE:
+        return None
+    return node.value if IDENTIFIER_PATTERN.fullmatch(node.value) else None
+
+
+def boolean(node: ASTNode) -> bool | None:
+    """
+    :return: Value of a condition folded to a constant, None if it is not constant
+    """
+    if node is TRUE:
+        return True
+    if node is FALSE:
+        return False
+    return None
+
+
+def arithmetic(operator: TokenType, left: int, right: int) -> int | None:
+    """
+    Evaluate a binary operator like Rust does on i32.
+    :return: The result, None when it overflows or divides by zero and has to be left to run time
+    """
+    if operator == TokenType.PLUS:
+        value = left + right
+    elif operator == TokenType.MINUS:
+        value = left - right
+    elif operator == TokenType.ASTERISK:
+        value = left * right
+    elif operator == TokenType.SLASH:
+        if right == 0:
+            return None
+        # Rust rounds towards zero, floor division does not for negative results
+        value = abs(left) // abs(right)
+        if (left < 0) != (right < 0):
+            value = -value
+    else:
+        return None
+    return value if I32_MIN <= value <= I32_MAX else None
+
+
+def assigned(statements: list[ASTNode]) -> set[str]:
+    """
+    Variables a list of statements assigns with LET or INPUT, in nested blocks too.
+    """
+    names = set()
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is LetNode or node_type is InputNode:
+            names.add(node.variable)
+        elif node_type is IfNode:
+            stack.extend(node.then_branch)
+        elif node_type is WhileNode:
+            stack.extend(node.body)
+    return names
+
+
+def block_body(node: IfNode | WhileNode) -> list[ASTNode]:
+    return node.then_branch if type(node) is IfNode else node.body
+
+
+class ConstantFolder:
+    """
+    Folds operators on integer literals and replaces variables by the constants they are known to
+    hold. A constant assigned by LET is known until the variable is assigned again, read by INPUT
+    or assigned anywhere in an enclosing loop. After an IF the constants both paths agree on are
+    known.
+
+    Nodes are never changed, leaves are shared between statements. Changed statements are rebuilt
+    and everything else is kept as it is.
+    """
+
+    def __init__(self):
+        # Leaves of the folded constants, by value
+        self.leaves = {}
+        # Whether an operator on known values overflows or divides by zero
+        self.panics = False
+
+    def leaf(self, value: int) -> PrimaryNode:
+        node = self.leaves.get(value)
+        if node is None:
+            node = self.leaves[value] = PrimaryNode(str(value))
+        return node
+
+    def program(self, program: ProgramNode) -> ProgramNode:
+        statements = self.statements(program.statements, {})
+        if all(new is old for new, old in zip(statements, program.statements)):
+            return program
+        return ProgramNode(statements)
+
+    def statements(self, statements: list[ASTNode], constants: dict[str, int]) -> list[ASTNode]:
+        """
+        Fold a list of statements. Blocks are handled with an explicit stack like in the parser.
+        :param constants: Values of the variables known to be constant, updated for the end of the list
+        """
+        folded = []
+        # Open blocks as (statements left, folded statements, constants, block, folded condition)
+        blocks = [(iter(statements), folded, constants, None, None)]
+        while blocks:
+            remaining, body, constants, block, condition = blocks[-1]
+            node = next(remaining, None)
+            if node is None:
+                blocks.pop()
+                if block is None:
+                    continue
+                _, parent, outer, _, _ = blocks[-1]
+                parent.append(self.rebuild_block(block, condition, body))
+                if type(block) is IfNode:
+                    taken = boolean(condition)
+                    if taken:
+                        outer.clear()
+                        outer.update(constants)
+                    elif taken is None:
+                        for name in [name for name, value in outer.items() if constants.get(name) != value]:
+                            del outer[name]
+                # The variables a loop assigns were forgotten before entering it
+                continue
+
+            node_type = type(node)
+            if node_type is LetNode:
+                expression = self.expression(node.expression, constants)
+                value = integer(expression)
+                if value is None:
+                    constants.pop(node.variable, None)
+                else:
+                    constants[node.variable] = value
+                body.append(node if expression is node.expression else LetNode(node.variable, expression))
+            elif node_type is InputNode:
+                constants.pop(node.variable, None)
+                body.append(node)
+            elif node_type is PrintNode:
+                if isinstance(node.value, ASTNode):
+                    expression = self.expression(node.value, constants)
+                    body.append(node if expression is node.value else PrintNode(expression))
+                else:
+                    body.append(node)
+            elif node_type is IfNode:
+                condition = self.expression(node.condition, constants)
+                blocks.append((iter(node.then_branch), [], dict(constants), node, condition))
+            elif node_type is WhileNode:
+                # The condition and the body also run after the body has changed its variables
+                for name in assigned(node.body):
+                    constants.pop(name, None)
+                condition = self.expression(node.condition, constants)
+                blocks.append((iter(node.body), [], dict(constants), node, condition))
+            else:
+                body.append(node)
+
+        return folded
+
+    def rebuild_block(self, block: IfNode | WhileNode, condition: ASTNode, body: list[ASTNode]) -> ASTNode:
+        old = block_body(block)
+        if condition is block.condition and all(new is old for new, old in zip(body, old)):
+            return block
+        return type(block)(condition, body)
+
+    def expression(self, node: ASTNode, constants: dict[str, int]) -> ASTNode:
+        """
+        Fold an expression bottom up with an explicit stack. A comparison is only folded to true or
+        false at the top of a condition, Rust does not compare the result of a comparison.
+        :return: The folded expression, the node itself if nothing changed
+        """
+        results = []
+        stack = [(node, False)]
+        while stack:
+            item, ready = stack.pop()
+            item_type = type(item)
+            if item_type is PrimaryNode:
+                value = constants.get(item.value) if constants else None
+                results.append(item if value is None else self.leaf(value))
+            elif item_type not in OPERATOR_NODES:
+                results.append(item)
+            elif not ready:
+                stack.append((item, True))
+                if item_type is UnaryOpNode:
+                    stack.append((item.operand, False))
+                else:
+                    stack.append((item.right, False))
+                    stack.append((item.left, False))
+            elif item_type is UnaryOpNode:
+                operand = results.pop()
+                value = integer(operand)
+                if value is not None and item.operator == TokenType.MINUS:
+                    results.append(self.leaf(-value))
+                elif value is not None and item.operator == TokenType.PLUS:
+                    results.append(operand)
+                else:
+                    results.append(item if operand is item.operand else UnaryOpNode(item.operator, operand))
+            else:
+                right = results.pop()
+                left = results.pop()
+                left_value = integer(left)
+                right_value = integer(right)
+                if left_value is not None and right_value is not None:
+                    if item_type is BinaryOpNode:
+                        value = arithmetic(item.operator, left_value, right_value)
+                        if value is None:
+                            self.panics = True
+                            results.append(item)
+                        else:
+                            results.append(self.leaf(value))
+                        continue
+                    elif item is node and item.operator in COMPARISONS:
+                        results.append(TRUE if COMPARISONS[item.operator](left_value, right_value) else FALSE)
+                        continue
+                if left is item.left and right is item.right:
+                    results.append(item)
+                else:
+                    results.append(item_type(left, item.operator, right))
+
+        return results[0]
+
+
+def fold_constants(program: ProgramNode) -> ProgramNode:
+    """
+    Constant folding and propagation, see ConstantFolder. A program with an operator that is known to
+    overflow or divide by zero is left as it is. rustc checks constants too and would refuse to
+    compile the folded program, instead of panicking at run time like the program does.
+    """
+    folder = ConstantFolder()
+    folded = folder.program(program)
+    return program if folder.panics else folded
@@ -0,0 +1,23 @@
+from typing import Callable
+
+from ..ast.nodes import ProgramNode
+from .cse import eliminate_common_subexpressions
+from .dce import eliminate_dead_code
+from .fold import fold_constants
+
+# Passes in the order they run, each takes a program and returns the optimized program
+PASSES: list[Callable[[ProgramNode], ProgramNode]] = [
+    fold_constants,
+    eliminate_dead_code,
+    eliminate_common_subexpressions,
+]
+
+
+def optimize(program: ProgramNode) -> ProgramNode:
+    """
+    Run every pass over a program. Passes build new nodes for what they change and share the rest,
+    the program that was passed in is left as it is.
+    """
+    for optimization in PASSES:
+        program = optimization(program)
+    return program
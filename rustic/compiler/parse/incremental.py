@@ -0,0 +1,246 @@
+from ..ast.nodes import ASTNode, IfNode, InputNode, LetNode, ProgramNode, WhileNode
+from ..ast.symbols import SymbolTable
+from ..lex.lexer import Lexer, LexerError, TokenType
+from .parser import Parser, SyntaxError
+
+
+class Region:
+    """
+    The part of the source that belongs to one top-level statement: the statement itself and the
+    blank lines after it. The first region also holds the blank lines at the start of the source.
+    A region whose text does not parse has no statement and keeps the error instead.
+    """
+
+    __slots__ = ("statement", "length", "definitions", "error")
+
+    statement: ASTNode | None
+    length: int
+    definitions: tuple[str, ...]
+    error: SyntaxError | LexerError | None
+
+    def __init__(
+        self,
+        statement: ASTNode | None,
+        length: int,
+        definitions: tuple[str, ...],
+        error: SyntaxError | LexerError | None = None,
+    ):
+        self.statement = statement
+        self.length = length
+        # Variables assigned anywhere in the statement
+        self.definitions = definitions
+        self.error = error
+
+    def __repr__(self):
+        return f"Region({self.statement}, {self.length}, {self.definitions}, {self.error})"
+
+
+def definitions(statement: ASTNode) -> tuple[str, ...]:
+    """
+    Variables defined by LET and INPUT statements anywhere inside a statement.
+    """
+    names = []
+    stack = [statement]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (LetNode, InputNode)):
+            names.append(node.variable)
+        elif isinstance(node, IfNode):
+            stack.extend(reversed(node.then_branch))
+        elif isinstance(node, WhileNode):
+            stack.extend(reversed(node.body))
+    return tuple(dict.fromkeys(names))
+
+
+class IncrementalParser:
+    """
+    Keeps a program parsed while its source is edited. The source is split into one region per
+    top-level statement. Since tokens never cross newlines and blocks are closed by ENDIF and
+    ENDWHILE, an edit is re-lexed and re-parsed from the start of the region it falls in until the
+    tokens line up with the start of an unchanged region again. The statements of every other
+    region are reused as they are.
+
+    A cursor is kept on the region of the last edit together with the variables defined before it,
+    so the work for an edit is proportional to the edited statements and the distance from the
+    previous edit, apart from copying the source text.
+    """
+
+    source: str
+    regions: list[Region]
+
+    def __init__(self, source: str):
+        """
+        :param source: Tiny BASIC source code
+        """
+        self.source = source
+        self.regions = []
+        # Statement of every region, kept next to the regions so that a program is a single copy
+        self.statements = []
+        # Regions that did not parse, in no particular order
+        self.damaged = []
+        # Shared leaves of all parses, like a single Parser would have
+        self.leaves = {}
+
+        # Index and offset of the region at the cursor, and how many regions before it define each variable
+        self.cursor = 0
+        self.cursor_start = 0
+        self.defined = {}
+
+        self.reparse(0, 0, len(source))
+
+    def program(self) -> ProgramNode:
+        """
+        :return: The program as a full parse of the current source would return it
+        """
+        errors = self.errors
+        if errors:
+            raise errors[0]
+        return ProgramNode(list(self.statements))
+
+    @property
+    def errors(self) -> list[SyntaxError | LexerError]:
+        """
+        Errors of the regions that do not parse, in source order.
+        """
+        return sorted((region.error for region in self.damaged), key=lambda error: error.position)
+
+    def edit(self, start: int, end: int, text: str) -> list[SyntaxError | LexerError]:
+        """
+        Replace source[start:end] with text and update the parse.
+        :return: Errors of the new source, empty if it parses
+        """
+        if not 0 <= start <= end <= len(self.source):
+            raise ValueError(f"Edit {start}:{end} is outside of the source")
+
+        self.source = self.source[:start] + text + self.source[end:]
+        delta = len(text) - (end - start)
+
+        damaged = list(self.damaged)
+
+        self.seek(start)
+        first = self.cursor
+        regions = self.regions
+        # Every region that starts inside the edited text is parsed again
+        last = first + 1
+        boundary = self.cursor_start + (regions[first].length if regions else 0)
+        while last < len(regions) and boundary < end:
+            boundary += regions[last].length
+            last += 1
+        if last >= len(regions):
+            boundary = len(self.source)
+        else:
+            boundary += delta
+
+        self.reparse(first, min(last, len(regions)), boundary)
+
+        # Regions that failed to parse before are retried, the edit may have defined a variable they use
+        for region in damaged:
+            if region in self.damaged:
+                self.seek_index(self.regions.index(region))
+                self.reparse(self.cursor, self.cursor + 1, self.cursor_start + region.length)
+
+        return self.errors
+
+    def seek(self, position: int):
+        """
+        Move the cursor to the region that contains a source offset.
+        """
+        regions = self.regions
+        while self.cursor > 0 and self.cursor_start > position:
+            self.step_back()
+        while self.cursor + 1 < len(regions) and self.cursor_start + regions[self.cursor].length <= position:
+            self.step_forward()
+
+    def seek_index(self, index: int):
+        while self.cursor > index:
+            self.step_back()
+        while self.cursor < index:
+            self.step_forward()
+
+    def step_forward(self):
+        region = self.regions[self.cursor]
+        for name in region.definitions:
+            self.defined[name] = self.defined.get(name, 0) + 1
+        self.cursor_start += region.length
+        self.cursor += 1
+
+    def step_back(self):
+        self.cursor -= 1
+        region = self.regions[self.cursor]
+        for name in region.definitions:
+            self.defined[name] -= 1
+        self.cursor_start -= region.length
+
+    def reparse(self, first: int, last: int, boundary: int):
+        """
+        Parse the source again from the start of region first, which has to be at the cursor. Parsing
+        goes on past the old regions up to last if the statements do not end at their boundary or
+        if a variable they defined is not defined anymore, as later statements may depend on it.
+        :param first: Index of the first region to replace
+        :param last: Index after the last region to replace
+        :param boundary: Offset in the new source where region last starts
+        """
+        regions = self.regions
+        start = self.cursor_start
+
+        symbols = SymbolTable()
+        for name, count in self.defined.items():
+            if count:
+                symbols.define(name)
+        replaced = {name for region in regions[first:last] for name in region.definitions}
+
+        parsed = []
+        try:
+            parser = Parser(Lexer(self.source, position=start), symbols=symbols)
+            parser.leaves = self.leaves
+            while True:
+                token = parser.current_token
+                if token.type == TokenType.EOF:
+                    boundary = len(self.source)
+                    last = len(regions)
+                    break
+
+                # Statements that ran past the boundary swallowed the regions they ran into
+                while last < len(regions) and boundary < token.start:
+                    replaced.update(regions[last].definitions)
+                    boundary += regions[last].length
+                    last += 1
+                if token.start == boundary and all(name in symbols for name in replaced):
+                    break
+
+                position = token.start
+                statement = parser.statement()
+                if statement is not None:
+                    parsed.append((position, statement))
+        except (SyntaxError, LexerError) as e:
+            # The parsed text is kept as one region until an edit fixes it
+            while last < len(regions) and boundary <= e.position:
+                replaced.update(regions[last].definitions)
+                boundary += regions[last].length
+                last += 1
+            if last >= len(regions):
+                boundary = len(self.source)
+            new_regions = [Region(None, boundary - start, tuple(replaced), e)]
+        else:
+            new_regions = []
+            for index, (position, statement) in enumerate(parsed):
+                region_start = start if index == 0 else position
+                region_end = parsed[index + 1][0] if index + 1 < len(parsed) else boundary
+                new_regions.append(Region(statement, region_end - region_start, definitions(statement)))
+
+        # The cursor is kept on the region before, which is not changed
+        if first > 0:
+            self.step_back()
+
+        removed = regions[first:last]
+        self.damaged = [region for region in self.damaged if region not in removed]
+        self.damaged.extend(region for region in new_regions if region.error is not None)
+
+        if not new_regions:
+            # Only blank lines are left, they go to the region before or become the start of the next one
+            if first > 0:
+                regions[first - 1].length += boundary - start
+            elif last < len(regions):
+                regions[last].length += boundary - start
+        regions[first:last] = new_regions
+        self.statements[first:last] = [region.statement for region in new_regions]
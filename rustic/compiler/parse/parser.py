@@ -1,4 +1,4 @@
-import logging
+from typing import Iterator
 
 from ..ast.nodes import (
     ASTNode,
@@ -13,23 +13,63 @@ from ..ast.nodes import (
     InputNode,
     ProgramNode,
 )
-from ..lex.lexer import TokenType, Lexer, Token
+from ..ast.symbols import SymbolTable
+from ..diagnostics import Diagnostics
+from ..lex.lexer import TokenType, Lexer, Token, TokenReader
+from ..lex.lines import LineIndex
+from .trace import Tracer, attach
+
+
+ADDITIVE = 1
+MULTIPLICATIVE = 2
+
+BINARY_PRECEDENCE = {
+    TokenType.PLUS: ADDITIVE,
+    TokenType.MINUS: ADDITIVE,
+    TokenType.ASTERISK: MULTIPLICATIVE,
+    TokenType.SLASH: MULTIPLICATIVE,
+}
 
 
 class SyntaxError(Exception):
-    pass
+    def __init__(self, message: str, position: int | None = None, line: int | None = None, column: int | None = None):
+        super().__init__(message)
+        self.message = message
+        self.position = position
+        self.line = line
+        self.column = column
 
 
 class Parser:
-    def __init__(self, lexer: Lexer):
+    def __init__(
+        self,
+        lexer: Lexer | TokenReader,
+        tracer: Tracer | None = None,
+        symbols: SymbolTable | None = None,
+        diagnostics: Diagnostics | None = None,
+    ):
+        """
+        :param lexer: Source of tokens, a Lexer or a reader over an already tokenized stream
+        :param tracer: Receives enter and exit events for every grammar production
+        :param symbols: Variables already defined, for parsing a program from the middle
+        :param diagnostics: Collects syntax errors, parsing then recovers from them instead of
+            raising. A program parsed with errors cannot be emitted.
+        """
         self.current_token = None
         self.peek_token = None
         self.lexer = lexer
+        self.lines = None
+        self.diagnostics = diagnostics
 
-        self.symbols = set()
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        # Identical leaves are hash-consed, every occurrence of a number or variable shares one node
+        self.leaves = {}
         self.labels_declared = set()
         self.labels_gotoed = set()
 
+        if tracer is not None:
+            attach(self, tracer)
+
         self.next_token()
         self.next_token()
 
@@ -41,9 +81,7 @@ class Parser:
 
     def match(self, kind: TokenType):
         if not self.check_token(kind):
-            raise SyntaxError(
-                f"Expected {kind.name} but got {self.current_token.type.name}"
-            )
+            self.abort(f"Expected {kind.name} but got {self.current_token.type.name}")
         self.next_token()
 
     def next_token(self) -> Token:
@@ -51,29 +89,139 @@ class Parser:
         self.peek_token = self.lexer.next_token()
 
     def abort(self, message: str):
-        raise SyntaxError(message)
+        # Line and column are only looked up once there is an error to report
+        if self.lines is None:
+            self.lines = LineIndex(self.lexer.source)
+        position = self.current_token.start
+        line, column = self.lines.location(position)
+        raise SyntaxError(message, position, line, column)
 
     def program(self):
-        logging.info("program")
+        return ProgramNode(list(self.statements()))
+
+    def statements(self) -> Iterator[ASTNode]:
+        """
+        Parse the program one top-level statement at a time. Nothing is kept of a statement once it
+        has been yielded, the symbol table and the shared leaves only grow with the number of
+        distinct names and numbers.
+        """
         # Consume all newlines at the start
         while self.check_token(TokenType.NEWLINE):
             self.next_token()
 
-        statements = []
         while not self.check_token(TokenType.EOF):
             stmt = self.statement()
             if stmt is None:
                 continue
 
-            statements.append(stmt)
+            yield stmt
+
+    def statement(self) -> ASTNode | None:
+        """
+        statement ::= "IF" comparison "THEN" nl {statement} "ENDIF"
+                    | "WHILE" comparison "REPEAT" nl {statement} "ENDWHILE"
+                    | simple_statement
+
+        Blocks are kept on an explicit stack of open IF/WHILE statements instead of recursing
+        for every nested body, so nesting depth is not limited by the Python call stack.
+        """
+        # Open blocks as (closing token, node class, condition, body)
+        blocks = []
+        # Block whose IF or WHILE line is being parsed
+        opening = None
+        while True:
+            try:
+                if blocks and self.check_token(blocks[-1][0]):
+                    self.next_token()
+                    _, node_class, condition, body = blocks.pop()
+                    node = node_class(condition, body)
+                elif self.check_token(TokenType.IF):
+                    opening = (TokenType.ENDIF, IfNode)
+                    self.next_token()
+                    condition = self.comparison()
+
+                    self.match(TokenType.THEN)
+                    self.nl()
+
+                    blocks.append((TokenType.ENDIF, IfNode, condition, []))
+                    opening = None
+                    continue
+                elif self.check_token(TokenType.WHILE):
+                    opening = (TokenType.ENDWHILE, WhileNode)
+                    self.next_token()
+                    condition = self.comparison()
 
-        return ProgramNode(statements)
+                    self.match(TokenType.REPEAT)
+                    self.nl()
 
-    def statement(self) -> ASTNode:
+                    blocks.append((TokenType.ENDWHILE, WhileNode, condition, []))
+                    opening = None
+                    continue
+                else:
+                    node = self.simple_statement()
+            except SyntaxError as e:
+                if self.diagnostics is None:
+                    raise
+                self.diagnostics.report(e)
+                if opening is not None:
+                    # Keep the block open so that its body and closing keyword still parse
+                    blocks.append((*opening, None, []))
+                    opening = None
+                if self.synchronize(blocks) and blocks:
+                    continue
+                # Close whatever is still open at the end of the source
+                node = None
+                while blocks:
+                    _, node_class, condition, body = blocks.pop()
+                    node = node_class(condition, body)
+                    if blocks:
+                        blocks[-1][3].append(node)
+                return node
+
+            if not blocks:
+                return node
+            if node is not None:
+                blocks[-1][3].append(node)
+
+    def synchronize(self, blocks: list) -> bool:
+        """
+        Skip the rest of a statement that failed to parse. Stops after the next newline, or at an
+        ENDIF or ENDWHILE that closes an open block, the blocks left open inside that one are
+        closed. Closing keywords without an open block are skipped.
+        :param blocks: Open blocks of statement()
+        :return: False when the source ended, or too many errors were reported
+        """
+        while True:
+            if self.diagnostics.full:
+                # Stop as if the source ended here
+                position = self.current_token.start
+                self.current_token = self.peek_token = Token(TokenType.EOF, "", position, position)
+
+            kind = self.current_token.type
+            if kind == TokenType.EOF:
+                return False
+            if kind == TokenType.NEWLINE:
+                while self.check_token(TokenType.NEWLINE):
+                    self.next_token()
+                return True
+            if kind == TokenType.ENDIF or kind == TokenType.ENDWHILE:
+                depth = len(blocks) - 1
+                while depth >= 0 and blocks[depth][0] != kind:
+                    depth -= 1
+                if depth >= 0:
+                    while len(blocks) > depth + 1:
+                        _, node_class, condition, body = blocks.pop()
+                        blocks[-1][3].append(node_class(condition, body))
+                    return True
+            self.next_token()
+
+    def simple_statement(self) -> ASTNode | None:
+        """
+        simple_statement ::= "PRINT" (expression | string) | "LET" ident "=" expression | "INPUT" ident | nl
+        """
         if self.check_token(TokenType.NEWLINE):
             self.nl()
         elif self.check_token(TokenType.PRINT):
-            logging.info("print")
             self.next_token()
 
             if self.check_token(TokenType.STRING):
@@ -83,41 +231,6 @@ class Parser:
             else:
                 expression = self.expression()
                 return PrintNode(expression)
-        elif self.check_token(TokenType.IF):
-            logging.info("if")
-            self.next_token()
-            condition = self.comparison()
-
-            self.match(TokenType.THEN)
-            self.nl()
-
-            then_branch = []
-            while not self.check_token(TokenType.ENDIF):
-                stmt = self.statement()
-                if stmt is None:
-                    continue
-
-                then_branch.append(stmt)
-
-            self.match(TokenType.ENDIF)
-            return IfNode(condition, then_branch)
-        elif self.check_token(TokenType.WHILE):
-            logging.info("while")
-            self.next_token()
-            condition = self.comparison()
-
-            self.match(TokenType.REPEAT)
-            self.nl()
-
-            body = []
-            while not self.check_token(TokenType.ENDWHILE):
-                stmt = self.statement()
-                if stmt is None:
-                    continue
-
-                body.append(stmt)
-            self.match(TokenType.ENDWHILE)
-            return WhileNode(condition, body)
         # elif self.check_token(TokenType.LABEL):
         #     logging.info("label")
         #     self.next_token()
@@ -133,11 +246,10 @@ class Parser:
         #     self.labels_gotoed.add(self.current_token.value)
         #     self.match(TokenType.IDENT)
         elif self.check_token(TokenType.LET):
-            logging.info("let")
             self.next_token()
             variable = self.current_token.value
-            if self.current_token.value not in self.symbols:
-                self.symbols.add(self.current_token.value)
+            if self.check_token(TokenType.IDENT):
+                self.symbols.define(variable, TokenType.LET, self.current_token.start)
 
             self.match(TokenType.IDENT)
             self.match(TokenType.EQ)
@@ -145,36 +257,20 @@ class Parser:
             expression = self.expression()
             return LetNode(variable, expression)
         elif self.check_token(TokenType.INPUT):
-            logging.info("input")
             self.next_token()
             variable = self.current_token.value
-            if self.current_token.value not in self.symbols:
-                self.symbols.add(self.current_token.value)
+            if self.check_token(TokenType.IDENT):
+                self.symbols.define(variable, TokenType.INPUT, self.current_token.start)
 
             self.match(TokenType.IDENT)
             return InputNode(variable)
         else:
             self.abort(f"Invalid statement at {self.current_token.value}")
 
-    def term(self) -> ASTNode:
-        """
-        term ::= unary {( "*" | "/" ) unary}
-        """
-        logging.info("term")
-        left = self.unary()
-        while self.check_token(TokenType.ASTERISK) or self.check_token(TokenType.SLASH):
-            operator = self.current_token.type
-            self.next_token()
-            right = self.unary()
-            left = BinaryOpNode(left, operator, right)
-
-        return left
-
     def unary(self) -> ASTNode:
         """
         unary ::= ["+" | "-"] primary
         """
-        logging.info("unary")
         if self.check_token(TokenType.PLUS) or self.check_token(TokenType.MINUS):
             operator = self.current_token.type
             self.next_token()
@@ -187,11 +283,10 @@ class Parser:
         """
         primary ::= number | ident
         """
-        logging.info("primary")
         if self.check_token(TokenType.NUMBER):
             value = self.current_token.value
             self.next_token()
-            return PrimaryNode(value)
+            return self.leaf(value)
         elif self.check_token(TokenType.IDENT):
             if self.current_token.value not in self.symbols:
                 self.abort(
@@ -199,29 +294,56 @@ class Parser:
                 )
             value = self.current_token.value
             self.next_token()
-            return PrimaryNode(value)
+            return self.leaf(value)
         else:
             self.abort(f"Unexpected token at {self.current_token.value}")
 
+    def leaf(self, value: str) -> PrimaryNode:
+        node = self.leaves.get(value)
+        if node is None:
+            node = self.leaves[value] = PrimaryNode(value)
+        return node
+
     def expression(self) -> ASTNode:
         """
         expression ::= term {( "-" | "+" ) term}
+        term ::= unary {( "*" | "/" ) unary}
         """
-        logging.info("expression")
-        first_term = self.term()
-        while self.check_token(TokenType.PLUS) or self.check_token(TokenType.MINUS):
+        return self.binary(ADDITIVE)
+
+    def binary(self, min_precedence: int) -> ASTNode:
+        """
+        Parse a chain of unary operands joined by binary operators binding at least as tightly as
+        min_precedence. Precedence climbing with explicit operand and operator stacks, every operator
+        is left associative.
+        """
+        operands = [self.unary()]
+        operators = []
+        while True:
             operator = self.current_token.type
+            precedence = BINARY_PRECEDENCE.get(operator, 0)
+            if precedence < min_precedence:
+                break
             self.next_token()
-            next_term = self.term()
-            first_term = BinaryOpNode(first_term, operator, next_term)
 
-        return first_term
+            # Everything on the stack that binds at least as tightly is complete
+            while operators and operators[-1][1] >= precedence:
+                right = operands.pop()
+                operands[-1] = BinaryOpNode(operands[-1], operators.pop()[0], right)
+
+            operators.append((operator, precedence))
+            operands.append(self.unary())
+
+        while operators:
+            right = operands.pop()
+            operands[-1] = BinaryOpNode(operands[-1], operators.pop()[0], right)
+
+        return operands[0]
 
     def comparison(self):
         """
         comparison ::= expression (("==" | "!=" | ">" | ">=" | "<" | "<=") expression)+
         """
-        logging.info("comparison")
         left = self.expression()
 
         if self.is_comparison_operator():
@@ -251,8 +373,6 @@ class Parser:
         )
 
     def nl(self):
-        logging.info("nl")
-
         self.match(TokenType.NEWLINE)
         while self.check_token(TokenType.NEWLINE):
             self.next_token()
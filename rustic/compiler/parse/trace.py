@@ -0,0 +1,94 @@
+import logging
+from time import perf_counter_ns
+from typing import NamedTuple
+
+# Parser methods that report enter and exit events to an attached tracer
+TRACED_PRODUCTIONS = (
+    "program",
+    "statement",
+    "simple_statement",
+    "comparison",
+    "expression",
+    "binary",
+    "unary",
+    "primary",
+    "nl",
+)
+
+
+class ParseEvent(NamedTuple):
+    kind: str
+    production: str
+    start: int
+    end: int
+    elapsed: int
+
+
+class Tracer:
+    """
+    Receives an event whenever the parser enters or leaves a grammar production.
+    Positions are source offsets of the current token, elapsed times are in nanoseconds.
+    """
+
+    def enter(self, production: str, start: int):
+        pass
+
+    def exit(self, production: str, start: int, end: int, elapsed: int):
+        pass
+
+
+class RecordingTracer(Tracer):
+    """
+    Collects every event in a list.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def enter(self, production: str, start: int):
+        self.events.append(ParseEvent("enter", production, start, start, 0))
+
+    def exit(self, production: str, start: int, end: int, elapsed: int):
+        self.events.append(ParseEvent("exit", production, start, end, elapsed))
+
+
+class LoggingTracer(Tracer):
+    """
+    Logs every production the parser enters, like the parser used to do on its own.
+    """
+
+    def __init__(self, level: int = logging.INFO, logger: logging.Logger | None = None):
+        """
+        :param level: Level the productions are logged at
+        :param logger: Logger to write to, by default the "rustic.parser" logger
+        """
+        self.level = level
+        self.logger = logger if logger is not None else logging.getLogger("rustic.parser")
+
+    def enter(self, production: str, start: int):
+        self.logger.log(self.level, production)
+
+
+def attach(parser, tracer: Tracer):
+    """
+    Wrap the traced productions of a single parser instance so they report to the tracer.
+    A parser without a tracer keeps calling the plain methods and pays nothing for tracing.
+    :param parser: Parser to instrument
+    :param tracer: Tracer receiving the events
+    """
+    for production in TRACED_PRODUCTIONS:
+        setattr(parser, production, traced(parser, production, getattr(parser, production), tracer))
+
+
+def traced(parser, production: str, method, tracer: Tracer):
+    def wrapper(*args):
+        start = parser.current_token.start
+        tracer.enter(production, start)
+        began = perf_counter_ns()
+        try:
+            return method(*args)
+        finally:
+            tracer.exit(production, start, parser.current_token.start, perf_counter_ns() - began)
+
+    wrapper.__name__ = production
+    return wrapper
@@ -0,0 +1,34 @@
+import json
+import struct
+
+# Every message is a JSON object preceded by its length in bytes
+LENGTH = struct.Struct(">I")
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode(message: dict) -> bytes:
+    data = json.dumps(message).encode("utf-8")
+    if len(data) > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Message of {len(data)} bytes is too large")
+    return LENGTH.pack(len(data)) + data
+
+
+def decode_length(header: bytes) -> int:
+    (length,) = LENGTH.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Message of {length} bytes is too large")
+    return length
+
+
+def decode(data: bytes) -> dict:
+    try:
+        message = json.loads(data)
+    except ValueError as e:
+        raise ProtocolError(f"Invalid message: {e}") from e
+    if not isinstance(message, dict):
+        raise ProtocolError("Message is not an object")
+    return message
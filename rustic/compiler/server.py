@@ -0,0 +1,172 @@
+import asyncio
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import CompileCache, MemoryCache
+from .diagnostics import MAX_ERRORS
+from .driver import Rustic, format_errors
+from .lex.lexer import LexerError
+from .parse.parser import SyntaxError
+from .protocol import LENGTH, ProtocolError, decode, decode_length, encode
+
+
+class CompileServer:
+    """
+    Long-running compiler that answers requests on a Unix socket, so that compiling a file does not
+    pay for starting an interpreter and importing the compiler. Connections are served concurrently
+    by asyncio and compiles run on a pool of threads that share one compiler and its cache.
+
+    Requests and responses are JSON objects, see protocol.py for the framing. A request compiles
+    either {"source": ...} or a file {"path": ...}, optionally written to {"output": ...} by the
+    server. {"command": "stats"} reports the cache statistics and {"command": "shutdown"} stops
+    the server.
+    """
+
+    def __init__(
+        self, path: str, compiler: Rustic | None = None, workers: int | None = None, max_errors: int = MAX_ERRORS
+    ):
+        """
+        :param path: Unix socket to listen on
+        :param compiler: Compiler to use, by default one with an in-memory cache
+        :param workers: Number of threads to compile with
+        :param max_errors: Most errors reported for a source that fails to compile
+        """
+        self.path = path
+        self.max_errors = max_errors
+        self.compiler = compiler if compiler is not None else Rustic(cache=CompileCache(MemoryCache()))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rustic")
+        self.requests = 0
+        self.stopped = None
+        # Open connections by their handler task
+        self.connections = {}
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    async def serve(self, ready: asyncio.Event | None = None):
+        """
+        Serve until a shutdown request arrives.
+        :param ready: Set once the socket is listening
+        """
+        self.remove_stale_socket()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_unix_server(self.handle, self.path)
+        try:
+            if ready is not None:
+                ready.set()
+            await self.stopped.wait()
+        finally:
+            server.close()
+            # Closing the connections ends their handlers once they have answered what they were doing
+            handlers = list(self.connections)
+            for writer in self.connections.values():
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await server.wait_closed()
+            self.executor.shutdown(wait=False)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def remove_stale_socket(self):
+        """
+        Remove a socket file left behind by a server that is gone, refuse to replace a live one.
+        """
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except ConnectionRefusedError:
+            os.remove(self.path)
+        else:
+            raise OSError(f"A compile server is already listening on {self.path}")
+        finally:
+            probe.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(LENGTH.size)
+                except asyncio.IncompleteReadError:
+                    break
+                data = await reader.readexactly(decode_length(header))
+                try:
+                    request = decode(data)
+                except ProtocolError as e:
+                    # The message was read whole, so the connection can go on after answering
+                    response = {"ok": False, "error": str(e)}
+                else:
+                    response = await self.respond(request)
+
+                writer.write(encode(response))
+                await writer.drain()
+        except (ProtocolError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def respond(self, request: dict) -> dict:
+        command = request.get("command")
+        if command == "shutdown":
+            self.stopped.set()
+            return {"ok": True}
+        if command == "stats":
+            return self.stats()
+        if command == "ping":
+            return {"ok": True}
+        self.requests += 1
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.compile, request)
+
+    def compile(self, request: dict) -> dict:
+        """
+        Answer one compile request, errors in the source and in the request are reported in the
+        response.
+        """
+        start = time.perf_counter()
+        name = request.get("name") or request.get("path") or "<source>"
+        try:
+            if "source" in request:
+                output = self.compiler.compile(request["source"])
+            elif "path" in request:
+                if "output" in request:
+                    self.compiler.compile_file(request["path"], request["output"])
+                    return {"ok": True, "elapsed": time.perf_counter() - start}
+                with self.compiler.read_source(request["path"]) as source:
+                    output = self.compiler.compile(source)
+            else:
+                return {"ok": False, "error": "Request has neither a source nor a path"}
+
+            if "output" in request:
+                with open(request["output"], "wt") as f:
+                    f.write(output)
+        except (SyntaxError, LexerError):
+            # Every error of the source, the way the CLI reports them
+            if "source" in request:
+                errors = self.compiler.check(request["source"], self.max_errors)
+            else:
+                errors = self.compiler.check_file(request["path"], self.max_errors)
+            return {"ok": False, "error": format_errors(name, errors, self.max_errors)}
+        except (OSError, UnicodeDecodeError) as e:
+            return {"ok": False, "error": f"{name}: {e}"}
+        except Exception as e:
+            # A malformed request or a failure of the compiler, the client still gets an answer
+            return {"ok": False, "error": f"{name}: {type(e).__name__}: {e}"}
+
+        response = {"ok": True, "elapsed": time.perf_counter() - start}
+        if "output" not in request:
+            response["output"] = output
+        return response
+
+    def stats(self) -> dict:
+        response = {"ok": True, "requests": self.requests}
+        cache = self.compiler.cache
+        if cache is not None:
+            stats = cache.stats
+            response["cache"] = {name: getattr(stats, name) for name in stats.__slots__}
+        return response
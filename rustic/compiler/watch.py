@@ -0,0 +1,222 @@
+import glob
+import hashlib
+import json
+import os
+import time
+from typing import Callable
+
+from .batch import FileResult, compile_batch, expand_inputs, output_paths
+from .cache import COMPILER_VERSION
+from .driver import MMAP_THRESHOLD, Rustic
+
+INDEX_NAME = ".rustic-index.json"
+# Bump whenever the layout of the index file changes
+INDEX_VERSION = 1
+
+
+class IndexEntry:
+    """
+    What the last compile of a source saw: its modification time, size and content hash, the
+    output written and whether compiling succeeded.
+    """
+
+    __slots__ = ("mtime", "size", "hash", "output", "ok")
+
+    def __init__(self, mtime: int, size: int, hash: str, output: str, ok: bool):
+        self.mtime = mtime
+        self.size = size
+        self.hash = hash
+        self.output = output
+        self.ok = ok
+
+
+class SourceIndex:
+    """
+    Index of compiled sources by absolute path, persisted as JSON so that unchanged sources are not
+    compiled again after a restart. An index written by another compiler version or with other
+    compiler options is ignored.
+    """
+
+    def __init__(self, path: str, options: dict | None = None):
+        """
+        :param options: Compiler options the outputs are built with, see Rustic.options
+        """
+        self.path = path
+        self.options = options if options is not None else {}
+        self.entries = {}
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("index_version") != INDEX_VERSION or data.get("compiler_version") != COMPILER_VERSION:
+            return
+        # Indexes written before options were recorded were built with the defaults
+        if data.get("options", {}) != self.options:
+            return
+        self.entries = {path: IndexEntry(*entry) for path, entry in data["files"].items()}
+
+    def save(self):
+        data = {
+            "index_version": INDEX_VERSION,
+            "compiler_version": COMPILER_VERSION,
+            "options": self.options,
+            "files": {
+                path: [entry.mtime, entry.size, entry.hash, entry.output, entry.ok]
+                for path, entry in self.entries.items()
+            },
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written under another name and renamed, so a crash never leaves a truncated index
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(data, f)
+        os.replace(temporary, self.path)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def watch_root(patterns: list[str]) -> str:
+    """
+    Directory the output layout is taken from: the common parent of the watched directories, the
+    directories of watched files and the fixed part of globs.
+    """
+    directories = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            directories.append(pattern)
+            continue
+        if glob.has_magic(pattern):
+            # Cut the pattern at its first path component that has a wildcard
+            parts = []
+            for part in pattern.split(os.sep):
+                if glob.has_magic(part):
+                    break
+                parts.append(part)
+            pattern = os.sep.join(parts + ["*"])
+        directories.append(os.path.dirname(pattern) or ".")
+    return os.path.commonpath([os.path.abspath(directory) for directory in directories])
+
+
+class Watcher:
+    """
+    Polls a source tree and compiles the sources that changed since they were last compiled. A
+    source counts as changed when its modification time or size differs from the index and its
+    contents hash differently, or when its output is missing.
+    """
+
+    def __init__(
+        self,
+        patterns: list[str],
+        out_dir: str,
+        index_path: str | None = None,
+        workers: int | None = None,
+        mmap_threshold: int = MMAP_THRESHOLD,
+        cache_dir: str | None = None,
+        cache_size: int | None = None,
+        optimize: bool = False,
+    ):
+        """
+        :param patterns: Files, directories and globs to watch
+        :param out_dir: Directory the Rust files are written to
+        :param index_path: Where the index is kept, defaults to a file in out_dir
+        :param workers: Number of processes to compile changed sources with
+        :param optimize: Run the optimization passes. Changing it compiles every source again.
+        """
+        self.patterns = patterns
+        self.out_dir = out_dir
+        self.root = watch_root(patterns)
+        self.workers = workers
+        self.mmap_threshold = mmap_threshold
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.optimize = optimize
+        self.index = SourceIndex(index_path or os.path.join(out_dir, INDEX_NAME), Rustic(optimize=optimize).options())
+        self.index.load()
+
+    def scan(self) -> tuple[list[FileResult], list[str]]:
+        """
+        Compile every source that changed and forget the sources that are gone.
+        :return: Results of the compiled sources and the sources that were removed
+        """
+        entries = self.index.entries
+        sources = [os.path.abspath(source) for source in expand_inputs(self.patterns)]
+        outputs = output_paths(sources, self.out_dir, self.root)
+
+        changed = []
+        hashes = {}
+        dirty = False
+        for source, output in zip(sources, outputs):
+            try:
+                stat = os.stat(source)
+            except FileNotFoundError:
+                continue
+            entry = entries.get(source)
+            if entry is not None and entry.output == output and (entry.mtime, entry.size) == (stat.st_mtime_ns, stat.st_size):
+                if not entry.ok or os.path.exists(output):
+                    continue
+
+            hash = file_hash(source)
+            if entry is not None and entry.hash == hash and entry.output == output and (not entry.ok or os.path.exists(output)):
+                # Touched but not changed
+                entry.mtime, entry.size = stat.st_mtime_ns, stat.st_size
+                dirty = True
+                continue
+
+            changed.append((source, output, stat))
+            hashes[source] = hash
+
+        found = set(sources)
+        removed = [source for source in entries if source not in found]
+        for source in removed:
+            entry = entries.pop(source)
+            if entry.ok and os.path.exists(entry.output):
+                os.remove(entry.output)
+            dirty = True
+
+        results = []
+        if changed:
+            results = list(
+                compile_batch(
+                    [source for source, _, _ in changed],
+                    self.out_dir,
+                    self.workers,
+                    self.mmap_threshold,
+                    cache_dir=self.cache_dir,
+                    cache_size=self.cache_size,
+                    outputs=[output for _, output, _ in changed],
+                    optimize=self.optimize,
+                )
+            )
+            for (source, output, stat), result in zip(changed, results):
+                entries[source] = IndexEntry(stat.st_mtime_ns, stat.st_size, hashes[source], output, result.ok)
+            dirty = True
+
+        if dirty:
+            self.index.save()
+        return results, removed
+
+    def run(
+        self, interval: float = 1.0, report: Callable[[list[FileResult], list[str], float], None] | None = None
+    ):
+        """
+        Scan for changes every interval seconds until interrupted.
+        :param report: Called for every scan that found changes, with its results, the removed sources
+            and the time.perf_counter() the scan started at
+        """
+        while True:
+            start = time.perf_counter()
+            results, removed = self.scan()
+            if report is not None and (results or removed):
+                report(results, removed, start)
+            time.sleep(interval)
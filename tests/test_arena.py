@@ -0,0 +1,67 @@
+from rustic.compiler.ast.arena import Arena, PRIMARY
+from rustic.compiler.emit.emitter import Emitter
+from rustic.compiler.lex.lexer import Lexer
+from rustic.compiler.parse.parser import Parser
+
+CODE = """
+PRINT "How many fibonacci numbers do you want?"
+INPUT nums
+PRINT ""
+
+LET a = 0
+LET b = 1
+WHILE nums > 0 REPEAT
+    PRINT a
+    LET c = a + b
+    LET a = b
+    LET b = c
+    LET nums = nums - 1
+    IF -c >= 10 THEN
+        PRINT "big"
+    ENDIF
+ENDWHILE
+"""
+
+
+def test_round_trip():
+    ast = Parser(Lexer(CODE)).program()
+    arena = Arena.from_program(ast)
+
+    assert str(arena.to_program()) == str(ast)
+    assert [str(statement) for statement in arena.statements] == [str(statement) for statement in ast.statements]
+
+
+def test_emit_arena():
+    ast = Parser(Lexer(CODE)).program()
+    arena = Arena.from_program(ast)
+
+    assert Emitter(arena).emit() == Emitter(ast).emit()
+
+
+def test_shared_rows():
+    ast = Parser(Lexer("let a = 1\nlet b = a + 1\nlet c = a + 1\nprint a + 1\n")).program()
+    arena = Arena.from_program(ast)
+
+    # a, 1 and a + 1 are each stored once
+    assert arena.kinds.count(PRIMARY) == 2
+    assert len(arena) == 3 + 5
+    assert arena.values == ["1", "a", "b", "c"]
+
+
+def test_leaves_are_hash_consed():
+    ast = Parser(Lexer("let a = 1\nlet b = a + 1\n")).program()
+
+    assert ast.statements[0].expression is ast.statements[1].expression.right
+    assert not hasattr(ast.statements[0], "__dict__")
+
+
+def test_deep_nesting():
+    depth = 3000
+    code = "let a = 1\n" + "while a > 0 repeat\n" * depth + "print a\n" + "endwhile\n" * depth
+    ast = Parser(Lexer(code)).program()
+    program = Arena.from_program(ast).to_program()
+
+    node = program.statements[1]
+    for _ in range(depth - 1):
+        node = node.body[0]
+    assert str(node) == "WhileNode(ComparisonNode(PrimaryNode(a), TokenType.GT, PrimaryNode(0)), [PrintNode(PrimaryNode(a))])"
@@ -0,0 +1,62 @@
+import os
+
+from rustic.compiler.batch import compile_batch, expand_inputs, output_paths
+from rustic.compiler.driver import Rustic
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_expand_inputs(tmp_path):
+    write(tmp_path / "a.bs", "print 1\n")
+    write(tmp_path / "sub" / "b.bs", "print 2\n")
+    write(tmp_path / "sub" / "notes.txt", "")
+
+    inputs = expand_inputs([str(tmp_path / "sub"), str(tmp_path / "*.bs"), str(tmp_path / "a.bs")])
+
+    assert inputs == [str(tmp_path / "sub" / "b.bs"), str(tmp_path / "a.bs")]
+
+
+def test_output_paths_keep_layout(tmp_path):
+    outputs = output_paths(["src/a.bs", "src/sub/a.bs"], str(tmp_path))
+
+    assert outputs == [str(tmp_path / "a.rs"), str(tmp_path / "sub" / "a.rs")]
+
+
+def test_compile_batch_reports_failures(tmp_path):
+    write(tmp_path / "src" / "good.bs", "let a = 1\nprint a\n")
+    write(tmp_path / "src" / "syntax.bs", "let = 1\n")
+    write(tmp_path / "src" / "lexing.bs", "print a ! 1\n")
+    write(tmp_path / "src" / "other.bs", 'print "hi"\n')
+    inputs = expand_inputs([str(tmp_path / "src")])
+    out_dir = tmp_path / "out"
+
+    for workers in (1, 2):
+        results = list(compile_batch(inputs, str(out_dir), workers))
+
+        assert [os.path.basename(result.input) for result in results] == ["good.bs", "lexing.bs", "other.bs", "syntax.bs"]
+        assert [result.ok for result in results] == [True, False, True, False]
+        assert "Lexing error" in results[1].error
+        assert results[3].error.endswith(":1:5: Syntax error. Expected IDENT but got EQ")
+        assert sorted(os.listdir(out_dir)) == ["good.rs", "other.rs"]
+        assert (out_dir / "good.rs").read_text().startswith("use std::io::stdin;")
+
+
+def test_compile_batch_survives_unexpected_errors(tmp_path, monkeypatch):
+    write(tmp_path / "src" / "a.bs", "print 1\n")
+    write(tmp_path / "src" / "deep.bs", "print 2\n")
+    compile_file = Rustic.compile_file
+
+    def failing(self, input, output):
+        if input.endswith("deep.bs"):
+            raise RecursionError("maximum recursion depth exceeded")
+        compile_file(self, input, output)
+
+    monkeypatch.setattr(Rustic, "compile_file", failing)
+    results = list(compile_batch(expand_inputs([str(tmp_path / "src")]), str(tmp_path / "out"), 1))
+
+    assert [result.ok for result in results] == [True, False]
+    assert results[1].error.endswith("deep.bs: RecursionError: maximum recursion depth exceeded")
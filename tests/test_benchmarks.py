@@ -0,0 +1,28 @@
+from benchmarks.generate import generate
+from benchmarks.run import compare, run_phases, scaling_exponent
+from rustic.compiler.driver import Rustic
+
+
+def test_generated_programs_compile():
+    for seed in range(20):
+        source = generate(300, seed, depth=seed % 5, expression_length=1 + seed % 6, variables=1 + seed)
+        times, output = run_phases(source)
+        assert output == Rustic().compile(source)
+        assert set(times) == {"lex", "parse", "emit"}
+
+
+def test_generator_is_seeded():
+    assert generate(200, 1) == generate(200, 1)
+    assert generate(200, 1) != generate(200, 2)
+    assert generate(200, 1, mix={"print": 1}).count("PRINT") == 200
+
+
+def test_quadratic_scaling_fails():
+    sizes = [1000, 4000, 16000]
+    linear = {"phases": {"parse": {"exponent": scaling_exponent(sizes, [size * 1e-5 for size in sizes])}}}
+    quadratic = {"phases": {"parse": {"exponent": scaling_exponent(sizes, [size * size * 1e-9 for size in sizes])}}}
+
+    assert round(linear["phases"]["parse"]["exponent"], 6) == 1
+    assert round(quadratic["phases"]["parse"]["exponent"], 6) == 2
+    assert compare(linear, linear) == []
+    assert compare(quadratic, linear) == ["parse scales as size^2.00, the baseline as size^1.00"]
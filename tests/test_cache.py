@@ -0,0 +1,58 @@
+import os
+
+from rustic.compiler.cache import CompileCache, DiskCache, MemoryCache, cache_key
+from rustic.compiler.driver import Rustic
+
+
+def test_cache_key():
+    assert cache_key("print 1\n") == cache_key(b"print 1\n")
+    assert cache_key("print 1\n") != cache_key("print 2\n")
+    assert cache_key("print 1\n", {"optimize": True}) != cache_key("print 1\n", {"optimize": False})
+
+
+def test_memory_cache_evicts_least_recently_used():
+    memory = MemoryCache(max_entries=2)
+    memory.put("a", "1")
+    memory.put("b", "2")
+    assert memory.get("a") == "1"
+    memory.put("c", "3")
+
+    assert memory.get("b") is None
+    assert memory.get("a") == "1"
+    assert memory.evictions == 1
+
+
+def test_disk_cache_evicts_by_size(tmp_path):
+    disk = DiskCache(str(tmp_path), max_size=100)
+    for index in range(5):
+        key = f"{index:064x}"
+        disk.put(key, "x" * 30)
+        # Give every entry a distinct age
+        os.utime(disk.path(key), (index, index))
+
+    assert disk.size <= 100
+    assert disk.get(f"{0:064x}") is None
+    assert disk.get(f"{4:064x}") == "x" * 30
+
+
+def test_compile_cache_tiers(tmp_path):
+    source = "let a = 1\nprint a\n"
+    cache = CompileCache(MemoryCache(), DiskCache(str(tmp_path)))
+    compiler = Rustic(cache=cache)
+
+    output = compiler.compile(source)
+    assert compiler.compile(source) == output
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.memory_hits) == (1, 1, 1)
+
+    # A fresh process only has the disk
+    cold = CompileCache(MemoryCache(), DiskCache(str(tmp_path)))
+    assert Rustic(cache=cold).compile(source) == output
+    assert cold.stats.disk_hits == 1
+
+    cold.invalidate(cache_key(source))
+    assert Rustic(cache=cold).compile(source) == output
+    assert cold.stats.misses == 1
+
+    cold.invalidate()
+    assert len(cold.memory) == 0
+    assert cold.disk.scan() == []
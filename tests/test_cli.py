@@ -0,0 +1,24 @@
+import json
+import os
+import subprocess
+import sys
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rustic")
+
+
+def run(*args, cwd=None) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, CLI, *args], capture_output=True, text=True, cwd=cwd)
+
+
+def test_stats_before_the_input(tmp_path):
+    source = tmp_path / "prog.bs"
+    source.write_text("let a = 1\nprint a\n")
+
+    result = run("--stats", str(source))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.startswith("use std::io::stdin;")
+    assert "tokens 8" in result.stderr
+
+    result = run("--stats", "--stats-format", "json", str(source))
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stderr)["tokens"] == 8
@@ -0,0 +1,54 @@
+from rustic.compiler.ast.nodes import BinaryOpNode, InputNode, PrimaryNode, PrintNode, ProgramNode
+from rustic.compiler.driver import Rustic
+from rustic.compiler.lex.lexer import Lexer, TokenType
+from rustic.compiler.optimize.cse import eliminate_common_subexpressions
+from rustic.compiler.parse.parser import Parser
+
+
+def optimized(source: str) -> str:
+    """
+    Body of the optimized Rust program after the INPUT statements, one statement per line.
+    """
+    output = Rustic(optimize=True).compile(source)
+    return output.removesuffix("}").rsplit(".expect(\"Input is not a integer\");\n", 1)[-1]
+
+
+def test_repeated_arithmetic_is_computed_once():
+    source = "input a\ninput b\nlet x = a * b + 1\nprint b * a + 1\nprint a * b\nprint x\n"
+    assert optimized(source) == (
+        "let mut _cse0 = a * b;\nlet mut _cse1 = _cse0 + 1;\nlet mut x = _cse1;\n"
+        "println!(\"{}\", _cse1);\nprintln!(\"{}\", _cse0);\nprintln!(\"{}\", x);\n"
+    )
+
+
+def test_assignment_invalidates():
+    source = "input a\ninput b\nprint a * b\nlet a = a + 1\nprint a * b\nprint a * b\n"
+    assert optimized(source) == (
+        "println!(\"{}\", a * b);\na = a + 1;\nlet mut _cse0 = a * b;\n"
+        "println!(\"{}\", _cse0);\nprintln!(\"{}\", _cse0);\n"
+    )
+    source = "input a\nprint a * a\ninput a\nprint a * a\n"
+    assert "_cse" not in optimized(source)
+
+
+def test_blocks_end_basic_blocks():
+    source = (
+        "input a\nprint a * 2\nif a * 2 > 1 then\nprint a * 2\nendif\n"
+        "while a * 2 < 10 repeat\nlet a = a + 1\nendwhile\nprint a * 2\n"
+    )
+    assert optimized(source) == (
+        "let mut _cse0 = a * 2;\nprintln!(\"{}\", _cse0);\nif _cse0 > 1 {\nprintln!(\"{}\", a * 2);\n}\n"
+        "while a * 2 < 10 {\na = a + 1;\n}\nprintln!(\"{}\", a * 2);\n"
+    )
+
+
+def test_temporaries_do_not_clash():
+    # Source variables cannot start with an underscore, programs loaded with --from-ast can
+    plus = BinaryOpNode(PrimaryNode("_cse0"), TokenType.PLUS, PrimaryNode("1"))
+    program = ProgramNode([InputNode("_cse0"), PrintNode(plus), PrintNode(plus)])
+    before = str(program)
+    optimized = eliminate_common_subexpressions(program)
+    assert str(program) == before
+    assert optimized.statements[1].variable == "_cse1"
+    unchanged = Parser(Lexer("input a\nprint a + 1\n")).program()
+    assert eliminate_common_subexpressions(unchanged) is unchanged
@@ -0,0 +1,57 @@
+from rustic.compiler.driver import Rustic
+from rustic.compiler.lex.lexer import Lexer
+from rustic.compiler.optimize.dce import eliminate_dead_code
+from rustic.compiler.parse.parser import Parser
+
+
+def optimized(source: str) -> str:
+    """
+    Body of the optimized Rust program, one statement per line.
+    """
+    output = Rustic(optimize=True).compile(source)
+    return output.removeprefix("use std::io::stdin;\n fn main() {\n").removesuffix("}")
+
+
+def test_unreachable_blocks_are_removed():
+    source = "input a\nif 1 > 2 then\nprint a\nendif\nwhile 2 < 1 repeat\nprint a\nendwhile\nprint 1\n"
+    assert optimized(source).endswith(".expect(\"Input is not a integer\");\nprintln!(\"{}\", 1);\n")
+
+
+def test_dead_stores_are_removed():
+    source = "input c\nlet a = c * 2\nlet a = c + 1\nlet b = a\nlet a = 7\nprint a\n"
+    # The constant is propagated, so no assignment of a is left
+    assert optimized(source).endswith(".expect(\"Input is not a integer\");\nprintln!(\"{}\", 7);\n")
+    # Reads in a loop keep the stores before the loop and in the body alive
+    source = "input c\nlet a = c\nlet b = c\nlet b = 1\nwhile a < 10 repeat\nprint b\nlet b = a\nlet a = a + 1\nendwhile\n"
+    assert optimized(source).endswith(
+        "let mut a = c;\nlet mut b = c;\nb = 1;\nwhile a < 10 {\nprintln!(\"{}\", b);\nb = a;\na = a + 1;\n}\n"
+    )
+
+
+def test_side_effects_are_kept():
+    source = "input a\ninput a\nlet b = a / a\nif a > 1 then\nlet c = 2\nendif\nprint \"done\"\n"
+    body = optimized(source)
+    assert body.count("stdin().read_line") == 2
+    assert "let mut b = a / a;\n" in body
+    assert "if" not in body
+    assert body.endswith("println!(\"done\");\n")
+
+
+def test_nodes_are_not_changed():
+    program = Parser(Lexer("input a\nlet b = a\nif a > 1 then\nlet b = 2\nendif\nprint a\n")).program()
+    before = str(program)
+    optimized = eliminate_dead_code(program)
+    assert str(program) == before
+    assert str(optimized) != before
+    unchanged = Parser(Lexer("input a\nprint a\n")).program()
+    assert eliminate_dead_code(unchanged) is unchanged
+
+
+def test_declarations_stay_in_their_scope():
+    # x is never read, but removing its first LET would declare it inside the IF
+    source = "input y\nlet x = 1\nif y > 0 then\ninput x\nendif\ninput x\nprint y\n"
+    body = optimized(source)
+    assert "let mut x = 1;\nif y > 0 {\n" in body
+    assert "let mut x: i32" not in body
+    assert optimized("input y\nlet x = 1\nlet x = 2\nprint y\n").endswith("\nprintln!(\"{}\", y);\n")
+    assert "x" not in optimized("input y\nlet x = 1\nlet x = 2\nprint y\n").replace("expect", "")
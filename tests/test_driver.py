@@ -0,0 +1,81 @@
+import asyncio
+import json
+import pickle
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from rustic.compiler.cache import CompileCache, MemoryCache
+from rustic.compiler.driver import Rustic
+from rustic.compiler.lex.lexer import Lexer, LexerError
+from rustic.compiler.parse.parser import SyntaxError
+
+SOURCES = [f"let a = {index}\nwhile a > 0 repeat\nlet a = a - 1\nprint a\nendwhile\n" for index in range(40)]
+SOURCES += ["let = 1\n", "print a ! 1\n"]
+
+
+def check(results):
+    expected = [Rustic().try_compile(source) for source in SOURCES]
+    assert [result.output for result in results] == [result.output for result in expected]
+    assert isinstance(results[-2].error, SyntaxError)
+    assert isinstance(results[-1].error, LexerError)
+    assert (results[-1].error.line, results[-1].error.column) == (1, 9)
+
+
+def test_compile_many_threads():
+    compiler = Rustic(cache=CompileCache(MemoryCache()))
+    check(compiler.compile_many(SOURCES, workers=8))
+    check(compiler.compile_many(SOURCES + SOURCES, workers=8)[len(SOURCES):])
+    assert compiler.cache.stats.hits >= len(SOURCES)
+
+
+def test_compile_many_processes():
+    check(Rustic().compile_many(SOURCES, workers=2, processes=True))
+    with ProcessPoolExecutor(2) as executor:
+        check(Rustic().compile_many(SOURCES, executor))
+
+
+def test_compile_many_inline():
+    check(Rustic().compile_many(SOURCES, workers=1))
+
+
+def test_compile_many_async():
+    check(asyncio.run(Rustic().compile_many_async(SOURCES, workers=4)))
+    with ThreadPoolExecutor(4) as executor:
+        check(asyncio.run(Rustic().compile_many_async(SOURCES, executor)))
+
+
+def test_errors_pickle():
+    error = pickle.loads(pickle.dumps(LexerError("Unknown token: !", 8, 1, 9)))
+    assert (str(error), error.position, error.line, error.column) == ("Lexing error. Unknown token: ! (line 1, column 9)", 8, 1, 9)
+
+
+def test_check():
+    errors = Rustic().check("print 2 ! 1\nlet = 1\nprint b\n")
+    assert [(type(e), e.line) for e in errors] == [(LexerError, 1), (SyntaxError, 2), (SyntaxError, 3)]
+    assert Rustic().check("let a = 1\nprint a\n") == []
+
+
+def test_compile_with_stats():
+    source = SOURCES[0]
+    result = Rustic().compile_with_stats(source)
+    stats = result.stats
+    assert result.output == Rustic().compile(source)
+    assert list(stats.times) == ["lex", "parse", "emit"]
+    assert stats.tokens == len(Lexer(source).tokenize())
+    assert stats.nodes["WhileNode"] == 1 and stats.nodes["LetNode"] == 2 and stats.nodes["ProgramNode"] == 1
+    assert stats.peak_memory > 0
+    assert (stats.input_size, stats.output_size) == (len(source), len(result.output))
+    assert json.loads(json.dumps(stats.to_dict()))["nodes"] == stats.nodes
+
+    failed = Rustic().compile_with_stats("let a = 1\nprint b\n", memory=False)
+    assert isinstance(failed.error, SyntaxError)
+    assert list(failed.stats.times) == ["lex"] and failed.stats.peak_memory is None
+
+
+def test_compile_with_stats_from_threads():
+    compiler = Rustic()
+    with ThreadPoolExecutor(8) as executor:
+        # Large enough for the compiles to overlap
+        results = list(executor.map(compiler.compile_with_stats, [source * 200 for source in SOURCES[:8]]))
+    assert all(result.ok and result.stats.peak_memory > 0 for result in results)
+    assert not tracemalloc.is_tracing()
@@ -1,4 +1,10 @@
-from rustic.compiler.emit.emitter import Emitter
+import io
+
+import pytest
+
+from rustic.compiler.ast.nodes import ASTNode, PrimaryNode
+from rustic.compiler.emit.emitter import Emitter, EmitError
+from rustic.compiler.emit.writer import CodeWriter
 from rustic.compiler.lex.lexer import Lexer
 from rustic.compiler.parse.parser import Parser
 
@@ -38,3 +44,100 @@ def test_basic_conditional_emit():
     assert (
         output == 'fn main() {\nlet foo = 3 + 2;\nif foo > 0 {\nprintln("yes");\n}\n}'
     )
+
+
+def test_declare_and_assign():
+    lexer = Lexer("input n\nlet a = n\nlet n = a + 1\nlet a = 2\n")
+    parser = Parser(lexer)
+    ast = parser.program()
+
+    output = Emitter(ast, parser.symbols).emit()
+
+    assert output == Emitter(ast).emit()
+    assert output.endswith(
+        'let mut n: i32 = n_input.trim().parse().expect("Input is not a integer");\n'
+        "let mut a = n;\n"
+        "n = a + 1;\n"
+        "a = 2;\n"
+        "}"
+    )
+
+
+def test_emit_to_stream():
+    lexer = Lexer('let foo = 3 + 2\nwhile foo > 0 repeat\nif foo == 1 then\nendif\nprint "yes"\nlet foo = foo - 1\nendwhile\n')
+    ast = Parser(lexer).program()
+
+    stream = io.StringIO()
+    Emitter(ast).emit_to(stream)
+
+    assert stream.getvalue() == Emitter(ast).emit()
+    assert stream.getvalue() == (
+        "use std::io::stdin;\n fn main() {\n"
+        "let mut foo = 3 + 2;\n"
+        "while foo > 0 {\n"
+        "if foo == 1 {\n }\n"
+        'println!("yes");\n'
+        "foo = foo - 1;\n"
+        "}\n"
+        "}"
+    )
+
+
+def test_writer_flushes_to_stream():
+    stream = io.StringIO()
+    writer = CodeWriter(stream, flush_size=4)
+    writer.write("ab")
+    assert stream.getvalue() == ""
+    writer.write("cd")
+    assert stream.getvalue() == "abcd"
+    writer.write("e")
+    writer.flush()
+    assert stream.getvalue() == "abcde"
+    assert writer.size == 5
+
+
+def test_emit_deep_nesting():
+    depth = 2000
+    code = "let a = 1\n" + "while a > 0 repeat\n" * depth + "let a = " + " + ".join(["a"] * 5000) + "\n" + "endwhile\n" * depth
+    output = Emitter(Parser(Lexer(code)).program()).emit()
+
+    assert output.count("while a > 0 {\n") == depth
+    assert output.count(" + ") == 4999
+
+
+def test_emit_unary():
+    code = "let a = -3\nlet b = +a * -a\nif -a < b then\nprint -b\nendif\n"
+    output = Emitter(Parser(Lexer(code)).program()).emit()
+
+    assert output == (
+        "use std::io::stdin;\n fn main() {\n"
+        "let mut a = -3;\n"
+        "let mut b = a * -a;\n"
+        "if -a < b {\n"
+        'println!("{}", -b);\n'
+        "}\n"
+        "}"
+    )
+
+
+def test_emit_dispatch():
+    class NumberNode(PrimaryNode):
+        __slots__ = ()
+
+    class UnknownNode(ASTNode):
+        __slots__ = ()
+
+    emitter = Emitter(Parser(Lexer("")).program())
+    assert emitter.emit_node(NumberNode("42")) == "42"
+
+    with pytest.raises(EmitError):
+        emitter.emit_node(UnknownNode())
+
+
+def test_emit_stream():
+    code = "let a = 1\nwhile a < 10 repeat\nif a > 5 then\nprint a\nendif\nlet a = a + 1\nendwhile\ninput b\n"
+    parser = Parser(Lexer(code))
+    stream = io.StringIO()
+    Emitter(symbols=parser.symbols).emit_stream(parser.statements(), stream)
+
+    assert stream.getvalue() == Emitter(Parser(Lexer(code)).program()).emit()
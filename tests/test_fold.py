@@ -0,0 +1,68 @@
+from rustic.compiler.driver import Rustic
+from rustic.compiler.emit.emitter import Emitter
+from rustic.compiler.lex.lexer import Lexer
+from rustic.compiler.optimize.fold import arithmetic, fold_constants
+from rustic.compiler.lex.lexer import TokenType
+from rustic.compiler.parse.parser import Parser
+
+
+def folded(source: str) -> str:
+    """
+    Body of the Rust program with folded constants, one statement per line.
+    """
+    parser = Parser(Lexer(source))
+    output = Emitter(fold_constants(parser.program()), parser.symbols).emit()
+    return output.removeprefix("use std::io::stdin;\n fn main() {\n").removesuffix("}")
+
+
+def test_fold_expressions():
+    assert folded("let foo = 3 + 2\nprint foo * -4\n") == "let mut foo = 5;\nprintln!(\"{}\", -20);\n"
+    assert folded("let a = 7 / -2\nlet b = 1.5 + 2\n") == "let mut a = -3;\nlet mut b = 1.5 + 2;\n"
+    assert folded("if 3 > 2 then\nprint 1\nendif\n") == "if true {\nprintln!(\"{}\", 1);\n}\n"
+
+
+def test_overflow_is_left_to_run_time():
+    assert arithmetic(TokenType.PLUS, 2147483647, 1) is None
+    assert arithmetic(TokenType.SLASH, 1, 0) is None
+    assert arithmetic(TokenType.SLASH, -7, 2) == -3
+    # rustc would reject the folded constants, so the program is not folded at all
+    source = "let a = 2147483647\nlet b = 1 + 1\nprint a + 1\n"
+    assert folded(source) == "let mut a = 2147483647;\nlet mut b = 1 + 1;\nprintln!(\"{}\", a + 1);\n"
+
+
+def test_propagation_stops_at_input_and_loops():
+    source = (
+        "let a = 1\nlet b = 2\nprint a + b\ninput b\nprint a + b\n"
+        "while a < 10 repeat\nprint b + 1\nlet a = a + 1\nprint a\nendwhile\nprint a\n"
+    )
+    assert folded(source) == (
+        "let mut a = 1;\nlet mut b = 2;\nprintln!(\"{}\", 3);\n"
+        "let mut b_input = String::new();\nstdin().read_line(&mut b_input);\n"
+        "b = b_input.trim().parse().expect(\"Input is not a integer\");\n"
+        "println!(\"{}\", 1 + b);\n"
+        "while a < 10 {\nprintln!(\"{}\", b + 1);\na = a + 1;\nprintln!(\"{}\", a);\n}\n"
+        "println!(\"{}\", a);\n"
+    )
+
+
+def test_constants_known_after_if():
+    source = "input c\nlet a = 1\nlet b = 2\nif c == b then\nlet a = 5\nlet b = 2\nendif\nprint a\nprint b\n"
+    assert folded(source).endswith("if c == 2 {\na = 5;\nb = 2;\n}\nprintln!(\"{}\", a);\nprintln!(\"{}\", 2);\n")
+    # A branch that never runs does not change what is known
+    source = "let a = 1\nif a > 1 then\nlet a = 5\nendif\nprint a\n"
+    assert folded(source).endswith("if false {\na = 5;\n}\nprintln!(\"{}\", 1);\n")
+
+
+def test_nodes_are_not_changed():
+    program = Parser(Lexer("let a = 1 + 1\nlet b = a * a\nprint b\nprint a + a\n")).program()
+    before = str(program)
+    optimized = fold_constants(program)
+    assert str(program) == before
+    assert str(optimized) != before
+    unchanged = Parser(Lexer("input a\nprint a\n")).program()
+    assert fold_constants(unchanged) is unchanged
+
+
+def test_optimize_is_part_of_the_cache_key():
+    assert Rustic().options() != Rustic(optimize=True).options()
+    assert Rustic(optimize=True).config()["optimize"]
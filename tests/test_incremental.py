@@ -0,0 +1,62 @@
+from rustic.compiler.emit.emitter import Emitter
+from rustic.compiler.lex.lexer import Lexer
+from rustic.compiler.parse.incremental import IncrementalParser
+from rustic.compiler.parse.parser import Parser, SyntaxError
+
+
+def emit(program):
+    return Emitter(program).emit()
+
+
+def test_edit_reuses_unchanged_statements():
+    source = "let a = 1\nwhile a < 10 repeat\nlet a = a + 1\nendwhile\nprint a\n"
+    parser = IncrementalParser(source)
+    before = parser.program().statements
+
+    position = source.index("a + 1") + 4
+    assert parser.edit(position, position + 1, "2") == []
+
+    after = parser.program().statements
+    assert after[0] is before[0]
+    assert after[1] is not before[1]
+    assert after[2] is before[2]
+    assert emit(parser.program()) == emit(Parser(Lexer(parser.source)).program())
+
+
+def test_edit_across_blocks():
+    source = "let a = 1\nif a > 0 then\nprint a\nendif\nprint a\nprint 2\n"
+    parser = IncrementalParser(source)
+
+    # Without its ENDIF the IF swallows the statements after it until a new ENDIF closes it
+    position = source.index("endif")
+    parser.edit(position, position + len("endif\n"), "")
+    assert isinstance(parser.errors[0], SyntaxError)
+
+    parser.edit(len(parser.source), len(parser.source), "endif\n")
+    program = parser.program()
+    assert len(program.statements) == 2
+    assert emit(program) == emit(Parser(Lexer(parser.source)).program())
+
+
+def test_removed_definition_is_checked_again():
+    source = "let a = 1\nlet b = 2\nprint b\n"
+    parser = IncrementalParser(source)
+
+    parser.edit(source.index("let b"), source.index("print"), "")
+    errors = parser.errors
+    assert str(errors[0]) == "Referencing variable before assignment: b"
+    assert errors[0].line == 2
+
+    parser.edit(0, 0, "input b\n")
+    assert parser.errors == []
+    assert emit(parser.program()) == emit(Parser(Lexer(parser.source)).program())
+
+
+def test_edit_blank_lines():
+    parser = IncrementalParser("\n\nlet a = 1\n\nprint a\n")
+    parser.edit(0, 2, "")
+    parser.edit(parser.source.index("print"), len(parser.source), "")
+
+    assert parser.source == "let a = 1\n\n"
+    assert len(parser.program().statements) == 1
+    assert sum(region.length for region in parser.regions) == len(parser.source)
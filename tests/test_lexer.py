@@ -1,4 +1,7 @@
-from rustic.compiler.lex.lexer import Lexer, TokenType
+import mmap
+
+from rustic.compiler.diagnostics import Diagnostics
+from rustic.compiler.lex.lexer import Lexer, LexerError, TokenType
 
 
 def test_tokenize_integers():
@@ -124,3 +127,171 @@ def test_string_literals():
     assert tokens[0].value == "hello"
     assert tokens[1].type == TokenType.STRING
     assert tokens[1].value == "world"
+
+
+def test_engines_produce_same_tokens():
+    source = 'LET foo = 3 + 2.5\nIF foo >= 0 THEN\n\tPRINT "yes"\nENDIF\r\nwhile a != b repeat\nendwhile 12abc'
+    regex_tokens = Lexer(source, engine="regex").tokenize()
+    scan_tokens = Lexer(source, engine="scan").tokenize()
+
+    assert [(t.type, t.value) for t in regex_tokens] == [(t.type, t.value) for t in scan_tokens]
+
+
+def test_engines_produce_same_errors():
+    for source in ["a ! b", "a !", 'print "a%b"', 'print "open', "let a_b = 1"]:
+        messages = []
+        for engine in ("regex", "scan"):
+            try:
+                Lexer(source, engine=engine).tokenize()
+                assert False
+            except LexerError as e:
+                messages.append(str(e))
+        assert messages[0] == messages[1]
+
+
+def test_unknown_engine():
+    try:
+        Lexer("", engine="fast")
+        assert False
+    except ValueError as e:
+        assert str(e) == "Unknown lexer engine: fast"
+
+
+def test_token_stream_offsets():
+    source = 'let foo = "bar"\n'
+    tokens = Lexer(source).tokenize()
+
+    assert len(tokens) == 5
+    assert [tokens.type(i) for i in range(len(tokens))] == [
+        TokenType.LET,
+        TokenType.IDENT,
+        TokenType.EQ,
+        TokenType.STRING,
+        TokenType.NEWLINE,
+    ]
+    assert (tokens.starts[3], tokens.ends[3]) == (11, 14)
+    assert tokens.value(3) == "bar"
+    assert [token.value for token in tokens] == ["let", "foo", "=", "bar", "\n"]
+
+
+def test_token_stream_reader():
+    reader = Lexer("a + 1").tokenize().reader()
+
+    assert reader.next_token().type == TokenType.IDENT
+    assert reader.next_token().type == TokenType.PLUS
+    assert reader.next_token().value == "1"
+    eof = reader.next_token()
+    assert eof.type == TokenType.EOF
+    assert (eof.start, eof.end) == (5, 5)
+    assert reader.next_token().type == TokenType.EOF
+
+
+def test_token_value_is_lazy():
+    lexer = Lexer("a <= b")
+    lexer.next_token()
+    token = lexer.next_token()
+
+    assert token.type == TokenType.LTEQ
+    assert token._value is None
+    assert token.value == "<="
+
+
+def test_bytes_source():
+    source = 'LET foo = 3 + 2.5\nIF foo >= 0 THEN\n\tPRINT "yes"\nENDIF\r\n'
+    text_tokens = Lexer(source).tokenize()
+    bytes_tokens = Lexer(source.encode("ascii")).tokenize()
+
+    assert [(t.type, t.value, t.start) for t in bytes_tokens] == [(t.type, t.value, t.start) for t in text_tokens]
+
+
+def test_mmap_source(tmp_path):
+    path = tmp_path / "source.bs"
+    path.write_bytes(b'print "hello"\nlet a = 1')
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+        lexer = Lexer(source)
+        tokens = [lexer.next_token() for _ in range(6)]
+        values = [token.value for token in tokens]
+
+    assert [token.type for token in tokens] == [
+        TokenType.PRINT,
+        TokenType.STRING,
+        TokenType.NEWLINE,
+        TokenType.LET,
+        TokenType.IDENT,
+        TokenType.EQ,
+    ]
+    assert values == ["print", "hello", "\n", "let", "a", "="]
+
+
+def test_non_ascii_bytes_lex_like_text(tmp_path):
+    source = 'let größe = 1\nprint größe\nprint "ü"\n'
+    path = tmp_path / "source.bs"
+    path.write_bytes(source.encode("utf-8"))
+
+    text_tokens = Lexer(source).tokenize()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        mapped_tokens = [(t.type, t.value, t.start) for t in Lexer(mapped).tokenize()]
+
+    assert mapped_tokens == [(t.type, t.value, t.start) for t in text_tokens]
+    assert Lexer(source.encode("utf-8"), position=14).next_token().value == "1"
+
+
+def test_bytes_source_needs_regex_engine():
+    try:
+        Lexer(b"let a = 1", engine="scan")
+        assert False
+    except ValueError as e:
+        assert str(e) == "The scan engine can only lex str input"
+
+
+def test_tokenize_parallel():
+    source = 'LET a = 1\nWHILE a < 10 REPEAT\n  PRINT "a"\n  LET a = a + 1\nENDWHILE\n' * 20
+    expected = Lexer(source).tokenize()
+    tokens = Lexer(source).tokenize_parallel(workers=2, chunk_size=64)
+
+    assert len(tokens) == len(expected)
+    assert list(tokens.types) == list(expected.types)
+    assert list(tokens.starts) == list(expected.starts)
+    assert list(tokens.ends) == list(expected.ends)
+
+
+def test_tokenize_parallel_reports_first_error():
+    source = "let a = 1\n" * 10 + "let b = a ! 1\n" + "let c = 1\n" * 10 + "print _\n"
+    try:
+        Lexer(source).tokenize_parallel(workers=2, chunk_size=16)
+        assert False
+    except LexerError as e:
+        assert str(e) == "Lexing error. Expected !=, got !  (line 11, column 11)"
+        assert (e.line, e.column) == (11, 11)
+
+
+def test_error_location():
+    try:
+        Lexer('let a = 1\nprint "a\tb"\n').tokenize()
+        assert False
+    except LexerError as e:
+        assert e.message == "Illegal character in string."
+        assert (e.position, e.line, e.column) == (18, 2, 9)
+        assert str(e) == "Lexing error. Illegal character in string. (line 2, column 9)"
+
+
+def test_recover_at_next_line():
+    for engine in ("regex", "scan"):
+        diagnostics = Diagnostics()
+        lexer = Lexer('print a ! 1\nprint "b\nlet c = 1 $\n', engine, diagnostics=diagnostics)
+        types = []
+        while not types or types[-1] != TokenType.EOF:
+            types.append(lexer.next_token().type)
+
+        assert [(e.line, e.column, e.message) for e in diagnostics.sorted()] == [
+            (1, 9, "Expected !=, got ! "),
+            (2, 9, "Illegal character in string."),
+            (3, 11, "Unknown token: $"),
+        ]
+        assert types == [
+            TokenType.PRINT, TokenType.IDENT, TokenType.NEWLINE,
+            TokenType.PRINT, TokenType.NEWLINE,
+            TokenType.LET, TokenType.IDENT, TokenType.EQ, TokenType.NUMBER, TokenType.NEWLINE,
+            TokenType.EOF,
+        ]
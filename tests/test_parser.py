@@ -1,6 +1,10 @@
 import logging
-from rustic.compiler.lex.lexer import Lexer
-from rustic.compiler.parse.parser import Parser
+
+from rustic.compiler.ast.nodes import BinaryOpNode, IfNode, PrintNode, WhileNode
+from rustic.compiler.diagnostics import Diagnostics
+from rustic.compiler.lex.lexer import Lexer, TokenType
+from rustic.compiler.parse.parser import Parser, SyntaxError
+from rustic.compiler.parse.trace import RecordingTracer
 
 
 def test_print_statement():
@@ -70,3 +74,161 @@ def test_fibonacci():
         str(ast)
         == "ProgramNode([PrintNode(How many fibonacci numbers do you want?), InputNode(nums), PrintNode(), LetNode(a, PrimaryNode(0)), LetNode(b, PrimaryNode(1)), WhileNode(ComparisonNode(PrimaryNode(nums), TokenType.GT, PrimaryNode(0)), [PrintNode(PrimaryNode(a)), LetNode(c, BinaryOpNode(PrimaryNode(a), TokenType.PLUS, PrimaryNode(b))), LetNode(a, PrimaryNode(b)), LetNode(b, PrimaryNode(c)), LetNode(nums, BinaryOpNode(PrimaryNode(nums), TokenType.MINUS, PrimaryNode(1)))])])"
     )
+
+
+def test_parse_token_stream():
+    code = 'let foo = 3 + 2\nif foo > 0 then\nprint "yes"\nendif\n'
+
+    from_lexer = Parser(Lexer(code)).program()
+    from_stream = Parser(Lexer(code).tokenize().reader()).program()
+
+    assert str(from_stream) == str(from_lexer)
+
+
+def test_error_location():
+    lexer = Lexer("let a = 1\nif a > 0 then\n  print b\nendif\n")
+    parser = Parser(lexer)
+    try:
+        parser.program()
+        assert False
+    except SyntaxError as e:
+        assert str(e) == "Referencing variable before assignment: b"
+        assert (e.line, e.column) == (3, 9)
+
+
+def test_operator_precedence():
+    lexer = Lexer("let a = 1\nlet b = a - 2 * -a / 3 + 4\n")
+    ast = Parser(lexer).program()
+
+    assert (
+        str(ast.statements[1])
+        == "LetNode(b, BinaryOpNode(BinaryOpNode(PrimaryNode(a), TokenType.MINUS, BinaryOpNode(BinaryOpNode(PrimaryNode(2), TokenType.ASTERISK, UnaryOpNode(TokenType.MINUS, PrimaryNode(a))), TokenType.SLASH, PrimaryNode(3))), TokenType.PLUS, PrimaryNode(4)))"
+    )
+
+
+def test_deep_nesting():
+    depth = 3000
+    code = "let a = 1\n" + "while a > 0 repeat\nif a < 2 then\n" * depth + "print a\n" + "endif\nendwhile\n" * depth
+    ast = Parser(Lexer(code)).program()
+
+    node = ast.statements[1]
+    for _ in range(depth):
+        assert isinstance(node, WhileNode)
+        node = node.body[0]
+        assert isinstance(node, IfNode)
+        node = node.then_branch[0]
+    assert isinstance(node, PrintNode)
+
+
+def test_long_expression():
+    terms = 10000
+    code = "let a = 1\nlet b = " + " + ".join(["a * 2"] * terms) + "\n"
+    ast = Parser(Lexer(code)).program()
+
+    node = ast.statements[1].expression
+    for _ in range(terms - 1):
+        assert isinstance(node, BinaryOpNode)
+        assert isinstance(node.right, BinaryOpNode)
+        node = node.left
+    assert str(node) == "BinaryOpNode(PrimaryNode(a), TokenType.ASTERISK, PrimaryNode(2))"
+
+
+def test_tracer_events():
+    tracer = RecordingTracer()
+    parser = Parser(Lexer("let a = 1\nprint a\n"), tracer=tracer)
+    parser.program()
+
+    entered = [event.production for event in tracer.events if event.kind == "enter"]
+    assert entered[:6] == ["program", "statement", "simple_statement", "expression", "binary", "unary"]
+    assert entered.count("statement") == 4
+
+    # Every exit closes the innermost production that was entered
+    open_productions = []
+    for event in tracer.events:
+        if event.kind == "enter":
+            open_productions.append(event)
+        else:
+            entered_event = open_productions.pop()
+            assert entered_event.production == event.production
+            assert event.start == entered_event.start
+            assert event.end >= event.start
+            assert event.elapsed >= 0
+    assert open_productions == []
+
+    print_statement = [e for e in tracer.events if e.production == "simple_statement" and e.kind == "exit"][2]
+    assert (print_statement.start, print_statement.end) == (10, 17)
+
+
+def test_no_tracer_uses_plain_methods():
+    parser = Parser(Lexer("let a = 1\n"))
+    assert "expression" not in vars(parser)
+
+
+def test_symbol_table():
+    lexer = Lexer("input n\nlet a = n\nlet n = a + 1\n")
+    parser = Parser(lexer)
+    parser.program()
+
+    assert len(parser.symbols) == 2
+    n = parser.symbols.lookup("n")
+    a = parser.symbols.lookup("a")
+    assert (n.id, n.kind, n.position) == (0, TokenType.INPUT, 6)
+    assert (a.id, a.kind, a.position) == (1, TokenType.LET, 12)
+    assert parser.symbols[1] is a
+    assert "b" not in parser.symbols
+
+
+def test_statements_are_streamed():
+    lexer = Lexer("let a = 1\nprint a\nlet = 2\n")
+    statements = Parser(lexer).statements()
+
+    first = next(statements)
+    assert first.variable == "a"
+    # Nothing past the first statement has been lexed yet
+    assert lexer.current_position < len("let a = 1\nprint a\n")
+    assert isinstance(next(statements), PrintNode)
+
+    try:
+        next(statements)
+        assert False
+    except SyntaxError as e:
+        assert e.line == 3
+
+
+def test_recover_reports_every_error():
+    diagnostics = Diagnostics()
+    source = "let a = 1\nprint b\nlet = 2\nwhile a > 0 repeat\nif a then\nprint c\nendwhile\nprint a\n"
+    program = Parser(Lexer(source), diagnostics=diagnostics).program()
+
+    assert [(e.line, str(e)) for e in diagnostics.sorted()] == [
+        (2, "Referencing variable before assignment: b"),
+        (3, "Expected IDENT but got EQ"),
+        (5, "Expected comparison operator at then"),
+        (6, "Referencing variable before assignment: c"),
+        (7, "Invalid statement at endwhile"),
+    ]
+    # The IF left open by its bad condition is closed by ENDWHILE and parsing carries on after it
+    assert isinstance(program.statements[-2], WhileNode)
+    assert isinstance(program.statements[-2].body[0], IfNode)
+    assert isinstance(program.statements[-1], PrintNode)
+
+
+def test_recover_closes_blocks_at_end():
+    diagnostics = Diagnostics()
+    program = Parser(Lexer("endif\nwhile 1 > 0 repeat\nprint 1\n"), diagnostics=diagnostics).program()
+    assert [str(e) for e in diagnostics.sorted()] == ["Invalid statement at endif", "Invalid statement at "]
+    assert isinstance(program.statements[0], WhileNode)
+
+
+def test_recover_stops_at_max_errors():
+    diagnostics = Diagnostics(max_errors=3)
+    Parser(Lexer("print x\n" * 100), diagnostics=diagnostics).program()
+    assert len(diagnostics) == 3
+
+
+def test_recover_without_errors():
+    source = "let a = 1\nwhile a < 3 repeat\nif a == 2 then\nprint a\nendif\nlet a = a + 1\nendwhile\n"
+    diagnostics = Diagnostics()
+    recovered = Parser(Lexer(source), diagnostics=diagnostics).program()
+    assert len(diagnostics) == 0
+    assert str(recovered) == str(Parser(Lexer(source)).program())
@@ -0,0 +1,88 @@
+import io
+
+from rustic.compiler.ast import serialize
+from rustic.compiler.ast.arena import BINARY, COMPARISON, UNARY
+from rustic.compiler.emit.emitter import Emitter
+from rustic.compiler.lex.lexer import TYPE_CODES, Lexer, TokenType
+from rustic.compiler.parse.parser import Parser
+
+CODE = """
+PRINT "Enter a number, ünicode is fine in strings"
+INPUT a
+LET b = -a * 2 + a / 3
+WHILE b > 0 REPEAT
+    IF b == 5 THEN
+        PRINT b
+    ENDIF
+    LET b = b - 1
+ENDWHILE
+"""
+
+
+def test_round_trip():
+    ast = Parser(Lexer(CODE)).program()
+    data = serialize.dumps(ast)
+
+    assert data[:4] == serialize.MAGIC
+    assert str(serialize.loads(data)) == str(ast)
+    assert Emitter(serialize.loads_arena(data)).emit() == Emitter(ast).emit()
+
+
+def test_save_and_load_file():
+    ast = Parser(Lexer(CODE)).program()
+    buffer = io.BytesIO()
+    serialize.save(ast, buffer)
+    buffer.seek(0)
+
+    assert str(serialize.load(buffer)) == str(ast)
+
+
+def test_rejects_other_data():
+    for data, message in [
+        (b"RA", "Truncated AST header"),
+        (b"LET a = 1\nPRINT a\n" * 2, "Not a serialized AST"),
+        (serialize.dumps(Parser(Lexer(CODE)).program())[:-10], "Truncated AST values"),
+    ]:
+        try:
+            serialize.loads(data)
+            assert False
+        except serialize.SerializationError as e:
+            assert str(e) == message
+
+
+def test_rejects_corrupt_rows():
+    data = serialize.dumps(Parser(Lexer(CODE)).program())
+    arena = serialize.loads_arena(data)
+    binary = arena.kinds.index(BINARY)
+    comparison = arena.kinds.index(COMPARISON)
+    unary = arena.kinds.index(UNARY)
+    plus = TYPE_CODES[TokenType.PLUS]
+    star = TYPE_CODES[TokenType.ASTERISK]
+    word = TYPE_CODES[TokenType.PRINT]
+    for column, row, value, message in [
+        ("first", 0, 999, "Invalid value 999 in row 0"),
+        ("first", binary, binary, f"Invalid reference to row {binary} in row {binary}"),
+        ("kinds", 0, 42, "Invalid node kind 42 in row 0"),
+        # Token types that are not operators of the node kind
+        ("second", binary, word, f"Invalid operator {word} in row {binary}"),
+        ("second", comparison, plus, f"Invalid operator {plus} in row {comparison}"),
+        ("first", unary, star, f"Invalid operator {star} in row {unary}"),
+        ("third", arena.root, 999, f"Invalid statements of row {arena.root}"),
+    ]:
+        corrupt = serialize.loads_arena(data)
+        getattr(corrupt, column)[row] = value
+        try:
+            serialize.loads(serialize.dumps(corrupt))
+            assert False
+        except serialize.SerializationError as e:
+            assert str(e) == message
+
+    # Whatever a damaged byte changes, loading either succeeds or raises SerializationError
+    for position in range(len(data)):
+        for value in (0, 0x7F, 0xFF):
+            damaged = bytearray(data)
+            damaged[position] = value
+            try:
+                serialize.loads(bytes(damaged))
+            except serialize.SerializationError:
+                pass
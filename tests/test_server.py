@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rustic.compiler.client import CompileClient
+from rustic.compiler.driver import Rustic, format_errors
+from rustic.compiler.server import CompileServer
+
+
+def start_server(path):
+    server = CompileServer(path, workers=2)
+    ready = threading.Event()
+
+    async def serve():
+        started = asyncio.Event()
+        task = asyncio.create_task(server.serve(started))
+        await started.wait()
+        ready.set()
+        await task
+
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    thread.start()
+    ready.wait(5)
+    return server, thread
+
+
+def test_compile_server(tmp_path):
+    path = str(tmp_path / "rustic.sock")
+    server, thread = start_server(path)
+    try:
+        source = "let a = 1\nprint a\n"
+        with CompileClient(path, timeout=5) as client:
+            response = client.compile(source)
+            assert response["ok"]
+            assert response["output"] == Rustic().compile(source)
+
+            response = client.compile("let = 1\n", "bad.bs")
+            assert not response["ok"]
+            assert response["error"] == "bad.bs:1:5: Syntax error. Expected IDENT but got EQ"
+            # Every error is reported the way the CLI reports them
+            bad = "let = 1\nprint 1\nlet b 2\n"
+            response = client.compile(bad, "bad.bs")
+            assert response["error"] == format_errors("bad.bs", Rustic().check(bad))
+            assert response["error"].count("Syntax error") == 2
+            (tmp_path / "bad.bs").write_text(bad)
+            response = client.compile_file(str(tmp_path / "bad.bs"), str(tmp_path / "bad.rs"))
+            assert response["error"] == format_errors(str(tmp_path / "bad.bs"), Rustic().check(bad))
+
+            (tmp_path / "a.bs").write_text(source)
+            response = client.compile_file(str(tmp_path / "a.bs"), str(tmp_path / "a.rs"))
+            assert response["ok"] and "output" not in response
+            assert (tmp_path / "a.rs").read_text() == Rustic().compile(source)
+
+        def compile(index):
+            with CompileClient(path, timeout=5) as client:
+                return client.compile(f"let a = {index}\nprint a\n")["output"]
+
+        with ThreadPoolExecutor(8) as executor:
+            outputs = list(executor.map(compile, range(32)))
+        assert all(f"let mut a = {index};" in output for index, output in enumerate(outputs))
+
+        with CompileClient(path, timeout=5) as client:
+            # Malformed requests are answered and the connection stays usable
+            response = client.request({"source": 42, "name": "bad.bs"})
+            assert not response["ok"] and response["error"].startswith("bad.bs: ")
+            response = client.request([1, 2])
+            assert response == {"ok": False, "error": "Message is not an object"}
+            assert client.request({"command": "ping"}) == {"ok": True}
+
+            stats = client.request({"command": "stats"})
+            assert stats["requests"] == 38
+            # The file and the client with index 1 compile the first source again
+            assert stats["cache"]["hits"] == 2
+            client.request({"command": "shutdown"})
+    finally:
+        thread.join(5)
+
+    assert not thread.is_alive()
+    assert not (tmp_path / "rustic.sock").exists()
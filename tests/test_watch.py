@@ -0,0 +1,70 @@
+import os
+
+from rustic.compiler.watch import Watcher
+
+
+def compiled(results):
+    return sorted(os.path.basename(result.input) for result in results)
+
+
+def test_watch_compiles_changed_files(tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.bs").write_text("let a = 1\nprint a\n")
+    (src / "sub" / "b.bs").write_text("print 2\n")
+    out = tmp_path / "out"
+
+    watcher = Watcher([str(src)], str(out), workers=1)
+    results, removed = watcher.scan()
+    assert compiled(results) == ["a.bs", "b.bs"]
+    assert (out / "sub" / "b.rs").exists()
+
+    assert watcher.scan() == ([], [])
+
+    # A new modification time alone does not compile again
+    os.utime(src / "a.bs", ns=(1, 1))
+    assert watcher.scan() == ([], [])
+
+    (src / "sub" / "b.bs").write_text("print 3\n")
+    results, _ = watcher.scan()
+    assert compiled(results) == ["b.bs"]
+    assert "3" in (out / "sub" / "b.rs").read_text()
+
+    (src / "a.bs").unlink()
+    results, removed = watcher.scan()
+    assert results == [] and [os.path.basename(source) for source in removed] == ["a.bs"]
+    assert not (out / "a.rs").exists()
+
+
+def test_watch_index_survives_restart(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.bs").write_text("print 1\n")
+    (src / "bad.bs").write_text("let = 1\n")
+    out = tmp_path / "out"
+
+    results, _ = Watcher([str(src)], str(out), workers=1).scan()
+    assert [result.ok for result in results] == [True, False]
+
+    # A fresh watcher reads the index and finds nothing to do, failed files are not retried until they change
+    assert Watcher([str(src)], str(out), workers=1).scan() == ([], [])
+
+    (out / "a.rs").unlink()
+    results, _ = Watcher([str(src)], str(out), workers=1).scan()
+    assert compiled(results) == ["a.bs"]
+
+
+def test_watch_index_records_options(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.bs").write_text("print 1 + 1\n")
+    out = tmp_path / "out"
+
+    Watcher([str(src)], str(out), workers=1).scan()
+    assert "1 + 1" in (out / "a.rs").read_text()
+
+    # Outputs built without -O are not current for a watcher that optimizes
+    results, _ = Watcher([str(src)], str(out), workers=1, optimize=True).scan()
+    assert compiled(results) == ["a.bs"]
+    assert "1 + 1" not in (out / "a.rs").read_text()
+    assert Watcher([str(src)], str(out), workers=1, optimize=True).scan() == ([], [])